@@ -1,15 +1,81 @@
+import datetime
+import logging
+
+from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.db import transaction
 from django.http import HttpRequest
 from django.template import loader
 from django.urls import reverse
-from django.utils import http
+from django.utils import http, timezone
 
 from inclusion_connect.accounts import tokens
-from inclusion_connect.users.models import EmailAddress
+from inclusion_connect.logging import log_data, log_event
+from inclusion_connect.users.models import EmailAddress, VerificationEmailLedger
+
+
+logger = logging.getLogger("inclusion_connect.auth")
+
+SENT = "sent"
+# A recent email to the same user is pending or delivered, its link is still valid.
+COLLAPSED = "collapsed"
+RATE_LIMITED = "rate_limited"
+
+
+@transaction.atomic
+def record_verification_email(email_address: EmailAddress, registration: bool):
+    """Record a verification email in the ledger of the address, return SENT when it should be sent."""
+    now = timezone.now()
+    # Concurrent requests for the same address wait for each other.
+    ledger, created = VerificationEmailLedger.objects.select_for_update().get_or_create(
+        email=email_address.email,
+        defaults={
+            "user_id": email_address.user_id,
+            "registration": registration,
+            "last_sent_at": now,
+            "window_start": now,
+            "sent": 1,
+        },
+    )
+    if created:
+        return SENT
+    if (
+        ledger.user_id == email_address.user_id
+        and ledger.registration == registration
+        and now - ledger.last_sent_at < datetime.timedelta(seconds=settings.VERIFICATION_EMAIL_COLLAPSE_SECS)
+    ):
+        ledger.collapsed += 1
+        ledger.save(update_fields=["collapsed"])
+        return COLLAPSED
+    if now - ledger.window_start >= datetime.timedelta(seconds=settings.VERIFICATION_EMAIL_COOLDOWN_SECS):
+        ledger.window_start = now
+        ledger.sent = 0
+    elif ledger.sent >= settings.VERIFICATION_EMAIL_MAX_SENDS:
+        ledger.rate_limited += 1
+        ledger.save(update_fields=["rate_limited"])
+        return RATE_LIMITED
+    ledger.user_id = email_address.user_id
+    ledger.registration = registration
+    ledger.last_sent_at = now
+    ledger.sent += 1
+    ledger.save()
+    return SENT
 
 
 def send_verification_email(request: HttpRequest, email_address: EmailAddress, registration=True):
+    """
+    Send the email address verification link, unless the ledger of the address suppresses it.
+
+    :return: SENT, COLLAPSED or RATE_LIMITED.
+    """
+    status = record_verification_email(email_address, registration)
+    if status != SENT:
+        log = log_data(request)
+        log["event"] = f"send_verification_email_{status}"
+        log["user"] = email_address.user_id
+        log_event(request, logger, log)
+        return status
+
     uidb64 = http.urlsafe_base64_encode(str(email_address.user_id).encode())
     context = {
         "token_url": request.build_absolute_uri(
@@ -28,4 +94,6 @@ def send_verification_email(request: HttpRequest, email_address: EmailAddress, r
     body = loader.render_to_string("registration/email_verification_body.txt", context)
     email_message = EmailMultiAlternatives(subject, body, to=[email_address.email])
     email_message.attach_alternative(html_email, "text/html")
-    transaction.on_commit(email_message.send)
+    # Stored in the outbox, with the changes of the request.
+    email_message.send()
+    return status
@@ -7,7 +7,7 @@ from django.templatetags.static import static
 from django.urls import reverse
 from django.utils.html import format_html
 
-from inclusion_connect.accounts.emails import send_verification_email
+from inclusion_connect.accounts.emails import RATE_LIMITED, send_verification_email
 from inclusion_connect.oidc_federation.enums import Federation
 from inclusion_connect.users.models import EmailAddress, User
 
@@ -77,11 +77,8 @@ class LoginForm(forms.Form):
                         code="invalid_login",
                     ) from e
                 else:
-                    send_verification_email(self.request, email_address)
                     raise ValidationError(
-                        "Un compte inactif avec cette adresse e-mail existe déjà, "
-                        "l’email de vérification vient d’être envoyé à nouveau.",
-                        code="unverified_email",
+                        resend_verification_email(self.request, email_address), code="unverified_email"
                     )
         return self.cleaned_data
 
@@ -89,6 +86,19 @@ class LoginForm(forms.Form):
         return self.user_cache
 
 
+def resend_verification_email(request, email_address):
+    """Send the verification email of an inactive account again, return the error message telling so."""
+    if send_verification_email(request, email_address) == RATE_LIMITED:
+        return (
+            "Un compte inactif avec cette adresse e-mail existe déjà, trop d’e-mails de vérification ont été "
+            "envoyés, réessayez plus tard."
+        )
+    return (
+        "Un compte inactif avec cette adresse e-mail existe déjà, "
+        "l’email de vérification vient d’être envoyé à nouveau."
+    )
+
+
 def save_unverified_email(user, email):
     """Maintain a single unverified email address per user."""
     matched = EmailAddress.objects.filter(user=user, verified_at=None).update(email=email)
@@ -157,11 +167,7 @@ class RegisterForm(auth_forms.UserCreationForm):
                 )
             else:
                 code = "unverified_email"
-                send_verification_email(self.request, email_address)
-                msg = (
-                    "Un compte inactif avec cette adresse e-mail existe déjà, "
-                    "l’email de vérification vient d’être envoyé à nouveau."
-                )
+                msg = resend_verification_email(self.request, email_address)
             raise ValidationError(msg, code=code)
         return email
 
@@ -2,6 +2,8 @@ from django.conf import settings
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 
+from inclusion_connect.utils.lightweight import is_lightweight
+
 
 def required_action_url(user):
     if user.must_accept_terms:
@@ -13,6 +15,9 @@ def required_action_url(user):
 
 def post_login_actions(get_response):
     def middleware(request):
+        if is_lightweight(request):
+            return get_response(request)
+
         user = request.user
 
         whitelisted_urls = [reverse("homepage"), reverse("oauth2_provider:rp-initiated-logout")] + [
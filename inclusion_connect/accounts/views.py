@@ -1,6 +1,5 @@
 import logging
 import uuid
-from functools import partial
 
 from django.conf import settings
 from django.contrib import messages
@@ -8,7 +7,6 @@ from django.contrib.auth import views as auth_views
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
 from django.core.signing import BadSignature, SignatureExpired, TimestampSigner
-from django.db import transaction
 from django.http import Http404, HttpResponseForbidden, HttpResponseNotFound, HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
@@ -18,8 +16,9 @@ from django.views.generic import CreateView, FormView, TemplateView, UpdateView,
 
 from inclusion_connect.accounts import emails, forms
 from inclusion_connect.accounts.helpers import login
-from inclusion_connect.logging import log_data
+from inclusion_connect.logging import log_data, log_event
 from inclusion_connect.oidc_overrides.models import Application
+from inclusion_connect.oidc_overrides.registry import applications
 from inclusion_connect.oidc_overrides.views import OIDCSessionMixin
 from inclusion_connect.stats import helpers as stats_helpers
 from inclusion_connect.stats.models import Actions
@@ -47,7 +46,7 @@ class LoginView(OIDCSessionMixin, auth_views.LoginView):
         log = form.log
         log["event"] = f"{self.EVENT_NAME}_error"
         log["errors"] = form.errors.get_json_data()
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
         return super().form_invalid(form)
 
     def form_valid(self, form):
@@ -57,7 +56,7 @@ class LoginView(OIDCSessionMixin, auth_views.LoginView):
         if "application" not in log:
             if application := stats_helpers.get_application(self.request, self.get_success_url()):
                 log["application"] = application.client_id
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
         stats_helpers.account_action(form.get_user(), Actions.LOGIN, self.request, self.get_success_url())
         return response
 
@@ -79,7 +78,7 @@ class BaseUserCreationView(OIDCSessionMixin, CreateView):
         log = form.log
         log["event"] = f"{self.EVENT_NAME}_error"
         log["errors"] = form.errors.get_json_data()
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
         return response
 
     def form_valid(self, form):
@@ -91,7 +90,7 @@ class BaseUserCreationView(OIDCSessionMixin, CreateView):
         if next_url := self.request.session.get("next_url"):
             self.object.save_next_redirect_uri(next_url)
         form.log["event"] = self.EVENT_NAME
-        transaction.on_commit(partial(logger.info, form.log))
+        log_event(self.request, logger, form.log)
         stats_helpers.account_action(form.instance, Actions.REGISTER, self.request)
         return response
 
@@ -117,7 +116,7 @@ class ActivateAccountView(BaseUserCreationView):
         try:
             self.get_user_info()
             params = oidc_params(self.request)
-            self.application = Application.objects.get(client_id=params["client_id"])
+            self.application = applications.get(params["client_id"])
         except (KeyError, Application.DoesNotExist):
             return render(
                 request,
@@ -181,7 +180,7 @@ class PasswordResetView(auth_views.PasswordResetView):
             log["user"] = EmailAddress.objects.get(email=email).user_id
         except EmailAddress.DoesNotExist:
             log["email"] = email
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
 
     def form_invalid(self, form):
         response = super().form_invalid(form)
@@ -212,7 +211,7 @@ class PasswordResetConfirmView(auth_views.PasswordResetConfirmView):
         log["user"] = self.request.user.pk
         if form.errors:
             log["errors"] = form.errors.get_json_data()
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
 
     def form_invalid(self, form):
         response = super().form_invalid(form)
@@ -237,7 +236,7 @@ class AcceptTermsView(LoginRequiredMixin, TemplateView):
         log = log_data(self.request)
         log["event"] = self.EVENT_NAME
         log["user"] = request.user.pk
-        transaction.on_commit(partial(logger.info, log))
+        log_event(request, logger, log)
         return HttpResponseRedirect(get_next_url(request))
 
 
@@ -253,12 +252,14 @@ class ConfirmEmailView(TemplateView):
         return super().dispatch(request, *args, **kwargs)
 
     def post(self, request):
-        messages.success(request, "E-mail de vérification envoyé.")
-        emails.send_verification_email(request, self.email_address)
+        if emails.send_verification_email(request, self.email_address) == emails.RATE_LIMITED:
+            messages.error(request, "Trop d’e-mails de vérification ont été envoyés, réessayez plus tard.")
+        else:
+            messages.success(request, "E-mail de vérification envoyé.")
         log = log_data(self.request)
         log["event"] = self.EVENT_NAME
         log["user"] = self.email_address.user_id
-        transaction.on_commit(partial(logger.info, log))
+        log_event(request, logger, log)
         return HttpResponseRedirect(self.request.get_full_path())
 
 
@@ -270,14 +271,14 @@ def handle_email_confirmation(request, user_id, email):
     except EmailAddress.DoesNotExist:
         log["event"] = f"{ConfirmEmailTokenView.EVENT_NAME}_error"
         log["error"] = "email not found"
-        transaction.on_commit(partial(logger.info, log))
+        log_event(request, logger, log)
         return HttpResponseNotFound()
     log["user"] = email_address.user_id
     if email_address.verified_at:
         # Monitored by support team. https://itou-inclusion.slack.com/archives/C052401846P/p1686578574136939
         log["event"] = f"{ConfirmEmailTokenView.EVENT_NAME}_error"
         log["error"] = "already verified"
-        transaction.on_commit(partial(logger.info, log))
+        log_event(request, logger, log)
         messages.info(request, "Cette adresse e-mail est déjà vérifiée.")
         if request.user.is_authenticated:
             url = reverse("accounts:edit_user_info")
@@ -298,11 +299,11 @@ def handle_email_confirmation(request, user_id, email):
     application = stats_helpers.get_application(request, next_url)
     if application and "application" not in log:
         log["application"] = application.client_id
-    transaction.on_commit(partial(logger.info, log))
+    log_event(request, logger, log)
 
     log = log.copy()
     log["event"] = LoginView.EVENT_NAME  # Also log a login here
-    transaction.on_commit(partial(logger.info, log))
+    log_event(request, logger, log)
     stats_helpers.account_action(email_address.user, Actions.LOGIN, request, next_url)
     return HttpResponseRedirect(next_url)
 
@@ -317,7 +318,7 @@ def handle_signature_expired(request, email):
     except EmailAddress.DoesNotExist:
         pass
     # Monitored by support team. https://itou-inclusion.slack.com/archives/C052401846P/p1686578574136939
-    transaction.on_commit(partial(logger.info, log))
+    log_event(request, logger, log)
     request.session[EMAIL_CONFIRM_KEY] = email
     messages.error(request, "Le lien de vérification d’adresse e-mail a expiré.")
     return HttpResponseRedirect(reverse("accounts:confirm-email"))
@@ -369,7 +370,7 @@ class ChangeTemporaryPassword(LoginRequiredMixin, FormView):
         log["user"] = self.request.user.pk
         if form.errors:
             log["errors"] = form.errors.get_json_data()
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
 
     def form_invalid(self, form):
         response = super().form_invalid(form)
@@ -388,8 +389,11 @@ class MyAccountMixin(LoginRequiredMixin):
     application = None
 
     def setup(self, request, *args, **kwargs):
-        referrer = request.GET.get("referrer")
-        self.application = Application.objects.filter(client_id=referrer).first()
+        if referrer := request.GET.get("referrer"):
+            try:
+                self.application = applications.get(referrer)
+            except Application.DoesNotExist:
+                pass
         return super().setup(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
@@ -433,7 +437,7 @@ class EditUserInfoView(MyAccountMixin, UpdateView):
         if self.application:
             log["application"] = self.application.client_id
         log["errors"] = form.errors.get_json_data()
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
         return response
 
     def get_context_data(self, **kwargs):
@@ -453,7 +457,7 @@ class EditUserInfoView(MyAccountMixin, UpdateView):
         for key in form.changed_data:
             log[f"old_{key}"] = form.initial[key]
             log[f"new_{key}"] = form.cleaned_data[key]
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
         if user.email != email and not form.email_case_changed(user):
             # Do not hit the database again, we have all necessary information.
             email_address = EmailAddress(user=user, email=email)
@@ -497,7 +501,7 @@ class PasswordChangeView(MyAccountMixin, FormView):
             log["application"] = self.application.client_id
         if form.errors:
             log["errors"] = form.errors.get_json_data()
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
 
     def form_invalid(self, form):
         response = super().form_invalid(form)
@@ -1,11 +1,20 @@
-import logging.handlers
+import functools
+import logging
+import os
+import queue
 import threading
+import time
 
+from django.db import transaction
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk
 from pythonjsonlogger import jsonlogger
 
 from inclusion_connect.utils.oidc import oidc_params
+from inclusion_connect.utils.request_cache import request_cached
+
+
+logger = logging.getLogger("inclusion_connect.logging")
 
 
 def log_data(request, next_url=None):
@@ -18,6 +27,106 @@ def log_data(request, next_url=None):
     return log_data
 
 
+def handle_batch(records):
+    """
+    Hand records to the handlers of their loggers, like Logger.handle, in a single call per handler.
+
+    Handlers with a handle_batch method format and write the records in one pass.
+    """
+    batches = {}
+    for record in records:
+        logger = logging.getLogger(record.name)
+        if logger.disabled or not logger.filter(record):
+            continue
+        found = False
+        current = logger
+        while current:
+            for handler in current.handlers:
+                found = True
+                if record.levelno >= handler.level:
+                    batches.setdefault(handler, []).append(record)
+            if not current.propagate:
+                break
+            current = current.parent
+        if not found and logging.lastResort and record.levelno >= logging.lastResort.level:
+            batches.setdefault(logging.lastResort, []).append(record)
+    for handler, handler_records in batches.items():
+        if hasattr(handler, "handle_batch"):
+            handler.handle_batch(handler_records)
+        else:
+            for record in handler_records:
+                handler.handle(record)
+
+
+class AuditEvents:
+    """
+    Audit events of a request, logged together once committed.
+
+    Each event registers its own on_commit callback: the events of a rolled back savepoint are dropped with their
+    callbacks. The callback of the last event hands the committed events to the handlers in a single batch. When the
+    last event was rolled back, the committed events are handed over by :meth:`flush`, at the end of the request.
+    """
+
+    def __init__(self):
+        self.committed = []
+        self.last = None
+
+    def add(self, logger, log):
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        # The caller of log_event, as for logger.info().
+        pathname, lineno, func, sinfo = logger.findCaller(stacklevel=3)
+        record = logger.makeRecord(logger.name, logging.INFO, pathname, lineno, log, None, None, func, None, sinfo)
+        self.last = record
+        transaction.on_commit(functools.partial(self._commit, record))
+
+    def _commit(self, record):
+        self.committed.append(record)
+        if record is self.last:
+            self.flush()
+
+    def flush(self):
+        records, self.committed = self.committed, []
+        if records:
+            handle_batch(records)
+
+
+@request_cached
+def audit_events(request):
+    return AuditEvents()
+
+
+def log_event(request, logger, log):
+    audit_events(request).add(logger, log)
+
+
+def flush_audit_events(request):
+    """Log the committed audit events of the request still waiting for a rolled back event."""
+    audit_events(request).flush()
+
+
+class StreamHandler(logging.StreamHandler):
+    """StreamHandler writing a batch of records with a single write."""
+
+    def handle_batch(self, records):
+        lines = []
+        for record in records:
+            if not self.filter(record):
+                continue
+            try:
+                lines.append(f"{self.format(record)}{self.terminator}")
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        with self.lock:
+            try:
+                self.stream.write("".join(lines))
+                self.flush()
+            except Exception:
+                self.handleError(records[0])
+
+
 class JsonFormatter(jsonlogger.JsonFormatter):
     def parse(self):
         # Remove the empty key "message".
@@ -29,53 +138,350 @@ class JsonFormatter(jsonlogger.JsonFormatter):
             log_record[record_attr] = getattr(record, record_attr)
 
 
-class ElasticSearchHandler(logging.handlers.BufferingHandler):
-    timer = None
+class Spool:
+    """
+    Append-only files of the log records ElasticSearch could not receive, replayed oldest first.
+
+    Each process appends to its own segment, named after its creation time so that names sort segments by age.
+    A segment is claimed for replay by renaming it. Segments of other processes are claimed once idle, e.g. when
+    their process died. When the spool grows over max_bytes, the oldest segments not being replayed are evicted.
+    """
+
+    SUFFIX = ".spool"
+    CLAIMED_SUFFIX = ".replaying"
+    IDLE_SECS = 60
+
+    def __init__(self, directory, *, max_bytes, segment_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._segment = None
+        self._segment_size = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _segments(self):
+        with os.scandir(self.directory) as entries:
+            return sorted(
+                (entry for entry in entries if entry.name.endswith((self.SUFFIX, self.CLAIMED_SUFFIX))),
+                key=lambda entry: entry.name,
+            )
+
+    def _is_own(self, entry):
+        return entry.name.endswith(f"-{os.getpid()}{self.SUFFIX}")
+
+    def append(self, records):
+        """Append records to the spool, call evict() afterwards to make room."""
+        if self._segment is None or self._segment_size >= self.segment_bytes:
+            self._segment = os.path.join(self.directory, f"{time.time_ns():020d}-{os.getpid()}{self.SUFFIX}")
+        with open(self._segment, "a", encoding="utf-8") as f:
+            f.writelines(f"{record}\n" for record in records)
+            self._segment_size = f.tell()
+
+    @staticmethod
+    def _size(entry):
+        try:
+            return entry.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def evict(self):
+        """Delete the oldest segments while the spool is over max_bytes, return the number of records evicted."""
+        segments = self._segments()
+        size = sum(self._size(entry) for entry in segments)
+        evicted = 0
+        for entry in segments:
+            if size <= self.max_bytes:
+                break
+            if entry.name.endswith(self.CLAIMED_SUFFIX):
+                # Being replayed by another process.
+                continue
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    records = sum(1 for _line in f)
+                os.remove(entry.path)
+            except FileNotFoundError:
+                # Claimed by another process.
+                continue
+            if entry.path == self._segment:
+                self._segment = None
+            size -= self._size(entry)
+            evicted += records
+        return evicted
+
+    def claim(self):
+        """Return the path of the oldest segment to replay, renamed to prevent other processes replaying it."""
+        idle_mtime = time.time() - self.IDLE_SECS
+        for entry in self._segments():
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                # Claimed or evicted by another process.
+                continue
+            if mtime > idle_mtime and not self._is_own(entry):
+                continue
+            if entry.name.endswith(self.CLAIMED_SUFFIX):
+                # The replaying process died.
+                self.release(entry.path)
+                continue
+            claimed_path = f"{entry.path}{self.CLAIMED_SUFFIX}"
+            try:
+                os.rename(entry.path, claimed_path)
+            except FileNotFoundError:
+                continue
+            os.utime(claimed_path)
+            if entry.path == self._segment:
+                self._segment = None
+            return claimed_path
+        return None
+
+    def release(self, claimed_path):
+        """Put back a claimed segment, to be replayed later."""
+        try:
+            os.rename(claimed_path, claimed_path.removesuffix(self.CLAIMED_SUFFIX))
+        except FileNotFoundError:
+            pass
+
+
+class ElasticSearchHandler(logging.Handler):
+    """
+    Ship log records to ElasticSearch from a single background thread per process.
+
+    Records are formatted by the logging thread, then queued. When the queue is full, records are dropped rather
+    than blocking the request. The shipper sends them in batches of batch_size records, or whatever was queued
+    linger_secs after the first record of the batch.
+
+    With a spool_dir, batches ElasticSearch could not receive are written to a Spool instead of being dropped. For
+    replay_interval_secs after a failure, new batches are spooled without trying ElasticSearch. The spool is
+    replayed every replay_interval_secs.
+
+    The counters of the shipper, see :meth:`stats`, are logged every stats_interval_secs.
+    """
+
+    POLL_SECS = 0.5
+    COUNTERS = ["queued", "sent", "dropped", "retried", "spooled", "replayed", "errors"]
 
     def __init__(  # noqa: PLR0913 Too many arguments to function call.
         self,
         *,
-        capacity,
-        send_after_inactive_for_secs=2.0,
         host,
         index_name,
+        batch_size=500,
+        linger_secs=2.0,
+        queue_size=10_000,
+        max_retries=3,
+        retry_delay_secs=1.0,
+        drain_timeout_secs=10.0,
         es_timeout_secs=5,
+        spool_dir=None,
+        spool_max_bytes=100 * 1024 * 1024,
+        spool_segment_bytes=1024 * 1024,
+        replay_interval_secs=30.0,
+        stats_interval_secs=300.0,
     ):
         """
-        Inspired from https://github.com/cmanaha/python-elasticsearch-logger/blob/master/cmreslogging/handlers.py.
-
-        :param int capacity: Max number of log records before sending to ElasticSearch.
-        :param float send_after_inactive_for_secs: Send to ElasticSearch if no records
-            are emitted in send_after_inactive_for_secs seconds.
+        :param int batch_size: Max number of log records sent in a single bulk request.
+        :param float linger_secs: Max delay between queuing a record and sending it, when the batch is not full.
+        :param int queue_size: Max number of log records waiting to be sent, further records are dropped.
+        :param float drain_timeout_secs: Max delay to send the queued records when the handler is closed.
+        :param str spool_dir: Directory of the records ElasticSearch could not receive, shared by the processes.
+        :param int spool_max_bytes: Max size of the spool, the oldest records are evicted first.
+        :param float stats_interval_secs: Delay between two logs of the counters.
         """
-        super().__init__(capacity)
-        self.send_after_inactive_for_secs = send_after_inactive_for_secs
+        super().__init__()
+        self.host = host
+        self.index_name = index_name
+        self.batch_size = batch_size
+        self.linger_secs = linger_secs
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.retry_delay_secs = retry_delay_secs
+        self.drain_timeout_secs = drain_timeout_secs
+        self.es_timeout_secs = es_timeout_secs
+        self.spool_dir = spool_dir
+        self.spool_max_bytes = spool_max_bytes
+        self.spool_segment_bytes = spool_segment_bytes
+        self.replay_interval_secs = replay_interval_secs
+        self.stats_interval_secs = stats_interval_secs
+        self._pid = None
+        self._shipper = None
+
+    def _start_shipper(self):
+        # Threads, and the locks they hold, do not survive a fork: each process gets its own shipper.
+        self._pid = os.getpid()
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self._counters_lock = threading.Lock()
+        self._closing = threading.Event()
+        self.spool = None
+        if self.spool_dir:
+            self.spool = Spool(
+                self.spool_dir,
+                max_bytes=self.spool_max_bytes,
+                segment_bytes=self.spool_segment_bytes,
+            )
+        # Monotonic times.
+        self._unavailable_until = 0
+        self._replay_at = 0
+        self._stats_at = time.monotonic() + self.stats_interval_secs
+        # Retries are handled by the shipper, to count them.
         self.es_client = Elasticsearch(
-            host,
+            self.host,
             http_compress=True,
-            request_timeout=es_timeout_secs,
-            max_retries=10,
-            retry_on_timeout=True,
-            retry_on_status=[429, 500, 502, 503, 504],
+            request_timeout=self.es_timeout_secs,
+            max_retries=0,
         )
-        self.index_name = index_name
+        self._shipper = threading.Thread(target=self._ship, name="elasticsearch-shipper", daemon=True)
+        self._shipper.start()
+
+    def _count(self, counter, value=1):
+        with self._counters_lock:
+            self.counters[counter] += value
+
+    def stats(self):
+        if self._pid != os.getpid():
+            return dict.fromkeys(self.COUNTERS, 0)
+        with self._counters_lock:
+            return {**self.counters, "pending": self.queue.qsize()}
 
     def emit(self, record):
-        if self.timer and self.timer.is_alive():
-            self.timer.cancel()
-        formatted_record = self.format(record)
-        super().emit(formatted_record)
-        self.timer = threading.Timer(self.send_after_inactive_for_secs, self.flush)
-        self.timer.start()
+        try:
+            formatted_record = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        # Called with the handler lock held.
+        self._enqueue([formatted_record])
 
-    def send_to_elastic(self, log_buffer):
+    def handle_batch(self, records):
+        formatted_records = []
+        for record in records:
+            if not self.filter(record):
+                continue
+            try:
+                formatted_records.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        with self.lock:
+            self._enqueue(formatted_records)
+
+    def _enqueue(self, formatted_records):
+        if self._pid != os.getpid():
+            self._start_shipper()
+        queued = 0
+        for formatted_record in formatted_records:
+            try:
+                self.queue.put_nowait(formatted_record)
+            except queue.Full:
+                break
+            queued += 1
+        self._count("queued", queued)
+        if queued < len(formatted_records):
+            self._count("dropped", len(formatted_records) - queued)
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.POLL_SECS)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.linger_secs
+        while len(batch) < self.batch_size:
+            try:
+                if self._closing.is_set():
+                    batch.append(self.queue.get_nowait())
+                else:
+                    # Wake up regularly to stop lingering once closing.
+                    timeout = min(max(deadline - time.monotonic(), 0), self.POLL_SECS)
+                    batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                if self._closing.is_set() or time.monotonic() >= deadline:
+                    break
+        return batch
+
+    def _ship(self):
+        while True:
+            # The shipper is the only one of the process, an unexpected error must not stop it.
+            try:
+                if batch := self._next_batch():
+                    self.send_to_elastic(batch)
+                elif self._closing.is_set():
+                    return
+                if self.spool is not None and not self._closing.is_set() and time.monotonic() >= self._replay_at:
+                    self._replay_at = time.monotonic() + self.replay_interval_secs
+                    self._replay()
+                if not self._closing.is_set() and time.monotonic() >= self._stats_at:
+                    self._stats_at = time.monotonic() + self.stats_interval_secs
+                    # Shipped with the next batch.
+                    logger.info({"event": "elasticsearch_handler_stats", **self.stats()})
+            except Exception:
+                self._count("errors")
+                logger.exception("ElasticSearch shipper error")
+
+    def _bulk(self, log_buffer):
         actions = ({"_source": log} for log in log_buffer)
-        bulk(client=self.es_client, actions=actions, index=self.index_name, stats_only=True)
+        return bulk(
+            client=self.es_client,
+            actions=actions,
+            index=self.index_name,
+            stats_only=True,
+            raise_on_error=False,
+        )
 
-    def flush(self):
-        with self.lock:
-            log_buffer = self.buffer
-            self.buffer = []
-        if log_buffer:
-            t = threading.Thread(target=self.send_to_elastic, args=(log_buffer,), daemon=False)
-            t.start()
+    def send_to_elastic(self, log_buffer):
+        if self.spool is not None and time.monotonic() < self._unavailable_until:
+            self._spool(log_buffer)
+            return
+        for attempt in range(self.max_retries + 1):
+            try:
+                sent, failed = self._bulk(log_buffer)
+            except Exception:
+                if attempt == self.max_retries:
+                    if self.spool is not None:
+                        self._spool(log_buffer)
+                        self._unavailable_until = self._replay_at = time.monotonic() + self.replay_interval_secs
+                    else:
+                        self._count("dropped", len(log_buffer))
+                    return
+                self._count("retried", len(log_buffer))
+                time.sleep(self.retry_delay_secs * 2**attempt)
+            else:
+                self._count("sent", sent)
+                # Rejected documents would be rejected again.
+                self._count("dropped", failed)
+                return
+
+    def _spool(self, log_buffer):
+        try:
+            self.spool.append(log_buffer)
+        except OSError:
+            self._count("dropped", len(log_buffer))
+            return
+        self._count("spooled", len(log_buffer))
+        self._count("dropped", self.spool.evict())
+
+    def _replay(self):
+        while claimed_path := self.spool.claim():
+            try:
+                with open(claimed_path, encoding="utf-8") as f:
+                    log_buffer = f.read().splitlines()
+            except FileNotFoundError:
+                continue
+            try:
+                sent, failed = self._bulk(log_buffer)
+            except Exception:
+                self.spool.release(claimed_path)
+                self._unavailable_until = self._replay_at
+                return
+            try:
+                os.remove(claimed_path)
+            except FileNotFoundError:
+                # Evicted by another process while replaying.
+                pass
+            self._count("replayed", sent)
+            self._count("dropped", failed)
+
+    def close(self):
+        """Send the queued records, called on logging shutdown (at process exit)."""
+        if self._pid == os.getpid():
+            self._closing.set()
+            self._shipper.join(self.drain_timeout_secs)
+        super().close()
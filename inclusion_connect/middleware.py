@@ -1,21 +1,42 @@
 import logging
 
 from django.core.exceptions import PermissionDenied
+from django.middleware import csrf
 from django.urls import reverse
 from django.utils.cache import add_never_cache_headers
 from django.utils.html import format_html
 
-from inclusion_connect.logging import log_data
+from inclusion_connect.logging import flush_audit_events, log_data
+from inclusion_connect.utils.lightweight import is_lightweight
+from inclusion_connect.utils.request_cache import clear_request_cache
 from inclusion_connect.utils.urls import add_url_params
 
 
 logger = logging.getLogger("keycloak_compat")
 
 
+def request_cache(get_response):
+    def middleware(request):
+        try:
+            return get_response(request)
+        finally:
+            flush_audit_events(request)
+            clear_request_cache(request)
+
+    return middleware
+
+
+class CsrfViewMiddleware(csrf.CsrfViewMiddleware):
+    def process_request(self, request):
+        # The secret is stored in the session (CSRF_USE_SESSIONS), lightweight views are exempt.
+        if not is_lightweight(request):
+            super().process_request(request)
+
+
 def never_cache(get_response):
     def middleware(request):
         response = get_response(request)
-        if request.user.is_authenticated:
+        if not is_lightweight(request) and request.user.is_authenticated:
             add_never_cache_headers(response)
         return response
 
@@ -24,6 +45,9 @@ def never_cache(get_response):
 
 def limit_staff_users_to_admin(get_response):
     def middleware(request):
+        if is_lightweight(request):
+            return get_response(request)
+
         user = request.user
 
         if user.is_staff and not request.path.startswith("/admin/"):
@@ -43,7 +67,8 @@ def log_keycloak_compat(get_response):
     def middleware(request):
         response = get_response(request)
         if request.path.startswith("/realms"):
-            log = log_data(request)
+            # The OIDC parameters are read from the session.
+            log = {"ip_address": request.META["REMOTE_ADDR"]} if is_lightweight(request) else log_data(request)
             if "application" not in log and request.GET.get("client_id"):
                 log["application"] = request.GET.get("client_id")
             log["url"] = request.path
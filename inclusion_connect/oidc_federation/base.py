@@ -1,17 +1,26 @@
+import datetime
 import logging
-from functools import partial
+import threading
+from typing import NamedTuple
 
+import jwt
+import requests
+from django.conf import settings
 from django.contrib import messages
 from django.core.exceptions import SuspiciousOperation
-from django.db import transaction
 from django.forms.models import model_to_dict
 from django.http import HttpResponseRedirect
 from django.urls import reverse
+from django.utils import timezone
 from mozilla_django_oidc import auth, views
+from mozilla_django_oidc.utils import import_from_settings
+from requests.auth import HTTPBasicAuth
 
 from inclusion_connect.accounts.views import EditUserInfoView, LoginView, RegisterView
-from inclusion_connect.logging import log_data
+from inclusion_connect.logging import log_data, log_event
+from inclusion_connect.oidc_federation.http import http_clients
 from inclusion_connect.users.models import EmailAddress
+from inclusion_connect.utils.metrics import process_metrics
 from inclusion_connect.utils.oidc import get_next_url
 
 
@@ -20,11 +29,96 @@ logger = logging.getLogger("inclusion_connect.auth.oidc_federation")
 CONFIG = {}
 
 
+class CachedJWKS(NamedTuple):
+    keys: list
+    fetched_at: datetime.datetime
+
+
+class JWKSCache:
+    """
+    Per-process cache of the signing keys of the identity providers, by JWKS endpoint.
+
+    The keys are fetched again after FEDERATION_JWKS_CACHE_SECS, or when a token is signed by an unknown key (key
+    rotation), at most once per FEDERATION_JWKS_REFRESH_INTERVAL_SECS. When the identity provider cannot be
+    reached, the expired keys are used until the next refresh.
+    """
+
+    def __init__(self):
+        self._jwks = {}
+        self._fetch_attempted_at = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.stale = 0
+
+    def get_keys(self, endpoint, kid, fetch):
+        """Return the keys of endpoint, calling fetch() for the JWKS when they must be refreshed."""
+        now = timezone.now()
+        with self._lock:
+            cached = self._jwks.get(endpoint)
+            if cached is not None:
+                expired = now - cached.fetched_at >= datetime.timedelta(seconds=settings.FEDERATION_JWKS_CACHE_SECS)
+                known_kid = kid is None or any(key.get("kid") == kid for key in cached.keys)
+                if not expired and known_kid:
+                    self.hits += 1
+                    return cached.keys
+                attempted_at = self._fetch_attempted_at[endpoint]
+                refresh_interval = datetime.timedelta(seconds=settings.FEDERATION_JWKS_REFRESH_INTERVAL_SECS)
+                if now - attempted_at < refresh_interval:
+                    # Refreshed recently: the key is really unknown or the identity provider is unreachable.
+                    if expired:
+                        self.stale += 1
+                    else:
+                        self.misses += 1
+                    return cached.keys
+                self.refreshes += 1
+            else:
+                self.misses += 1
+            self._fetch_attempted_at[endpoint] = now
+
+        try:
+            keys = fetch()["keys"]
+        except requests.RequestException:
+            if cached is None:
+                raise
+            logger.exception("Could not refresh the JWKS of %s, using the cached keys", endpoint)
+            with self._lock:
+                self.stale += 1
+            return cached.keys
+        with self._lock:
+            self._jwks[endpoint] = CachedJWKS(keys, now)
+        return keys
+
+    def clear(self):
+        with self._lock:
+            self._jwks = {}
+            self._fetch_attempted_at = {}
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "stale": self.stale,
+            "size": len(self._jwks),
+        }
+
+
+jwks_cache = JWKSCache()
+process_metrics.register("federation_jwks", jwks_cache.stats)
+
+
 class ConfigMixin:
     @classmethod
     def get_settings(cls, attr, *args):
         return cls.config.get(attr, *args)
 
+    @classmethod
+    def get_http_client(cls):
+        """The pooled HTTP client of the identity provider, for every call to it."""
+        return http_clients.get(cls.get_settings("FEDERATION"))
+
 
 class OIDCAuthenticationCallbackView(ConfigMixin, views.OIDCAuthenticationCallbackView):
     config = CONFIG
@@ -52,6 +146,53 @@ class OIDCAuthenticationBackend(ConfigMixin, auth.OIDCAuthenticationBackend):
     required_claims = ["email", "given_name", "family_name", "sub"]
     additionnal_claims = []
 
+    def fetch_jwks(self):
+        response = self.get_http_client().get(
+            "jwks",
+            self.OIDC_OP_JWKS_ENDPOINT,
+            verify=self.get_settings("OIDC_VERIFY_SSL", True),
+            proxies=self.get_settings("OIDC_PROXY", None),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_token(self, payload):
+        auth = None
+        if self.get_settings("OIDC_TOKEN_USE_BASIC_AUTH", False):
+            # The client credentials are sent in the Authorization header instead.
+            auth = HTTPBasicAuth(payload.get("client_id"), payload.get("client_secret"))
+            del payload["client_secret"]
+        response = self.get_http_client().post(
+            "token",
+            self.OIDC_OP_TOKEN_ENDPOINT,
+            data=payload,
+            auth=auth,
+            verify=self.get_settings("OIDC_VERIFY_SSL", True),
+            proxies=self.get_settings("OIDC_PROXY", None),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def retrieve_matching_jwk(self, token):
+        """Find the signing key of token in the cached JWKS of the identity provider."""
+        header = jwt.get_unverified_header(token)
+        kid = header.get("kid")
+        keys = [
+            key
+            for key in jwks_cache.get_keys(self.OIDC_OP_JWKS_ENDPOINT, kid, self.fetch_jwks)
+            if "alg" not in key or key["alg"] == header["alg"]
+        ]
+        for key in keys:
+            if key.get("kid") == kid:
+                return key
+        # Like mozilla-django-oidc, the key id can be left unchecked.
+        if keys and not import_from_settings("OIDC_VERIFY_KID", True):
+            return keys[-1]
+        # Without a key id on either side, the single key of the identity provider.
+        if len(keys) == 1 and (kid is None or "kid" not in keys[0]):
+            return keys[0]
+        raise SuspiciousOperation("Could not find a valid JWKS.")
+
     def get_additional_data(self, claims):
         return {k: v for k, v in sorted(claims.items()) if k in self.additionnal_claims}
 
@@ -70,7 +211,7 @@ class OIDCAuthenticationBackend(ConfigMixin, auth.OIDCAuthenticationBackend):
                 log["user"] = user.pk
                 log["event"] = f"{LoginView.EVENT_NAME}_error"
                 log["federation"] = self.name
-                transaction.on_commit(partial(logger.info, log))
+                log_event(self.request, logger, log)
                 raise SuspiciousOperation(
                     f"email={claims['email']} from federation={self.name} is already used by {user.federation}"
                 )
@@ -78,7 +219,15 @@ class OIDCAuthenticationBackend(ConfigMixin, auth.OIDCAuthenticationBackend):
         return email_users
 
     def get_userinfo(self, access_token, id_token, payload):
-        return super().get_userinfo(access_token, id_token, payload) | {"id_token": id_token}
+        response = self.get_http_client().get(
+            "userinfo",
+            self.OIDC_OP_USER_ENDPOINT,
+            headers={"Authorization": f"Bearer {access_token}"},
+            verify=self.get_settings("OIDC_VERIFY_SSL", True),
+            proxies=self.get_settings("OIDC_PROXY", None),
+        )
+        response.raise_for_status()
+        return response.json() | {"id_token": id_token}
 
     def create_user(self, claims):
         user = self.UserModel.objects.create(
@@ -97,7 +246,7 @@ class OIDCAuthenticationBackend(ConfigMixin, auth.OIDCAuthenticationBackend):
         log["user"] = user.pk
         log["event"] = RegisterView.EVENT_NAME
         log["federation"] = self.name
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
 
         return user
 
@@ -122,7 +271,7 @@ class OIDCAuthenticationBackend(ConfigMixin, auth.OIDCAuthenticationBackend):
         log["user"] = user.pk
         log["event"] = LoginView.EVENT_NAME
         log["federation"] = self.name
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
 
         log = log_data(self.request)
         log["event"] = EditUserInfoView.EVENT_NAME
@@ -131,7 +280,7 @@ class OIDCAuthenticationBackend(ConfigMixin, auth.OIDCAuthenticationBackend):
             if old_user_data[key] != new_user_data[key]:
                 log[f"old_{key}"] = old_user_data[key]
                 log[f"new_{key}"] = new_user_data[key]
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
 
         return user
 
@@ -0,0 +1,125 @@
+import bisect
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from inclusion_connect.utils.metrics import process_metrics
+
+
+# Upper bounds in seconds of the latency buckets, the last bucket counts the slower requests.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error=False):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def stats(self):
+        return {
+            "count": sum(self.counts),
+            "errors": self.errors,
+            "total_seconds": self.total,
+            "buckets": dict(
+                zip([*(f"{bound * 1000:g}ms" for bound in LATENCY_BUCKETS), "inf"], self.counts, strict=True)
+            ),
+        }
+
+
+class FederationHTTPClient:
+    """
+    HTTP client of an identity provider: keep-alive connections, timeouts, retries and latency per endpoint.
+
+    Connection errors are retried, as well as 502, 503 and 504 answers to idempotent requests. Read timeouts are
+    not, a slow identity provider would slow down the login even more.
+    """
+
+    def __init__(self):
+        retries = settings.FEDERATION_HTTP_RETRIES
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.FEDERATION_HTTP_POOL_SIZE,
+            max_retries=Retry(
+                total=retries,
+                connect=retries,
+                read=False,
+                status=retries,
+                status_forcelist=(502, 503, 504),
+                backoff_factor=settings.FEDERATION_HTTP_RETRY_BACKOFF,
+                raise_on_status=False,
+            ),
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def request(self, endpoint, method, url, **kwargs):
+        """Send the request, its latency is recorded under endpoint (e.g. "token")."""
+        kwargs.setdefault("timeout", (settings.FEDERATION_CONNECT_TIMEOUT, settings.FEDERATION_READ_TIMEOUT))
+        start = time.perf_counter()
+        error = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            error = response.status_code >= 500
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._latencies.setdefault(endpoint, LatencyHistogram()).observe(elapsed, error)
+
+    def get(self, endpoint, url, **kwargs):
+        return self.request(endpoint, "GET", url, **kwargs)
+
+    def post(self, endpoint, url, **kwargs):
+        return self.request(endpoint, "POST", url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: histogram.stats() for endpoint, histogram in self._latencies.items()}
+
+    def close(self):
+        self.session.close()
+
+
+class FederationHTTPClients:
+    """Per-process HTTP clients, one per identity provider, created on first use (after the fork)."""
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, federation):
+        with self._lock:
+            try:
+                return self._clients[federation]
+            except KeyError:
+                client = self._clients[federation] = FederationHTTPClient()
+                return client
+
+    def stats(self):
+        with self._lock:
+            clients = dict(self._clients)
+        return {federation: client.stats() for federation, client in clients.items()}
+
+    def clear(self):
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for client in clients.values():
+            client.close()
+
+
+http_clients = FederationHTTPClients()
+process_metrics.register("federation_http", http_clients.stats)
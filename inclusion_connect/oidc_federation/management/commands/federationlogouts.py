@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from inclusion_connect.oidc_federation.worker import BATCH_SIZE, send_pending_logouts
+
+
+class Command(BaseCommand):
+    help = "Déconnecte les utilisateurs de leur fournisseur d'identité, après leur déconnexion d'Inclusion Connect."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=BATCH_SIZE, help="Nombre de déconnexions réservées à la fois."
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1,
+            help="Délai en secondes avant de vérifier à nouveau les déconnexions en attente.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="S’arrête une fois les déconnexions en attente traitées."
+        )
+
+    def handle(self, *args, batch_size, poll_interval, once, **options):
+        while True:
+            if send_pending_logouts(batch_size) == batch_size:
+                continue
+            if once:
+                return
+            time.sleep(poll_interval)
+            # Reconnect if the database closed the connection.
+            close_old_connections()
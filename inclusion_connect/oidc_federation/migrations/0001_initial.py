@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingLogout",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "federation",
+                    models.TextField(choices=[("peama", "Pôle emploi")], verbose_name="fournisseur d'identité"),
+                ),
+                ("id_token_hint", models.TextField(verbose_name="IdToken")),
+                ("application", models.TextField(blank=True, verbose_name="application")),
+                ("request_log", models.JSONField(default=dict, verbose_name="journal de la requête")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="date de création")),
+                ("attempts", models.PositiveSmallIntegerField(default=0, verbose_name="nombre d’envois échoués")),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now, verbose_name="prochain envoi"),
+                ),
+                ("last_error", models.TextField(blank=True, verbose_name="dernière erreur")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="utilisateur",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "déconnexion en attente",
+                "verbose_name_plural": "déconnexions en attente",
+                "indexes": [models.Index(fields=["next_attempt_at"], name="pending_logout_next_idx")],
+            },
+        ),
+    ]
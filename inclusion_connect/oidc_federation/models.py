@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from inclusion_connect.oidc_federation.enums import Federation
+
+
+class PendingLogout(models.Model):
+    """Logout from an identity provider, requested by our logout and sent by the federationlogouts worker."""
+
+    federation = models.TextField("fournisseur d'identité", choices=Federation.choices)
+    id_token_hint = models.TextField("IdToken")
+    # Still logged out from the identity provider when the user is deleted meanwhile.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name="utilisateur",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    application = models.TextField("application", blank=True)
+    # inclusion_connect.logging.log_data() of the logout request, for the audit log of the worker.
+    request_log = models.JSONField("journal de la requête", default=dict)
+    created_at = models.DateTimeField("date de création", auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField("nombre d’envois échoués", default=0)
+    next_attempt_at = models.DateTimeField("prochain envoi", default=timezone.now)
+    last_error = models.TextField("dernière erreur", blank=True)
+
+    class Meta:
+        verbose_name = "déconnexion en attente"
+        verbose_name_plural = "déconnexions en attente"
+        indexes = [models.Index(fields=["next_attempt_at"], name="pending_logout_next_idx")]
+
+    def __str__(self):
+        return f"{self.get_federation_display()} logout ({self.user_id})"
@@ -1,21 +1,15 @@
-import logging
-from functools import partial
-
-import requests
 from django.conf import settings
-from django.db import transaction
 
 from inclusion_connect.logging import log_data
 from inclusion_connect.oidc_federation.enums import Federation
+from inclusion_connect.oidc_federation.models import PendingLogout
 from inclusion_connect.utils.urls import add_url_params
 
 from . import base
 
 
-logger = logging.getLogger("inclusion_connect.auth.oidc_federation")
-
-
 CONFIG = {
+    "FEDERATION": Federation.PEAMA,
     "OIDC_RP_CLIENT_ID": settings.PEAMA_CLIENT_ID,
     "OIDC_RP_CLIENT_SECRET": settings.PEAMA_CLIENT_SECRET,
     "OIDC_OP_AUTHORIZATION_ENDPOINT": settings.PEAMA_AUTH_ENDPOINT,
@@ -53,18 +47,19 @@ class OIDCAuthenticationBackend(base.OIDCAuthenticationBackend):
 
 
 def logout(request, user, application):
-    url = add_url_params(settings.PEAMA_LOGOUT_ENDPOINT, {"id_token_hint": user.federation_id_token_hint})
-    response = requests.get(url)
-
-    log = log_data(request)
-    log["user"] = user.pk
-    log["federation"] = Federation.PEAMA
-    if application:
-        log["application"] = application.client_id
+    """Queue the logout from PEAMA, sent by the federationlogouts worker."""
+    PendingLogout.objects.create(
+        federation=Federation.PEAMA,
+        id_token_hint=user.federation_id_token_hint,
+        user=user,
+        application=application.client_id if application else "",
+        request_log=log_data(request),
+    )
+
+
+def send_logout(pending_logout):
+    url = add_url_params(settings.PEAMA_LOGOUT_ENDPOINT, {"id_token_hint": pending_logout.id_token_hint})
+    response = OIDCAuthenticationBackend.get_http_client().get("logout", url)
     if response.status_code == 204:
-        log["event"] = "logout_peama"
-    else:
-        log["event"] = "logout_peama_error"
-        log["error"] = {"status_code": response.status_code, "msg": response.content.decode()}
-    log["id_token_hint"] = user.federation_id_token_hint
-    transaction.on_commit(partial(logger.info, log))
+        return None
+    return {"status_code": response.status_code, "msg": response.content.decode()}
@@ -0,0 +1,84 @@
+import datetime
+import logging
+
+import requests
+from django.db import transaction
+from django.utils import timezone
+
+from inclusion_connect.oidc_federation import peama
+from inclusion_connect.oidc_federation.enums import Federation
+from inclusion_connect.oidc_federation.models import PendingLogout
+
+
+logger = logging.getLogger("inclusion_connect.auth.oidc_federation")
+
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 5
+# Doubled after each failure: 30 seconds, 1 minute, 2 minutes, 4 minutes.
+RETRY_DELAY = datetime.timedelta(seconds=30)
+# A logout claimed by a worker that died meanwhile is sent again after this delay.
+CLAIM_DURATION = datetime.timedelta(minutes=5)
+
+SEND_LOGOUT = {
+    Federation.PEAMA: peama.send_logout,
+}
+
+
+@transaction.atomic
+def claim_pending_logouts(batch_size):
+    now = timezone.now()
+    # Logouts claimed by another worker are skipped.
+    pending_logouts = list(
+        PendingLogout.objects.filter(next_attempt_at__lte=now)
+        .order_by("next_attempt_at")
+        .select_for_update(skip_locked=True)[:batch_size]
+    )
+    PendingLogout.objects.filter(pk__in=[pending_logout.pk for pending_logout in pending_logouts]).update(
+        next_attempt_at=now + CLAIM_DURATION
+    )
+    return pending_logouts
+
+
+def log_logout(pending_logout, error=None):
+    log = dict(pending_logout.request_log)
+    log["user"] = pending_logout.user_id
+    log["federation"] = Federation(pending_logout.federation)
+    if pending_logout.application:
+        log["application"] = pending_logout.application
+    if error is None:
+        log["event"] = f"logout_{pending_logout.federation}"
+    else:
+        log["event"] = f"logout_{pending_logout.federation}_error"
+        log["error"] = error
+    log["id_token_hint"] = pending_logout.id_token_hint
+    logger.info(log)
+
+
+def send_pending_logouts(batch_size=BATCH_SIZE):
+    """
+    Send a batch of the pending logouts, return the number of logouts processed.
+
+    The identity provider is called outside of a transaction, the logouts are claimed beforehand.
+    """
+    pending_logouts = claim_pending_logouts(batch_size)
+    for pending_logout in pending_logouts:
+        try:
+            error = SEND_LOGOUT[pending_logout.federation](pending_logout)
+        except requests.RequestException as e:
+            # Network errors are retried, the identity provider refused the others.
+            pending_logout.attempts += 1
+            pending_logout.last_error = repr(e)
+            if pending_logout.attempts < MAX_ATTEMPTS:
+                pending_logout.next_attempt_at = timezone.now() + RETRY_DELAY * 2 ** (pending_logout.attempts - 1)
+                pending_logout.save(update_fields=["attempts", "last_error", "next_attempt_at"])
+                logger.warning(
+                    "Logout %s not sent, attempt %s: %s",
+                    pending_logout.pk,
+                    pending_logout.attempts,
+                    pending_logout.last_error,
+                )
+                continue
+            error = {"msg": pending_logout.last_error}
+        log_logout(pending_logout, error)
+        pending_logout.delete()
+    return len(pending_logouts)
@@ -0,0 +1,115 @@
+import datetime
+import json
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.db.models import Exists
+from django.utils import timezone
+from jwcrypto import jwt
+from jwcrypto.common import JWException
+from oauth2_provider.models import get_access_token_model
+from oauth2_provider.settings import oauth2_settings
+from oauthlib.oauth2.rfc6749.tokens import random_token_generator
+
+from inclusion_connect.oidc_overrides.keys import key_ring
+from inclusion_connect.oidc_overrides.models import Application, JWTRevocation
+from inclusion_connect.oidc_overrides.registry import applications
+
+
+# Claims describing the token itself, not returned by userinfo.
+TOKEN_CLAIMS = {"iss", "aud", "client_id", "scope", "iat", "exp", "jti"}
+
+
+def generate_access_token(request):
+    """
+    ACCESS_TOKEN_GENERATOR: a signed JWT for applications using JWT access tokens, a random string otherwise.
+
+    The JWT holds the claims returned by userinfo, only its jti is stored.
+    """
+    if not request.client.jwt_access_tokens:
+        return random_token_generator(request)
+    validator = oauth2_settings.OAUTH2_VALIDATOR_CLASS()
+    now = time.time()
+    claims = validator.get_oidc_claims(None, None, request) | {
+        "iss": validator.get_oidc_issuer_endpoint(request),
+        "aud": request.client.client_id,
+        "client_id": request.client.client_id,
+        "scope": " ".join(request.scopes),
+        "iat": int(now),
+        "exp": int(now) + oauth2_settings.ACCESS_TOKEN_EXPIRE_SECONDS,
+        "jti": uuid.uuid4().hex,
+    }
+    key = key_ring.active()
+    token = jwt.JWT(
+        header={"typ": "at+jwt", "alg": "RS256", "kid": key.kid},
+        claims=json.dumps(claims, default=str),
+    )
+    token.make_signed_token(key.jwk)
+    return token.serialize()
+
+
+def decode_claims(token):
+    """Claims of a JWT access token issued by Inclusion Connect, None if the token is not one or is tampered with."""
+    # Opaque tokens are never decoded.
+    if token.count(".") != 2:
+        return None
+    try:
+        return json.loads(jwt.JWT(key=key_ring.jwk_set(), jwt=token, expected_type="JWS", check_claims=False).claims)
+    except (JWException, ValueError):
+        return None
+
+
+def load_access_token(token):
+    """
+    Unsaved AccessToken for a JWT access token that was not revoked, None otherwise.
+
+    The deny-list and the user are read in a single query: the tokens of deleted or inactive users are rejected, the
+    cascade deleting their stored access tokens does not fill the deny-list. The claims of the token are available as
+    claims.
+    """
+    claims = decode_claims(token)
+    if claims is None:
+        return None
+    try:
+        application = applications.get(claims["client_id"])
+    except Application.DoesNotExist:
+        return None
+    user = (
+        get_user_model()
+        .objects.filter(~Exists(JWTRevocation.objects.filter(jti=claims["jti"])), pk=claims["sub"], is_active=True)
+        .first()
+    )
+    if user is None:
+        return None
+    access_token = get_access_token_model()(
+        user=user,
+        application=application,
+        token=token,
+        expires=datetime.datetime.fromtimestamp(claims["exp"], tz=datetime.UTC),
+        scope=claims["scope"],
+    )
+    access_token.claims = claims
+    return access_token
+
+
+def record_revocations(access_tokens):
+    """
+    Add the JWT access tokens among access_tokens to the deny-list until they expire, before deleting them.
+
+    The stored access tokens of applications using JWT access tokens hold the jti. Called by the revocation, refresh
+    and logout paths and by the access token admin; expired tokens deleted by purgeexpired or cleartokens are not
+    recorded, the tokens of deleted users are rejected by load_access_token.
+    """
+    now = timezone.now()
+    revocations = []
+    for token, expires, application_id in access_tokens.filter(expires__gt=now).values_list(
+        "token", "expires", "application_id"
+    ):
+        try:
+            if not applications.get_by_pk(application_id).jwt_access_tokens:
+                continue
+        except Application.DoesNotExist:
+            continue
+        revocations.append(JWTRevocation(jti=token, expires=expires))
+    JWTRevocation.objects.bulk_create(revocations, ignore_conflicts=True)
@@ -1,12 +1,26 @@
 from django.contrib import admin
 from oauth2_provider import admin as oauth2_admin
+from oauth2_provider.models import get_access_token_model
 
 from inclusion_connect.oidc_overrides import models
+from inclusion_connect.oidc_overrides.access_tokens import record_revocations
 
 
 admin.site.unregister(models.Application)
+admin.site.unregister(get_access_token_model())
 
 
 @admin.register(models.Application)
 class ApplicationAdmin(oauth2_admin.ApplicationAdmin):
-    list_filter = ("client_type", "authorization_grant_type")
+    list_filter = ("client_type", "authorization_grant_type", "jwt_access_tokens")
+
+
+@admin.register(get_access_token_model())
+class AccessTokenAdmin(oauth2_admin.AccessTokenAdmin):
+    def delete_model(self, request, obj):
+        record_revocations(get_access_token_model().objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        record_revocations(queryset)
+        super().delete_queryset(request, queryset)
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.db import models
+
+
+class OIDCOverridesConfig(AppConfig):
+    name = "inclusion_connect.oidc_overrides"
+
+    def ready(self):
+        super().ready()
+        from inclusion_connect.oidc_overrides.models import Application
+        from inclusion_connect.oidc_overrides.registry import invalidate_applications
+
+        models.signals.post_save.connect(invalidate_applications, sender=Application)
+        models.signals.post_delete.connect(invalidate_applications, sender=Application)
@@ -0,0 +1,53 @@
+import collections
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+
+from django.conf import settings
+
+
+class VerifiedClientSecrets:
+    """
+    Per-process cache of the client secrets successfully checked against their PBKDF2 hash.
+
+    Presented secrets are only kept as an HMAC, under a key generated for the process. Entries expire after
+    OIDC_CLIENT_SECRET_CACHE_SECS and do not match once the hashed secret of the application changed.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._key = secrets.token_bytes(32)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, client_id, client_secret):
+        return client_id, hmac.digest(self._key, client_secret.encode(), hashlib.sha256)
+
+    def verified(self, client_id, client_secret, hashed_secret):
+        key = self._cache_key(client_id, client_secret)
+        with self._lock:
+            try:
+                verified_hashed_secret, expires_at = self._entries[key]
+            except KeyError:
+                return False
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False
+            return hmac.compare_digest(verified_hashed_secret, hashed_secret)
+
+    def add(self, client_id, client_secret, hashed_secret):
+        key = self._cache_key(client_id, client_secret)
+        with self._lock:
+            self._entries[key] = (hashed_secret, time.monotonic() + settings.OIDC_CLIENT_SECRET_CACHE_SECS)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified_client_secrets = VerifiedClientSecrets(maxsize=1_000)
@@ -0,0 +1,135 @@
+import datetime
+import functools
+import threading
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.utils import timezone
+from jwcrypto import jwk
+from oauth2_provider.settings import oauth2_settings
+
+from inclusion_connect.oidc_overrides.models import SigningKey
+
+
+# Keys rotated with the rotatesigningkeys command are seen by every process within this delay.
+RELOAD_SECS = 60
+
+
+def generate_private_key():
+    return jwk.JWK.generate(kty="RSA", size=4096)
+
+
+def encrypt_private_key(key):
+    return key.export_to_pem(private_key=True, password=settings.SECRET_KEY.encode()).decode()
+
+
+def decrypt_private_key(pem):
+    return jwk.JWK.from_pem(pem.encode(), password=settings.SECRET_KEY.encode())
+
+
+@functools.lru_cache(maxsize=8)
+def parse_settings_key(pem):
+    return jwk.JWK.from_pem(pem.encode("utf8"))
+
+
+class Key(NamedTuple):
+    kid: str
+    jwk: jwk.JWK
+    # Never signs when None.
+    activates_at: datetime.datetime | None
+    # Trusted forever when None.
+    expires_at: datetime.datetime | None
+
+
+def settings_keys():
+    """OIDC_RSA_PRIVATE_KEY and OIDC_RSA_PRIVATE_KEYS_INACTIVE, until the keys are rotated."""
+    if not oauth2_settings.OIDC_RSA_PRIVATE_KEY:
+        return ()
+    active = parse_settings_key(oauth2_settings.OIDC_RSA_PRIVATE_KEY)
+    inactive = [parse_settings_key(pem) for pem in oauth2_settings.OIDC_RSA_PRIVATE_KEYS_INACTIVE]
+    return (
+        *(Key(key.thumbprint(), key, None, None) for key in inactive),
+        Key(active.thumbprint(), active, datetime.datetime.min.replace(tzinfo=datetime.UTC), None),
+    )
+
+
+class KeyRing:
+    """
+    Per-process cache of the parsed signing keys, ordered by activation.
+
+    The keys are reloaded from the database every RELOAD_SECS, only new keys are parsed. The settings keys are used
+    until the rotatesigningkeys command stored the first key.
+    """
+
+    def __init__(self):
+        self._keys = ()
+        self._jwk_sets = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        parsed = {key.kid: key.jwk for key in self._keys}
+        keys = []
+        signing_keys = SigningKey.objects.filter(Q(expires_at=None) | Q(expires_at__gt=timezone.now()))
+        for signing_key in signing_keys.order_by("activates_at"):
+            try:
+                private_key = parsed[signing_key.kid]
+            except KeyError:
+                private_key = decrypt_private_key(signing_key.private_key)
+            keys.append(Key(signing_key.kid, private_key, signing_key.activates_at, signing_key.expires_at))
+        return tuple(keys) or settings_keys()
+
+    def keys(self):
+        """The published keys."""
+        with self._lock:
+            monotonic = time.monotonic()
+            if self._loaded_at is None or monotonic - self._loaded_at >= RELOAD_SECS:
+                self._keys = self._load()
+                self._jwk_sets = {}
+                self._loaded_at = monotonic
+            keys = self._keys
+        now = timezone.now()
+        return [key for key in keys if key.expires_at is None or key.expires_at > now]
+
+    def kids(self):
+        return tuple(key.kid for key in self.keys())
+
+    def active(self):
+        """The key signing new tokens."""
+        now = timezone.now()
+        activated = [key for key in self.keys() if key.activates_at is not None and key.activates_at <= now]
+        if not activated:
+            raise ImproperlyConfigured("You must set OIDC_RSA_PRIVATE_KEY or run the rotatesigningkeys command")
+        return activated[-1]
+
+    def jwk_set(self):
+        """Public keys verifying the tokens signed by any published key, picked by the kid of the token."""
+        keys = self.keys()
+        kids = tuple(key.kid for key in keys)
+        try:
+            return self._jwk_sets[kids]
+        except KeyError:
+            pass
+        jwk_set = jwk.JWKSet()
+        for key in keys:
+            jwk_set.add(jwk.JWK(**key.jwk.export_public(as_dict=True) | {"kid": key.kid}))
+        self._jwk_sets[kids] = jwk_set
+        return jwk_set
+
+    def public_keys(self):
+        """The keys of the JWKS document."""
+        return [
+            key.jwk.export_public(as_dict=True) | {"alg": "RS256", "use": "sig", "kid": key.kid} for key in self.keys()
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._keys = ()
+            self._jwk_sets = {}
+            self._loaded_at = None
+
+
+key_ring = KeyRing()
@@ -0,0 +1,43 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inclusion_connect.oidc_overrides import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée à l’avance les partitions quotidiennes des tables de jetons et supprime les partitions dont tous les "
+        "jetons ont expiré. Avec --convert, partitionne les tables de jetons existantes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Partitionne les tables de jetons, verrouillées pendant la copie des jetons existants.",
+        )
+        parser.add_argument("--ahead", type=int, default=7, help="Nombre de jours de partitions créées à l’avance.")
+
+    @transaction.atomic
+    def handle(self, *args, convert, ahead, **options):
+        with connection.cursor() as cursor:
+            # Fail instead of blocking the token writes queued behind the partition locks.
+            cursor.execute("SET LOCAL lock_timeout = '5s'")
+        now = timezone.now()
+        ahead = datetime.timedelta(days=ahead)
+        if convert:
+            for table in partitions.convert(now, ahead):
+                self.stdout.write(f"{table} partitionnée.")
+        for model in partitions.token_models():
+            if not partitions.is_partitioned(model):
+                self.stdout.write(f"{model._meta.db_table} n’est pas partitionnée, voir --convert.")
+                continue
+            table = model._meta.db_table
+            created = partitions.create_partitions(table, now, ahead)
+            dropped = partitions.drop_expired_partitions(table, now)
+            self.stdout.write(f"{table} : {len(created)} partition(s) créée(s), {len(dropped)} supprimée(s).")
+            if purged := partitions.purge_default_partition(table, now):
+                self.stdout.write(f"{partitions.default_partition(table)} : {purged} jeton(s) expiré(s) supprimé(s).")
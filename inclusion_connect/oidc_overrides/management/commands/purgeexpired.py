@@ -0,0 +1,98 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_grant_model, get_id_token_model, get_refresh_token_model
+from oauth2_provider.settings import oauth2_settings
+
+from inclusion_connect.oidc_overrides.models import JWTRevocation
+from inclusion_connect.oidc_overrides.partitions import is_partitioned
+from inclusion_connect.users.models import UserSession
+
+
+def expired_querysets(now):
+    """The expired rows, with the conditions of clearsessions and cleartokens, and the expired JWT revocations."""
+    querysets = {"sessions": UserSession.objects.filter(expire_date__lt=now)}
+    if oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS:
+        refresh_expire_at = now - datetime.timedelta(seconds=oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS)
+        RefreshToken = get_refresh_token_model()
+        querysets["revoked refresh tokens"] = RefreshToken.objects.filter(revoked__lt=refresh_expire_at)
+        querysets["expired refresh tokens"] = RefreshToken.objects.filter(access_token__expires__lt=refresh_expire_at)
+    querysets["access tokens"] = get_access_token_model().objects.filter(refresh_token__isnull=True, expires__lt=now)
+    querysets["ID tokens"] = get_id_token_model().objects.filter(access_token__isnull=True, expires__lt=now)
+    querysets["grants"] = get_grant_model().objects.filter(expires__lt=now)
+    querysets["JWT revocations"] = JWTRevocation.objects.filter(expires__lt=now)
+    return querysets
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime par lots les sessions, jetons, autorisations et révocations de jetons JWT expirés, à la place de "
+        "clearsessions et cleartokens. Chaque lot est supprimé dans sa propre transaction, pour être lancé toutes "
+        "les quelques minutes sans verrouiller les tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5_000, help="Nombre de lignes supprimées par lot.")
+        parser.add_argument("--sleep", type=float, default=0, help="Pause en secondes entre deux lots.")
+        parser.add_argument(
+            "--max-rows-per-second",
+            type=int,
+            default=None,
+            help="Limite le nombre de lignes supprimées par seconde.",
+        )
+        parser.add_argument(
+            "--max-runtime",
+            type=float,
+            default=240,
+            help="Durée maximale en secondes, la suite est supprimée par l’exécution suivante.",
+        )
+
+    def handle(self, *args, batch_size, sleep, max_rows_per_second, max_runtime, **options):
+        start = time.monotonic()
+        deadline = start + max_runtime
+        total = 0
+        for name, queryset in expired_querysets(timezone.now()).items():
+            if is_partitioned(queryset.model):
+                self.stdout.write(f"{name} : table partitionnée, purgée par partitiontokens.")
+                continue
+            table_start = time.monotonic()
+            deleted = 0
+            while time.monotonic() < deadline:
+                batch = self.delete_batch(queryset, batch_size)
+                deleted += batch
+                total += batch
+                if batch < batch_size:
+                    break
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{name} : {deleted} ligne(s) supprimée(s)…")
+                pause = sleep
+                if max_rows_per_second:
+                    pause = max(pause, total / max_rows_per_second - (time.monotonic() - start))
+                time.sleep(min(pause, max(deadline - time.monotonic(), 0)))
+            self.report(name, deleted, table_start)
+            if time.monotonic() >= deadline:
+                self.stdout.write(f"Durée maximale de {max_runtime:g} s atteinte.")
+                break
+        self.report("Total", total, start)
+
+    def report(self, name, deleted, start):
+        elapsed = time.monotonic() - start
+        rate = deleted / elapsed if elapsed else 0
+        self.stdout.write(f"{name} : {deleted} ligne(s) supprimée(s) en {elapsed:.1f} s ({rate:.0f} lignes/s).")
+
+    @staticmethod
+    @transaction.atomic
+    def delete_batch(queryset, batch_size):
+        # Rows locked by a concurrent run are left to it.
+        pks = list(
+            queryset.order_by()
+            .select_for_update(skip_locked=True, of=("self",))
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not pks:
+            return 0
+        queryset.model.objects.filter(pk__in=pks).delete()
+        return len(pks)
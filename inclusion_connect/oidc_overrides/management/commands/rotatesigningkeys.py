@@ -0,0 +1,64 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.settings import oauth2_settings
+
+from inclusion_connect.oidc_overrides.keys import (
+    RELOAD_SECS,
+    encrypt_private_key,
+    generate_private_key,
+    parse_settings_key,
+)
+from inclusion_connect.oidc_overrides.models import SigningKey
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère une nouvelle clé de signature des jetons. Elle est publiée immédiatement et signe les jetons une "
+        "fois que les applications ont rechargé le JWKS. Les clés précédentes sont publiées jusqu’à l’expiration "
+        "des jetons qu’elles ont signés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--activation-delay",
+            type=int,
+            # Published by every process after RELOAD_SECS, then cached by the applications.
+            default=RELOAD_SECS + oauth2_settings.OIDC_JWKS_MAX_AGE_SECONDS,
+            help="Délai en secondes avant que la nouvelle clé signe les jetons.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, activation_delay, **options):
+        now = timezone.now()
+        # Serialize concurrent rotations.
+        signing_keys = list(SigningKey.objects.select_for_update().all())
+        if not signing_keys and oauth2_settings.OIDC_RSA_PRIVATE_KEY:
+            # The settings key keeps signing until the new key activates.
+            settings_key = parse_settings_key(oauth2_settings.OIDC_RSA_PRIVATE_KEY)
+            SigningKey.objects.create(
+                kid=settings_key.thumbprint(),
+                private_key=encrypt_private_key(settings_key),
+                activates_at=now,
+            )
+            self.stdout.write(f"Clé {settings_key.thumbprint()} importée depuis OIDC_RSA_PRIVATE_KEY.")
+
+        activates_at = now + datetime.timedelta(seconds=activation_delay)
+        token_lifetime = max(oauth2_settings.ID_TOKEN_EXPIRE_SECONDS, oauth2_settings.ACCESS_TOKEN_EXPIRE_SECONDS)
+        expires_at = activates_at + datetime.timedelta(seconds=token_lifetime)
+        retired = SigningKey.objects.filter(expires_at=None).update(expires_at=expires_at)
+        deleted, _ = SigningKey.objects.filter(expires_at__lte=now).delete()
+
+        key = generate_private_key()
+        SigningKey.objects.create(
+            kid=key.thumbprint(),
+            private_key=encrypt_private_key(key),
+            activates_at=activates_at,
+        )
+        self.stdout.write(
+            f"Clé {key.thumbprint()} active à partir de {activates_at:%Y-%m-%d %H:%M:%S%z}, "
+            f"{retired} clé(s) retirée(s) le {expires_at:%Y-%m-%d %H:%M:%S%z}, "
+            f"{deleted} clé(s) expirée(s) supprimée(s)."
+        )
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+# The django-oauth-toolkit tables are not managed by this project, the indexes are created with SQL.
+INDEXES = {
+    "oauth2_provider_accesstoken_user_expires_idx": (
+        "oauth2_provider_accesstoken (user_id, expires) WHERE user_id IS NOT NULL"
+    ),
+    "oauth2_provider_grant_user_expires_idx": "oauth2_provider_grant (user_id, expires)",
+    "oauth2_provider_idtoken_user_expires_idx": (
+        "oauth2_provider_idtoken (user_id, expires) WHERE user_id IS NOT NULL"
+    ),
+    "oauth2_provider_refreshtoken_user_not_revoked_idx": (
+        "oauth2_provider_refreshtoken (user_id) WHERE revoked IS NULL"
+    ),
+}
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("oauth2_provider", "0007_application_post_logout_redirect_uris"),
+        ("oidc_overrides", "0002_application_post_logout_redirect_uris"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}",
+            f"DROP INDEX CONCURRENTLY IF EXISTS {name}",
+        )
+        for name, definition in INDEXES.items()
+    ]
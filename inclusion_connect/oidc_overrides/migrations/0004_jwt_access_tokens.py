@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oidc_overrides", "0003_token_user_expires_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JWTRevocation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("jti", models.CharField(max_length=32, unique=True)),
+                ("expires", models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="application",
+            name="jwt_access_tokens",
+            field=models.BooleanField(
+                default=False,
+                help_text="Jetons d’accès JWT signés, vérifiables par l’application sans appeler userinfo.",
+                verbose_name="jetons d’accès JWT",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oidc_overrides", "0004_jwt_access_tokens"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SigningKey",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kid", models.CharField(max_length=64, unique=True)),
+                ("private_key", models.TextField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("activates_at", models.DateTimeField()),
+                ("expires_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -1,40 +1,136 @@
-from urllib.parse import urlparse
+import functools
+from urllib.parse import parse_qsl, urlparse
 
 from django.conf import settings
+from django.db import models
 from oauth2_provider.models import AbstractApplication
 
 
-def check_uri(allowed_uris, uri):
-    for allowed_uri in allowed_uris:
-        if allowed_uri == "*":
-            continue
-        allowed_path = urlparse(allowed_uri).path
-        if allowed_path and allowed_path[-1] == "*" and uri.startswith(allowed_uri[:-1]):
-            return True
-    return False
+LOOPBACK_HOSTNAMES = ["127.0.0.1", "::1"]
+
+
+class RedirectURIMatcher:
+    """
+    Allowed redirect URIs of an application, parsed once.
+
+    Accepts the same URIs as django-oauth-toolkit `redirect_to_uri_allowed` (exact matches, additional query
+    parameters, RFC 8252 loopback ports), as well as the URIs starting with an allowed URI whose path ends with a
+    wildcard (`*`).
+
+    Allowed URIs share their hostname with the matched URIs, except for wildcards without a network location
+    (e.g. `custom:*`), flagged by `any_hostname`.
+    """
+
+    def __init__(self, allowed_uris):
+        self.exact = set()
+        # Allowed URIs by scheme and path, which must match exactly.
+        self.parsed = {}
+        self.wildcards = {}
+        self.hostnames = set()
+        self.any_hostname = False
+        for allowed_uri in allowed_uris:
+            self.exact.add(allowed_uri)
+            parsed_allowed_uri = urlparse(allowed_uri)
+            self.hostnames.add(parsed_allowed_uri.hostname)
+            is_loopback = (
+                parsed_allowed_uri.scheme == "http"
+                and parsed_allowed_uri.hostname in LOOPBACK_HOSTNAMES
+                and parsed_allowed_uri.port is None
+            )
+            self.parsed.setdefault((parsed_allowed_uri.scheme, parsed_allowed_uri.path), []).append(
+                (
+                    parsed_allowed_uri.netloc,
+                    parsed_allowed_uri.hostname if is_loopback else None,
+                    frozenset(parse_qsl(parsed_allowed_uri.query)),
+                )
+            )
+            if allowed_uri != "*" and parsed_allowed_uri.path.endswith("*"):
+                self._add_wildcard(allowed_uri[:-1])
+                if not parsed_allowed_uri.netloc:
+                    self.any_hostname = True
+
+    def _add_wildcard(self, prefix):
+        node = self.wildcards
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[None] = True
+
+    def _match_wildcard(self, uri):
+        node = self.wildcards
+        for char in uri:
+            try:
+                node = node[char]
+            except KeyError:
+                return False
+            if None in node:
+                return True
+        return False
+
+    def _match_parsed(self, uri):
+        parsed_uri = urlparse(uri)
+        uqs_set = set(parse_qsl(parsed_uri.query))
+        for netloc, loopback_hostname, aqs_set in self.parsed.get((parsed_uri.scheme, parsed_uri.path), []):
+            if (loopback_hostname and loopback_hostname == parsed_uri.hostname) or netloc == parsed_uri.netloc:
+                if aqs_set.issubset(uqs_set):
+                    return True
+        return False
+
+    def allowed(self, uri):
+        return uri in self.exact or self._match_wildcard(uri) or self._match_parsed(uri)
+
+
+@functools.lru_cache(maxsize=512)
+def compile_uris(uris):
+    """Matchers are keyed by the registered URIs, saving an application with new URIs compiles a new one."""
+    return RedirectURIMatcher(uris.split())
 
 
 class Application(AbstractApplication):
     skip_authorization = True
 
+    jwt_access_tokens = models.BooleanField(
+        "jetons d’accès JWT",
+        default=False,
+        help_text="Jetons d’accès JWT signés, vérifiables par l’application sans appeler userinfo.",
+    )
+
     def redirect_uri_allowed(self, uri):
         if settings.ALLOW_ALL_REDIRECT_URIS:
             return True
 
-        # Else check default implementation
-        if super().redirect_uri_allowed(uri):
-            return True
-
-        # Check if path ends with wildcard
-        return check_uri(self.redirect_uris.split(), uri)
+        return compile_uris(self.redirect_uris).allowed(uri)
 
     def post_logout_redirect_uri_allowed(self, uri):
         if settings.ALLOW_ALL_REDIRECT_URIS:
             return True
 
-        # Else check default implementation
-        if super().post_logout_redirect_uri_allowed(uri):
-            return True
+        return compile_uris(self.post_logout_redirect_uris).allowed(uri)
+
+    @property
+    def jwk_key(self):
+        if self.algorithm == self.RS256_ALGORITHM:
+            from inclusion_connect.oidc_overrides.keys import key_ring
+
+            return key_ring.active().jwk
+        return super().jwk_key
+
+
+class JWTRevocation(models.Model):
+    """JWT access tokens revoked before they expire."""
+
+    jti = models.CharField(max_length=32, unique=True)
+    # The token expired, the revocation can be deleted.
+    expires = models.DateTimeField(db_index=True)
+
+
+class SigningKey(models.Model):
+    """RSA keys signing the tokens, rotated with the rotatesigningkeys command. See oidc_overrides.keys."""
 
-        # Check if path ends with wildcard
-        return check_uri(self.post_logout_redirect_uris.split(), uri)
+    kid = models.CharField(max_length=64, unique=True)
+    # PKCS#8 PEM, encrypted with SECRET_KEY.
+    private_key = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # The last activated key signs the new tokens.
+    activates_at = models.DateTimeField()
+    # Published and trusted until then, when the tokens it signed expired.
+    expires_at = models.DateTimeField(null=True, blank=True)
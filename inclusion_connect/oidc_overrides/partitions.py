@@ -0,0 +1,276 @@
+"""
+Optional daily range partitioning of the token tables on their creation time.
+
+Converted with ``partitiontokens --convert``. The ``partitiontokens`` command then creates the partitions ahead of
+time and drops the partitions whose tokens all expired, instead of deleting the tokens row by row.
+
+Postgres requires the partition key in the unique constraints of a partitioned table, and a foreign key can only
+reference a unique constraint: the foreign keys between the token tables are dropped, the primary key becomes
+(id, created) and the unique constraints include created. In particular, the uniqueness of the token column is no
+longer enforced by the database, only by the randomness of the tokens. Before dropping a partition, the references
+to its tokens from the later partitions are cleared, like the on_delete of the dropped foreign keys.
+
+Tokens created while their partition is missing, e.g. when ``partitiontokens`` did not run for longer than its
+``--ahead``, land in the default partition. They are moved to their partition when it is created, or deleted row by
+row once expired.
+"""
+
+import datetime
+
+from django.core.management import CommandError
+from django.db import connection
+from oauth2_provider.models import get_access_token_model, get_grant_model, get_id_token_model, get_refresh_token_model
+from oauth2_provider.settings import oauth2_settings
+
+
+PARTITION_KEY = "created"
+PARTITION_INTERVAL = datetime.timedelta(days=1)
+PARTITION_SUFFIX_FORMAT = "p%Y%m%d"
+
+
+def token_models():
+    return [get_grant_model(), get_id_token_model(), get_access_token_model(), get_refresh_token_model()]
+
+
+def token_tables():
+    return [model._meta.db_table for model in token_models()]
+
+
+def retention():
+    """How long after its creation a token can still be used, see the conditions of cleartokens."""
+    return datetime.timedelta(
+        seconds=max(
+            oauth2_settings.AUTHORIZATION_CODE_EXPIRE_SECONDS,
+            oauth2_settings.ID_TOKEN_EXPIRE_SECONDS,
+            oauth2_settings.ACCESS_TOKEN_EXPIRE_SECONDS + (oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS or 0),
+        )
+    )
+
+
+def partition_start(moment):
+    return datetime.datetime.combine(moment.astimezone(datetime.UTC).date(), datetime.time(), datetime.UTC)
+
+
+def partition_name(table, start):
+    return f"{table}_{start:{PARTITION_SUFFIX_FORMAT}}"
+
+
+def is_partitioned(model):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [model._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def partitions(table):
+    """The start of the range partitions of table, by name."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass ORDER BY 1", [table]
+        )
+        names = [name for name, in cursor.fetchall()]
+    starts = {}
+    for name in names:
+        try:
+            start = datetime.datetime.strptime(name.removeprefix(f"{table}_"), PARTITION_SUFFIX_FORMAT)
+        except ValueError:
+            # The default partition.
+            continue
+        starts[name] = start.replace(tzinfo=datetime.UTC)
+    return starts
+
+
+def default_partition(table):
+    return f"{table}_default"
+
+
+def create_partition(cursor, table, start):
+    name = partition_name(table, start)
+    end = start + PARTITION_INTERVAL
+    default = default_partition(table)
+    cursor.execute(
+        f"SELECT EXISTS (SELECT FROM {default} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s)", [start, end]
+    )
+    if cursor.fetchone()[0]:
+        # Postgres refuses to create a partition for the rows of the default partition, they are moved to it first.
+        cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {default} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            [start, end],
+        )
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end])
+    else:
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", [start, end])
+    return name
+
+
+def create_partitions(table, now, ahead):
+    """Create the missing daily partitions of table, from today to now + ahead, return their names."""
+    existing = partitions(table)
+    created = []
+    start = partition_start(now)
+    with connection.cursor() as cursor:
+        while start <= now + ahead:
+            if partition_name(table, start) not in existing:
+                created.append(create_partition(cursor, table, start))
+            start += PARTITION_INTERVAL
+    return created
+
+
+def _clear_references(cursor, table, ids_query, end, params=()):
+    """
+    Clear the references to the tokens selected by ids_query, from the tokens created after end.
+
+    The older tokens are deleted along with them. A refresh token without its access token is revoked.
+    """
+    refresh_token_model = get_refresh_token_model()
+    for model in token_models():
+        for field in model._meta.concrete_fields:
+            if not field.is_relation or field.related_model._meta.db_table != table:
+                continue
+            assignments = [f"{field.column} = NULL"]
+            assignment_params = []
+            if model is refresh_token_model:
+                assignments.append("revoked = COALESCE(revoked, %s)")
+                assignment_params.append(end)
+            cursor.execute(
+                f"""
+                UPDATE {model._meta.db_table} SET {", ".join(assignments)}
+                WHERE {PARTITION_KEY} >= %s AND {field.column} IN ({ids_query})
+                """,
+                [*assignment_params, end, *params],
+            )
+
+
+def drop_expired_partitions(table, now):
+    """Drop the partitions of table whose tokens all expired, return their names."""
+    dropped = []
+    with connection.cursor() as cursor:
+        for name, start in partitions(table).items():
+            end = start + PARTITION_INTERVAL
+            if end + retention() <= now:
+                _clear_references(cursor, table, f"SELECT id FROM {name}", end)
+                cursor.execute(f"DROP TABLE {name}")
+                dropped.append(name)
+    return dropped
+
+
+def purge_default_partition(table, now):
+    """Delete the expired tokens of the default partition of table, return their number."""
+    default = default_partition(table)
+    end = now - retention()
+    with connection.cursor() as cursor:
+        _clear_references(cursor, table, f"SELECT id FROM {default} WHERE {PARTITION_KEY} < %s", end, [end])
+        cursor.execute(f"DELETE FROM {default} WHERE {PARTITION_KEY} < %s", [end])
+        return cursor.rowcount
+
+
+def _table_constraints(cursor, table):
+    cursor.execute(
+        """
+        SELECT conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass
+        ORDER BY contype DESC, conname
+        """,
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def _table_indexes(cursor, table):
+    """The definition of the indexes not backing a constraint."""
+    cursor.execute(
+        """
+        SELECT pg_get_indexdef(indexrelid)
+        FROM pg_index
+        WHERE indrelid = %s::regclass AND NOT EXISTS (SELECT FROM pg_constraint WHERE conindid = indexrelid)
+        """,
+        [table],
+    )
+    return [indexdef for indexdef, in cursor.fetchall()]
+
+
+def _with_partition_key(definition):
+    """Add the partition key to a primary key or unique constraint, e.g. UNIQUE (token) -> UNIQUE (token, created)."""
+    columns_end = definition.index(")")
+    return f"{definition[:columns_end]}, {PARTITION_KEY}{definition[columns_end:]}"
+
+
+def convert(now, ahead):
+    """
+    Convert the token tables into partitioned tables, return the converted tables.
+
+    Runs in the caller transaction, which locks the token tables until it commits.
+    """
+    tables = token_tables()
+    converted = []
+    with connection.cursor() as cursor:
+        # The deferred foreign key checks of the transaction prevent altering the tables.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"LOCK TABLE {', '.join(tables)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            """
+            SELECT conname, conrelid::regclass::text
+            FROM pg_constraint
+            WHERE contype = 'f' AND confrelid = ANY(%s::regclass[])
+            """,
+            [tables],
+        )
+        for name, table in cursor.fetchall():
+            if table not in tables:
+                raise CommandError(f"La contrainte {name} de {table} référence une table de jetons.")
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+
+        for model in token_models():
+            if is_partitioned(model):
+                continue
+            table = model._meta.db_table
+            constraints = _table_constraints(cursor, table)
+            indexes = _table_indexes(cursor, table)
+            unpartitioned = f"{table}_unpartitioned"
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {unpartitioned}")
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1, MIN({PARTITION_KEY}) FROM {unpartitioned}")
+            next_id, oldest = cursor.fetchone()
+            cursor.execute(
+                "SELECT attidentity <> '', pg_get_serial_sequence(%s, 'id') FROM pg_attribute "
+                "WHERE attrelid = %s::regclass AND attname = 'id'",
+                [unpartitioned, unpartitioned],
+            )
+            identity, sequence = cursor.fetchone()
+            if identity:
+                cursor.execute(f"ALTER TABLE {unpartitioned} ALTER COLUMN id DROP IDENTITY")
+            else:
+                # A serial column, created before Django 4.1. Its sequence, the default copied by LIKE, would be
+                # dropped with the table.
+                cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+            cursor.execute(
+                f"CREATE TABLE {table} (LIKE {unpartitioned} INCLUDING DEFAULTS) PARTITION BY RANGE ({PARTITION_KEY})"
+            )
+            if identity:
+                cursor.execute(
+                    f"ALTER TABLE {table} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START {next_id})"
+                )
+            cursor.execute(f"CREATE TABLE {default_partition(table)} PARTITION OF {table} DEFAULT")
+            start = partition_start(min(oldest or now, now))
+            while start <= now + ahead:
+                create_partition(cursor, table, start)
+                start += PARTITION_INTERVAL
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM {unpartitioned}")
+            cursor.execute(f"DROP TABLE {unpartitioned}")
+            if not identity:
+                cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+            # Without the foreign keys between the token tables, dropped above.
+            for name, contype, definition in constraints:
+                if contype in ("p", "u"):
+                    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {_with_partition_key(definition)}")
+                else:
+                    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+            for indexdef in indexes:
+                cursor.execute(indexdef)
+            converted.append(table)
+    return converted
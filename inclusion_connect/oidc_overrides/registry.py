@@ -0,0 +1,150 @@
+import logging
+import threading
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from inclusion_connect.oidc_overrides.models import Application, compile_uris
+from inclusion_connect.utils.metrics import process_metrics
+
+
+logger = logging.getLogger("inclusion_connect.oidc_overrides.registry")
+
+NOTIFY_CHANNEL = "oidc_overrides_application"
+LISTEN_RETRY_DELAY_SECS = 5
+# Key of the post logout redirect URIs index for applications allowing any hostname.
+ANY_HOSTNAME = object()
+
+
+class ApplicationRegistry:
+    """
+    Per-process, read-through cache of the applications, by client_id and by pk.
+
+    Applications are looked up on every authorization, token and logout request, but rarely change. Changes made
+    by any process are broadcast with PostgreSQL NOTIFY, see :meth:`listen`.
+    """
+
+    def __init__(self):
+        self._by_client_id = {}
+        self._by_pk = {}
+        self._post_logout_index = None
+        # Prevents storing an application fetched before a concurrent invalidation.
+        self._generation = 0
+        self._listener = None
+        self._listen_connection = None
+        self._stopped = threading.Event()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, client_id):
+        """Return the application for client_id, or raise Application.DoesNotExist."""
+        return self._get(self._by_client_id, client_id, client_id=client_id)
+
+    def get_by_pk(self, pk):
+        """Return the application for pk, or raise Application.DoesNotExist."""
+        return self._get(self._by_pk, pk, pk=pk)
+
+    def _get(self, cache, key, **lookup):
+        try:
+            application = cache[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return application
+
+        self.misses += 1
+        generation = self._generation
+        application = Application.objects.get(**lookup)
+        if generation == self._generation:
+            self._by_client_id[application.client_id] = application
+            self._by_pk[application.pk] = application
+        return application
+
+    def find_by_post_logout_redirect_uri(self, uri):
+        """Return the application with the highest pk allowing uri as post logout redirect URI, or None."""
+        if settings.ALLOW_ALL_REDIRECT_URIS:
+            return Application.objects.order_by("pk").last()
+        index = self._post_logout_index
+        if index is None:
+            index = self._build_post_logout_index()
+        candidates = index.get(urlparse(uri).hostname, []) + index.get(ANY_HOSTNAME, [])
+        for application in sorted(candidates, key=lambda application: application.pk, reverse=True):
+            if application.post_logout_redirect_uri_allowed(uri):
+                return application
+        return None
+
+    def _build_post_logout_index(self):
+        generation = self._generation
+        index = {}
+        all_applications = list(Application.objects.all())
+        for application in all_applications:
+            matcher = compile_uris(application.post_logout_redirect_uris)
+            for hostname in matcher.hostnames:
+                index.setdefault(hostname, []).append(application)
+            if matcher.any_hostname:
+                index.setdefault(ANY_HOSTNAME, []).append(application)
+        if generation == self._generation:
+            self._by_client_id = {application.client_id: application for application in all_applications}
+            self._by_pk = {application.pk: application for application in all_applications}
+            self._post_logout_index = index
+        return index
+
+    def clear(self):
+        self._generation += 1
+        self._by_client_id = {}
+        self._by_pk = {}
+        self._post_logout_index = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._by_pk)}
+
+    def listen(self):
+        """
+        Clear the registry when an application is changed by another process.
+
+        Must be called in each worker process, after the fork.
+        """
+        self._stopped.clear()
+        self._listener = threading.Thread(target=self._listen, name="application-registry", daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._listen_connection is not None:
+            # Interrupts the blocking wait for notifications.
+            self._listen_connection.close()
+        if self._listener is not None:
+            self._listener.join()
+            self._listener = None
+
+    def _listen(self):
+        db = connections[DEFAULT_DB_ALIAS]
+        while not self._stopped.is_set():
+            try:
+                self._listen_connection = db.get_new_connection(db.get_connection_params())
+                with self._listen_connection as conn:
+                    conn.autocommit = True
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    # Notifications are lost while disconnected.
+                    self.clear()
+                    for _notify in conn.notifies():
+                        self.clear()
+            except Exception:
+                if self._stopped.is_set():
+                    break
+                logger.exception("Application registry listener disconnected.")
+                self._stopped.wait(LISTEN_RETRY_DELAY_SECS)
+        self._listen_connection = None
+
+
+def invalidate_applications(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    applications.clear()
+    # Delivered to the listeners when the transaction is committed.
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, '')", [NOTIFY_CHANNEL])
+
+
+applications = ApplicationRegistry()
+process_metrics.register("applications", applications.stats)
@@ -1,5 +1,23 @@
+import base64
+import binascii
+from urllib.parse import unquote_plus
+
+from django.conf import settings
+from django.db.models import Q
+from oauth2_provider.models import get_access_token_model
 from oauth2_provider.oauth2_validators import OAuth2Validator
 
+from inclusion_connect.oidc_overrides.access_tokens import (
+    TOKEN_CLAIMS,
+    decode_claims,
+    load_access_token,
+    record_revocations,
+)
+from inclusion_connect.oidc_overrides.client_secrets import verified_client_secrets
+from inclusion_connect.oidc_overrides.keys import key_ring
+from inclusion_connect.oidc_overrides.models import Application
+from inclusion_connect.oidc_overrides.registry import applications
+
 
 class CustomOAuth2Validator(OAuth2Validator):
     # Extend the standard scopes to add a new "permissions" scope
@@ -21,3 +39,102 @@ class CustomOAuth2Validator(OAuth2Validator):
             "family_name": request.user.last_name,
             "email": request.user.email,
         } | (request.user.federation_data or {})
+
+    def _load_application(self, client_id, request):
+        if not request.client:
+            try:
+                request.client = applications.get(client_id)
+            except Application.DoesNotExist:
+                # Let the default implementation handle the error.
+                pass
+        return super()._load_application(client_id, request)
+
+    def _basic_auth_credentials(self, request):
+        """Decode the client credentials of the Authorization header, like _authenticate_basic_auth."""
+        auth_string = self._extract_basic_auth(request)
+        if not auth_string:
+            return None
+        try:
+            encoding = request.encoding or settings.DEFAULT_CHARSET or "utf-8"
+        except AttributeError:
+            encoding = "utf-8"
+        try:
+            client_id, client_secret = map(unquote_plus, base64.b64decode(auth_string).decode(encoding).split(":", 1))
+        except (TypeError, binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        return client_id, client_secret
+
+    def _secret_verified(self, request, client_id, client_secret):
+        if self._load_application(client_id, request) is None or request.client.client_id != client_id:
+            return False
+        return verified_client_secrets.verified(client_id, client_secret, request.client.client_secret)
+
+    def _authenticate_client(self, request, credentials, authenticate):
+        if credentials is None or None in credentials:
+            return authenticate(request)
+        # Checking the secret against its hash (PBKDF2) is the main cost of the token endpoint.
+        if self._secret_verified(request, *credentials):
+            return True
+        authenticated = authenticate(request)
+        if authenticated:
+            verified_client_secrets.add(*credentials, request.client.client_secret)
+        return authenticated
+
+    def _authenticate_basic_auth(self, request):
+        return self._authenticate_client(
+            request, self._basic_auth_credentials(request), super()._authenticate_basic_auth
+        )
+
+    def _authenticate_request_body(self, request):
+        try:
+            credentials = request.client_id, getattr(request, "client_secret", "")
+        except AttributeError:
+            credentials = None
+        return self._authenticate_client(request, credentials, super()._authenticate_request_body)
+
+    def _load_access_token(self, token):
+        return load_access_token(token) or super()._load_access_token(token)
+
+    def _create_access_token(self, expires, request, token, source_refresh_token=None):
+        if claims := decode_claims(token["access_token"]):
+            # Refreshing and revoking the token rely on the stored access token, userinfo doesn't.
+            token = token | {"access_token": claims["jti"]}
+        return super()._create_access_token(expires, request, token, source_refresh_token)
+
+    def save_bearer_token(self, token, request, *args, **kwargs):
+        if request.refresh_token:
+            # The access token of the refresh token is deleted, or replaced.
+            record_revocations(get_access_token_model().objects.filter(refresh_token__token=request.refresh_token))
+        return super().save_bearer_token(token, request, *args, **kwargs)
+
+    def revoke_token(self, token, token_type_hint, request, *args, **kwargs):
+        if claims := decode_claims(token):
+            token = claims["jti"]
+        # Revoking a refresh token revokes its access token.
+        record_revocations(get_access_token_model().objects.filter(Q(token=token) | Q(refresh_token__token=token)))
+        return super().revoke_token(token, token_type_hint, request, *args, **kwargs)
+
+    def get_userinfo_claims(self, request):
+        try:
+            claims = request.access_token.claims
+        except AttributeError:
+            return super().get_userinfo_claims(request)
+        # Built by get_oidc_claims() when the token was issued.
+        return {claim: value for claim, value in claims.items() if claim not in TOKEN_CLAIMS}
+
+    def _get_key_for_token(self, token):
+        key = super()._get_key_for_token(token)
+        if key is not None and key["kty"] == "RSA":
+            # Tokens signed by a retiring key are still valid, the key is picked by the kid of the token.
+            return key_ring.jwk_set()
+        return key
+
+    def _get_client_by_audience(self, audience):
+        if isinstance(audience, str):
+            audience = [audience]
+        for client_id in audience:
+            try:
+                return applications.get(client_id)
+            except Application.DoesNotExist:
+                pass
+        return None
@@ -1,22 +1,37 @@
+import calendar
+import json
 import logging
-from functools import partial
 
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from django.contrib.sessions.models import Session
-from django.db import transaction
-from django.http import HttpResponseRedirect
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
 from oauth2_provider import views as oauth2_views
 from oauth2_provider.exceptions import InvalidIDTokenError, InvalidOIDCClientError, OAuthToolkitError
+from oauth2_provider.models import (
+    get_access_token_model,
+    get_grant_model,
+    get_id_token_model,
+    get_refresh_token_model,
+)
 from oauth2_provider.settings import oauth2_settings
 from oauth2_provider.signals import app_authorized
 
-from inclusion_connect.logging import log_data
+from inclusion_connect.logging import log_data, log_event
 from inclusion_connect.oidc_federation.enums import Federation
-from inclusion_connect.oidc_overrides.models import Application
-from inclusion_connect.stats.models import Actions, Stats
-from inclusion_connect.users.models import UserApplicationLink
+from inclusion_connect.oidc_overrides.access_tokens import load_access_token, record_revocations
+from inclusion_connect.oidc_overrides.keys import key_ring
+from inclusion_connect.oidc_overrides.registry import applications
+from inclusion_connect.oidc_overrides.well_known import well_known_documents
+from inclusion_connect.stats.helpers import record_action
+from inclusion_connect.stats.models import Actions
+from inclusion_connect.users.last_logins import record_last_login
+from inclusion_connect.users.sessions import delete_user_sessions
+from inclusion_connect.utils.lightweight import lightweight
 from inclusion_connect.utils.oidc import OIDC_SESSION_KEY, get_next_url, initial_from_login_hint
 from inclusion_connect.utils.urls import get_url_params, is_inclusion_connect_url
 
@@ -65,7 +80,7 @@ class BaseAuthorizationView(OIDCSessionMixin, oauth2_views.base.AuthorizationVie
                 "event": "oidc_params_error",
                 "oidc_params": get_url_params(self.request.get_full_path()),
             }
-            transaction.on_commit(partial(logger.info, log))
+            log_event(request, logger, log)
             return self.error_response(error, application=None)
 
         return super().dispatch(request, *args, **kwargs)
@@ -77,13 +92,9 @@ class BaseAuthorizationView(OIDCSessionMixin, oauth2_views.base.AuthorizationVie
     def create_authorization_response(self, request, scopes, credentials, allow):
         response = super().create_authorization_response(request, scopes, credentials, allow)
 
-        application = Application.objects.get(client_id=credentials["client_id"])
+        application = applications.get(credentials["client_id"])
         # Only link if authorization response was created
-        UserApplicationLink.objects.update_or_create(
-            user=self.request.user,
-            application=application,
-            defaults={"last_login": timezone.now()},
-        )
+        record_last_login(self.request.user, application)
 
         self.request.session.pop(OIDC_SESSION_KEY, None)
 
@@ -100,7 +111,7 @@ class BaseAuthorizationView(OIDCSessionMixin, oauth2_views.base.AuthorizationVie
         log["event"] = "redirect"
         log["user"] = self.request.user.pk
         log["url"] = redirect_to
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
         return super().redirect(redirect_to, application)
 
 
@@ -116,24 +127,113 @@ class ActivationView(BaseAuthorizationView):
     login_url = reverse_lazy("accounts:activate")
 
 
+class TokenView(oauth2_views.TokenView):
+    def post(self, request, *args, **kwargs):
+        url, headers, body, status = self.create_token_response(request)
+        if status == 200:
+            access_token = json.loads(body).get("access_token")
+            if access_token is not None:
+                # JWT access tokens are not stored.
+                token = load_access_token(access_token) or get_access_token_model().objects.get(token=access_token)
+                app_authorized.send(sender=self, request=request, token=token)
+        response = HttpResponse(content=body, status=status)
+        for k, v in headers.items():
+            response[k] = v
+        return response
+
+
+class IntrospectTokenView(oauth2_views.IntrospectTokenView):
+    @staticmethod
+    def get_token_response(token_value=None):
+        token = load_access_token(token_value or "")
+        if token is None:
+            return oauth2_views.IntrospectTokenView.get_token_response(token_value)
+        if not token.is_valid():
+            return JsonResponse({"active": False}, status=200)
+        return JsonResponse(
+            {
+                "active": True,
+                "scope": token.scope,
+                "exp": int(calendar.timegm(token.expires.timetuple())),
+                "client_id": token.application.client_id,
+                "username": token.user.get_username(),
+            }
+        )
+
+
+class WellKnownDocumentMixin:
+    """
+    Serve the JSON document of the view, built once per process by URL and signing keys.
+
+    The URL includes the host and the realm prefix, the document holds absolute URLs.
+    """
+
+    def get(self, request, *args, **kwargs):
+        content, etag = well_known_documents.get(
+            (type(self), request.build_absolute_uri(request.path)),
+            lambda: self.get_document(request, *args, **kwargs),
+        )
+        response = HttpResponse(content, content_type="application/json")
+        response["Access-Control-Allow-Origin"] = "*"
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=oauth2_settings.OIDC_JWKS_MAX_AGE_SECONDS)
+        return get_conditional_response(request, etag=etag, response=response)
+
+    def get_document(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs).content
+
+
+@method_decorator(lightweight, name="dispatch")
+class ConnectDiscoveryInfoView(WellKnownDocumentMixin, oauth2_views.ConnectDiscoveryInfoView):
+    pass
+
+
+@method_decorator(lightweight, name="dispatch")
+class JwksInfoView(WellKnownDocumentMixin, oauth2_views.JwksInfoView):
+    def get_document(self, request, *args, **kwargs):
+        # All the published keys of the key ring, instead of the settings keys.
+        return JsonResponse({"keys": key_ring.public_keys()}).content
+
+
+@method_decorator(lightweight, name="dispatch")
+class UserInfoView(oauth2_views.UserInfoView):
+    pass
+
+
 def handle_app_authorized(sender, request, token, **kwargs):
-    Stats.objects.get_or_create(
-        user_id=token.user_id,
-        application_id=token.application_id,
-        date=timezone.localdate().replace(day=1),
-        action=Actions.LOGIN,
-    )
+    record_action(token.user_id, token.application_id, Actions.LOGIN)
     log = log_data(request) | {
-        "application": token.application.client_id,
+        "application": applications.get_by_pk(token.application_id).client_id,
         "event": "token",
         "user": token.user_id,
     }
-    transaction.on_commit(partial(logger.info, log))
+    log_event(request, logger, log)
 
 
 app_authorized.connect(handle_app_authorized)
 
 
+def has_live_tokens(user):
+    """Whether the user can still use a token, checked with a single query."""
+    now = timezone.now()
+    return (
+        get_user_model()
+        .objects.filter(pk=user.pk)
+        .filter(
+            Exists(get_access_token_model().objects.filter(user=OuterRef("pk"), expires__gt=now))
+            | Exists(get_grant_model().objects.filter(user=OuterRef("pk"), expires__gt=now))
+            | Exists(get_id_token_model().objects.filter(user=OuterRef("pk"), expires__gt=now))
+            # confidential clients refresh tokens cannot be used with logging in again, we can ignore them
+            | Exists(
+                get_refresh_token_model()
+                .objects.filter(user=OuterRef("pk"), revoked=None)
+                .exclude(application__client_type="confidential")
+            )
+        )
+        .exists()
+    )
+
+
 original_validate_logout_request = oauth2_views.oidc.validate_logout_request
 
 
@@ -151,10 +251,7 @@ def validate_logout_request(request, id_token_hint, client_id, post_logout_redir
         application = None
         token_user = None
         if post_logout_redirect_uri:
-            for app in Application.objects.all():
-                if app.post_logout_redirect_uri_allowed(post_logout_redirect_uri):
-                    application = app
-
+            application = applications.find_by_post_logout_redirect_uri(post_logout_redirect_uri)
             if application is None:
                 # Don't allow logout with bad id_token_hint if there's a redirect url and
                 # we can't find an application matching the url
@@ -164,17 +261,7 @@ def validate_logout_request(request, id_token_hint, client_id, post_logout_redir
         token_user  # We found a user with the token
         and prompt_logout
         and request.user.is_authenticated is False  # But the user is already logged out
-        and not any(
-            [
-                token_user.oauth2_provider_accesstoken.filter(expires__gt=timezone.now()).exists(),
-                token_user.oauth2_provider_grant.filter(expires__gt=timezone.now()).exists(),
-                token_user.oauth2_provider_idtoken.filter(expires__gt=timezone.now()).exists(),
-                # confidential clients refresh tokens cannot be used with logging in again, we can ignore them
-                token_user.oauth2_provider_refreshtoken.filter(revoked=None)
-                .exclude(application__client_type="confidential")
-                .exists(),
-            ]
-        )  # And all tokens expired
+        and not has_live_tokens(token_user)  # And all tokens expired
     ):
         prompt_logout = False
     return prompt_logout, (post_logout_redirect_uri, application), token_user
@@ -203,7 +290,7 @@ class LogoutView(oauth2_views.RPInitiatedLogoutView):
         if user:
             log["user"] = user.pk
         log.update(extra)
-        transaction.on_commit(partial(logger.info, log))
+        log_event(self.request, logger, log)
 
     def do_logout(self, application=None, post_logout_redirect_uri=None, state=None, token_user=None):
         user = token_user or self.request.user
@@ -218,13 +305,19 @@ class LogoutView(oauth2_views.RPInitiatedLogoutView):
             finally:
                 oauth2_settings.OIDC_RP_INITIATED_LOGOUT_DELETE_TOKENS = original_setting
         else:
+            if original_setting:
+                # The access tokens deleted by do_logout.
+                record_revocations(
+                    get_access_token_model().objects.filter(
+                        user=user,
+                        application__client_type__in=self.token_deletion_client_types,
+                        application__authorization_grant_type__in=self.token_deletion_grant_types,
+                    )
+                )
             response = super().do_logout(application, post_logout_redirect_uri, state, token_user)
 
-        [
-            s.delete()
-            for s in Session.objects.filter(expire_date__gte=timezone.now())
-            if s.get_decoded().get("_auth_user_id") == str(user.pk)
-        ]
+        if user.is_authenticated:
+            delete_user_sessions([user])
         self.log(self.EVENT_NAME, application, user)
 
         # Handle PEAMA logout
@@ -232,9 +325,10 @@ class LogoutView(oauth2_views.RPInitiatedLogoutView):
             if user.federation_id_token_hint:
                 from inclusion_connect.oidc_federation.peama import logout as peama_logout
 
+                # Sent by the federationlogouts worker, the identity provider may be slow.
                 peama_logout(self.request, user, application)
                 user.federation_id_token_hint = None
-                user.save()
+                user.save(update_fields=["federation_id_token_hint"])
 
         return response
 
@@ -0,0 +1,43 @@
+import hashlib
+import threading
+
+from django.utils.http import quote_etag
+
+from inclusion_connect.oidc_overrides.keys import key_ring
+
+
+class WellKnownDocuments:
+    """
+    Per-process cache of the encoded discovery and JWKS documents, with their ETag.
+
+    The documents depend on the signing keys, they are all dropped when the keys change.
+    """
+
+    def __init__(self):
+        self._documents = {}
+        self._signing_keys = None
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Return (content, etag) for key, calling build() for the content on a miss."""
+        with self._lock:
+            current_keys = key_ring.kids()
+            if current_keys != self._signing_keys:
+                self._documents = {}
+                self._signing_keys = current_keys
+            documents = self._documents
+            try:
+                return documents[key]
+            except KeyError:
+                pass
+        content = build()
+        document = documents[key] = (content, quote_etag(hashlib.sha256(content).hexdigest()))
+        return document
+
+    def clear(self):
+        with self._lock:
+            self._documents = {}
+            self._signing_keys = None
+
+
+well_known_documents = WellKnownDocuments()
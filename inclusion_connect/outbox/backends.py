@@ -0,0 +1,15 @@
+from django.core.mail.backends.base import BaseEmailBackend
+
+from inclusion_connect.outbox.models import OutgoingEmail
+
+
+class EmailBackend(BaseEmailBackend):
+    """
+    Store the emails in the outbox, in the transaction of the request.
+
+    The sendemails worker delivers them with OUTBOX_EMAIL_BACKEND, the request does not wait for the email provider.
+    """
+
+    def send_messages(self, email_messages):
+        emails = OutgoingEmail.objects.bulk_create([OutgoingEmail.from_message(message) for message in email_messages])
+        return len(emails)
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from inclusion_connect.outbox.worker import BATCH_SIZE, send_pending_emails
+
+
+class Command(BaseCommand):
+    help = "Envoie les emails en attente, par lots, avec OUTBOX_EMAIL_BACKEND."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Nombre d’emails envoyés par requête.")
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1,
+            help="Délai en secondes avant de vérifier à nouveau les emails en attente.",
+        )
+        parser.add_argument("--once", action="store_true", help="S’arrête une fois les emails en attente envoyés.")
+
+    def handle(self, *args, batch_size, poll_interval, once, **options):
+        while True:
+            if send_pending_emails(batch_size) == batch_size:
+                continue
+            if once:
+                return
+            time.sleep(poll_interval)
+            # Reconnect if the database closed the connection.
+            close_old_connections()
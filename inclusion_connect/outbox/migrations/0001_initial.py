@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="OutgoingEmail",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("from_email", models.TextField(verbose_name="expéditeur")),
+                ("to", models.JSONField(verbose_name="destinataires")),
+                ("subject", models.TextField(verbose_name="objet")),
+                ("body", models.TextField(verbose_name="corps du message")),
+                ("html_body", models.TextField(blank=True, verbose_name="corps HTML du message")),
+                ("headers", models.JSONField(blank=True, default=dict, verbose_name="en-têtes")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="date de création")),
+                ("attempts", models.PositiveSmallIntegerField(default=0, verbose_name="nombre d’envois échoués")),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now, null=True, verbose_name="prochain envoi"),
+                ),
+                ("last_error", models.TextField(blank=True, verbose_name="dernière erreur")),
+            ],
+            options={
+                "verbose_name": "email en attente",
+                "verbose_name_plural": "emails en attente",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("next_attempt_at__isnull", False)),
+                        fields=["next_attempt_at"],
+                        name="outbox_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.core.mail import EmailMultiAlternatives
+from django.db import models
+from django.utils import timezone
+
+
+class OutgoingEmail(models.Model):
+    """Email sent by a request, delivered by the sendemails worker. See inclusion_connect.outbox.backends."""
+
+    from_email = models.TextField("expéditeur")
+    to = models.JSONField("destinataires")
+    subject = models.TextField("objet")
+    body = models.TextField("corps du message")
+    html_body = models.TextField("corps HTML du message", blank=True)
+    headers = models.JSONField("en-têtes", default=dict, blank=True)
+    created_at = models.DateTimeField("date de création", auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField("nombre d’envois échoués", default=0)
+    # None once the worker gave up.
+    next_attempt_at = models.DateTimeField("prochain envoi", null=True, default=timezone.now)
+    last_error = models.TextField("dernière erreur", blank=True)
+
+    class Meta:
+        verbose_name = "email en attente"
+        verbose_name_plural = "emails en attente"
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                name="outbox_pending_idx",
+                condition=models.Q(next_attempt_at__isnull=False),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} ({', '.join(self.to)})"
+
+    @classmethod
+    def from_message(cls, message):
+        if message.cc or message.bcc or message.reply_to or message.attachments:
+            raise ValueError("The outbox does not support cc, bcc, reply_to and attachments.")
+        html_bodies = [
+            content for content, mimetype in getattr(message, "alternatives", []) if mimetype == "text/html"
+        ]
+        return cls(
+            from_email=message.from_email,
+            to=message.to,
+            subject=message.subject,
+            body=message.body,
+            html_body="".join(html_bodies),
+            headers=message.extra_headers,
+        )
+
+    def to_message(self, connection=None):
+        message = EmailMultiAlternatives(
+            self.subject,
+            self.body,
+            self.from_email,
+            self.to,
+            headers=self.headers,
+            connection=connection,
+        )
+        if self.html_body:
+            message.attach_alternative(self.html_body, "text/html")
+        return message
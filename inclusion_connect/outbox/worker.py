@@ -0,0 +1,113 @@
+import datetime
+import logging
+
+from anymail.backends.mailjet import EmailBackend as MailjetEmailBackend
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from inclusion_connect.outbox.models import OutgoingEmail
+
+
+logger = logging.getLogger("inclusion_connect.outbox")
+
+# Mailjet sends up to 50 messages per request.
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 8
+# Doubled after each failure: 30 seconds, 1 minute, 2 minutes… about an hour before the last attempt.
+RETRY_DELAY = datetime.timedelta(seconds=30)
+
+
+def send_mailjet_messages(connection, messages):
+    """
+    Send the messages in a single Mailjet v3.1 request.
+
+    :return: the error of each message, None when it was sent.
+    """
+    payloads = [connection.build_message_payload(message, connection.send_defaults) for message in messages]
+    data = {
+        "Messages": [
+            # Anymail puts the parameters shared by the recipients of a message in Globals.
+            payload.data["Globals"] | message_data
+            for payload in payloads
+            for message_data in payload.data["Messages"]
+        ]
+    }
+    try:
+        response = connection.session.post(
+            f"{connection.api_url}send",
+            json=data,
+            auth=(connection.api_key, connection.secret_key),
+            timeout=connection.timeout,
+        )
+        # Mailjet answers 400 when some messages failed, with the status of each message.
+        if response.status_code != 400:
+            response.raise_for_status()
+        response_data = response.json()
+    except Exception as e:
+        return [repr(e)] * len(messages)
+    if "Messages" not in response_data:
+        # The request was rejected, e.g. authentication failed.
+        return [str(response_data)] * len(messages)
+
+    errors = []
+    results = iter(response_data["Messages"])
+    for payload in payloads:
+        message_errors = [
+            "; ".join(error["ErrorMessage"] for error in result.get("Errors", []))
+            for result in [next(results) for _ in payload.data["Messages"]]
+            if result["Status"] != "success"
+        ]
+        errors.append("; ".join(message_errors) if message_errors else None)
+    return errors
+
+
+def send_messages(connection, messages):
+    """:return: the error of each message, None when it was sent."""
+    if isinstance(connection, MailjetEmailBackend):
+        return send_mailjet_messages(connection, messages)
+    errors = []
+    for message in messages:
+        try:
+            connection.send_messages([message])
+        except Exception as e:
+            errors.append(repr(e))
+        else:
+            errors.append(None)
+    return errors
+
+
+@transaction.atomic
+def send_pending_emails(batch_size=BATCH_SIZE):
+    """Send a batch of the pending emails, return the number of emails processed."""
+    now = timezone.now()
+    # Emails claimed by another worker are skipped.
+    emails = list(
+        OutgoingEmail.objects.filter(next_attempt_at__lte=now)
+        .order_by("next_attempt_at")
+        .select_for_update(skip_locked=True)[:batch_size]
+    )
+    if not emails:
+        return 0
+    with get_connection(settings.OUTBOX_EMAIL_BACKEND) as connection:
+        errors = send_messages(connection, [email.to_message() for email in emails])
+
+    sent = []
+    failed = []
+    for email, error in zip(emails, errors, strict=True):
+        if error is None:
+            sent.append(email.pk)
+            continue
+        email.attempts += 1
+        email.last_error = error
+        if email.attempts < MAX_ATTEMPTS:
+            email.next_attempt_at = now + RETRY_DELAY * 2 ** (email.attempts - 1)
+            logger.warning("Email %s not sent, attempt %s: %s", email.pk, email.attempts, error)
+        else:
+            email.next_attempt_at = None
+            logger.error("Email %s not sent after %s attempts: %s", email.pk, email.attempts, error)
+        failed.append(email)
+    OutgoingEmail.objects.filter(pk__in=sent).delete()
+    OutgoingEmail.objects.bulk_update(failed, ["attempts", "last_error", "next_attempt_at"])
+    return len(emails)
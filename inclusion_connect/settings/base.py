@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 
 import datetime
 import os
+import tempfile
 from pathlib import Path
 from urllib.parse import urlparse, urlunparse
 
@@ -59,7 +60,9 @@ THIRD_PARTY_APPS = [
 LOCAL_APPS = [
     "inclusion_connect.admin.apps.AdminConfig",
     "inclusion_connect.keycloak_compat",
+    "inclusion_connect.oidc_federation",
     "inclusion_connect.oidc_overrides",
+    "inclusion_connect.outbox",
     "inclusion_connect.stats",
     "inclusion_connect.users",
     "inclusion_connect.utils",
@@ -68,13 +71,14 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    "inclusion_connect.middleware.request_cache",
     "csp.middleware.CSPMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.gzip.GZipMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.csrf.CsrfViewMiddleware",
+    "inclusion_connect.middleware.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -187,6 +191,11 @@ STATICFILES_FINDERS = (
 STATICFILES_DIRS = (os.path.join(BASE_DIR, "static"),)
 
 # Session
+SESSION_ENGINE = "inclusion_connect.users.cached_sessions"
+# A session whose expiry alone changes is not written again before this delay.
+SESSION_EXPIRY_WRITE_TOLERANCE_SECS = 60
+# Cached sessions are read again from the database after this delay, should a change notification be lost.
+SESSION_CACHE_MAX_AGE_SECS = 60
 CSRF_USE_SESSIONS = True
 CSRF_FAILURE_VIEW = "inclusion_connect.views.csrf_failure"
 
@@ -217,7 +226,7 @@ LOGGING = {
         "console": {"class": "logging.StreamHandler"},
         "null": {"class": "logging.NullHandler"},
         "json_handler": {
-            "class": "logging.StreamHandler",
+            "class": "inclusion_connect.logging.StreamHandler",
             "formatter": "json_formatter",
         },
     },
@@ -260,10 +269,13 @@ if elasticsearch_url := os.getenv("ES_ADDON_URI"):
     LOGGING["handlers"]["elasticsearch"] = {
         "class": "inclusion_connect.logging.ElasticSearchHandler",
         "formatter": "json_formatter",
-        # Align buffer capacity on the default chunk_size for ElasticSearch.bulk.
-        "capacity": 500,
+        # Align batch size on the default chunk_size for ElasticSearch.bulk.
+        "batch_size": 500,
         "host": elasticsearch_url,
         "index_name": index_name,
+        # Spool failed batches instead of retrying, they are replayed once ElasticSearch is back.
+        "max_retries": 0,
+        "spool_dir": os.getenv("ES_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "inclusion_connect_logs")),
     }
     LOGGING["loggers"]["inclusion_connect"]["handlers"].append("elasticsearch")
 
@@ -322,13 +334,21 @@ LEGAL_NOTICES_PATH = "terms/Mentions légales_20230302.pdf"
 # Email https://anymail.readthedocs.io/en/stable/esps/mailjet/
 ANYMAIL = {
     # it's the default but our probes need this at import time.
-    "MAILJET_API_URL": "https://api.mailjet.com/v3.1/",
+    "MAILJET_API_URL": os.getenv("MAILJET_API_URL", "https://api.mailjet.com/v3.1/"),
     "MAILJET_API_KEY": os.getenv("API_MAILJET_KEY"),
     "MAILJET_SECRET_KEY": os.getenv("API_MAILJET_SECRET"),
     "WEBHOOK_SECRET": os.getenv("MAILJET_WEBHOOK_SECRET"),
 }
 
-EMAIL_BACKEND = "anymail.backends.mailjet.EmailBackend"
+# Emails are stored in the transaction of the request, then sent by the sendemails command.
+EMAIL_BACKEND = "inclusion_connect.outbox.backends.EmailBackend"
+OUTBOX_EMAIL_BACKEND = "anymail.backends.mailjet.EmailBackend"
+
+# Verification emails of an address: a repeated request within this delay reuses the previous email,
+VERIFICATION_EMAIL_COLLAPSE_SECS = int(os.getenv("VERIFICATION_EMAIL_COLLAPSE_SECS", "300"))
+# and at most VERIFICATION_EMAIL_MAX_SENDS emails are sent per VERIFICATION_EMAIL_COOLDOWN_SECS period.
+VERIFICATION_EMAIL_MAX_SENDS = int(os.getenv("VERIFICATION_EMAIL_MAX_SENDS", "5"))
+VERIFICATION_EMAIL_COOLDOWN_SECS = int(os.getenv("VERIFICATION_EMAIL_COOLDOWN_SECS", "3600"))
 
 # Django-oauth-toolkit
 # --------------------
@@ -338,6 +358,9 @@ oidc_rsa_private_key = Path("oidc.pem").read_text()
 OAUTH2_PROVIDER = {
     "OIDC_ENABLED": True,
     "OIDC_RSA_PRIVATE_KEY": oidc_rsa_private_key,
+    # JWT for the applications using JWT access tokens, see Application.jwt_access_tokens.
+    "ACCESS_TOKEN_GENERATOR": "inclusion_connect.oidc_overrides.access_tokens.generate_access_token",
+    "REFRESH_TOKEN_GENERATOR": "oauthlib.oauth2.rfc6749.tokens.random_token_generator",
     "SCOPES": {
         "openid": "OpenID Connect scope",
         "profile": "Profil utilisateur",
@@ -355,6 +378,15 @@ OAUTH2_PROVIDER_APPLICATION_MODEL = "oidc_overrides.Application"
 
 ALLOW_ALL_REDIRECT_URIS = os.getenv("ALLOW_ALL_REDIRECT_URIS") == "True"
 
+# A verified client_secret is not verified again (PBKDF2) by the process during this delay.
+OIDC_CLIENT_SECRET_CACHE_SECS = 60
+
+# The last login of a user to an application is not written more often than this.
+USER_APPLICATION_LINK_COALESCE_SECS = int(os.getenv("USER_APPLICATION_LINK_COALESCE_SECS", "300"))
+# Buffer the last logins in memory, written in bulk every USER_APPLICATION_LINK_FLUSH_SECS.
+USER_APPLICATION_LINK_BUFFERED = os.getenv("USER_APPLICATION_LINK_BUFFERED") == "True"
+USER_APPLICATION_LINK_FLUSH_SECS = 5
+
 # Keycloak Compatibility
 # ----------------------
 
@@ -421,3 +453,17 @@ PEAMA_USER_ENDPOINT = os.getenv("PEAMA_USER_ENDPOINT")
 PEAMA_SCOPES = os.getenv("PEAMA_SCOPES")
 PEAMA_JWKS_ENDPOINT = os.getenv("PEAMA_JWKS_ENDPOINT")
 PEAMA_LOGOUT_ENDPOINT = os.getenv("PEAMA_LOGOUT_ENDPOINT")
+
+# Timeouts in seconds of the calls to the identity providers: connection, then reading the response.
+FEDERATION_CONNECT_TIMEOUT = float(os.getenv("FEDERATION_CONNECT_TIMEOUT", "3.05"))
+FEDERATION_READ_TIMEOUT = float(os.getenv("FEDERATION_READ_TIMEOUT", "5"))
+# Connections kept open to each identity provider, per process.
+FEDERATION_HTTP_POOL_SIZE = int(os.getenv("FEDERATION_HTTP_POOL_SIZE", "10"))
+# Retries after a connection error, or a 502, 503 or 504 answer to an idempotent request.
+FEDERATION_HTTP_RETRIES = int(os.getenv("FEDERATION_HTTP_RETRIES", "2"))
+FEDERATION_HTTP_RETRY_BACKOFF = float(os.getenv("FEDERATION_HTTP_RETRY_BACKOFF", "0.2"))
+
+# The signing keys of the identity providers are cached by each process,
+FEDERATION_JWKS_CACHE_SECS = int(os.getenv("FEDERATION_JWKS_CACHE_SECS", "3600"))
+# and fetched again at most once per interval for an unknown key or an unreachable identity provider.
+FEDERATION_JWKS_REFRESH_INTERVAL_SECS = int(os.getenv("FEDERATION_JWKS_REFRESH_INTERVAL_SECS", "60"))
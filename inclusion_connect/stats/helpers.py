@@ -1,25 +1,69 @@
-from functools import lru_cache
+import collections
+import threading
+from functools import partial
 
+from django.db import transaction
 from django.utils import timezone
 
-from inclusion_connect.oidc_overrides.models import Application
+from inclusion_connect.oidc_overrides.registry import applications
 from inclusion_connect.stats.models import Stats
 from inclusion_connect.utils.oidc import oidc_params
+from inclusion_connect.utils.request_cache import request_cached
 
 
-@lru_cache
+class RecordedActions:
+    """Per-process LRU of the monthly actions known to be recorded, repeated actions skip the database."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._keys = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            try:
+                self._keys.move_to_end(key)
+            except KeyError:
+                return False
+            return True
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            if len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+recorded_actions = RecordedActions(maxsize=10_000)
+
+
+def record_action(user_id, application_id, action):
+    key = (user_id, application_id, timezone.localdate().replace(day=1), action)
+    if key in recorded_actions:
+        return
+    user_id, application_id, date, action = key
+    # INSERT … ON CONFLICT DO NOTHING, on the unique constraint.
+    Stats.objects.bulk_create(
+        [Stats(user_id=user_id, application_id=application_id, date=date, action=action)],
+        ignore_conflicts=True,
+    )
+    # The row is lost if the transaction is rolled back.
+    transaction.on_commit(partial(recorded_actions.add, key))
+
+
+@request_cached
 def get_application(request, next_url=None):
     try:
-        return Application.objects.get(client_id=oidc_params(request, next_url)["client_id"])
+        return applications.get(oidc_params(request, next_url)["client_id"])
     except KeyError:
         return None
 
 
 def account_action(user, action, request, next_url=None):
     if application := get_application(request, next_url):
-        Stats.objects.get_or_create(
-            user=user,
-            application=application,
-            date=timezone.localdate().replace(day=1),
-            action=action,
-        )
+        record_action(user.pk, application.pk, action)
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stats", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            DELETE FROM stats_stats
+            USING stats_stats AS kept
+            WHERE stats_stats.user_id = kept.user_id
+                AND stats_stats.application_id = kept.application_id
+                AND stats_stats.date = kept.date
+                AND stats_stats.action = kept.action
+                AND stats_stats.id > kept.id
+            """,
+            migrations.RunSQL.noop,
+            elidable=True,
+        ),
+        migrations.AddConstraint(
+            model_name="stats",
+            constraint=models.UniqueConstraint(
+                fields=("user", "application", "date", "action"), name="unique_stats_user_application_date_action"
+            ),
+        ),
+    ]
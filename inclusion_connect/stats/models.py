@@ -22,3 +22,11 @@ class Stats(models.Model):
     )
     date = models.DateField("date de l'action")
     action = models.TextField("action", choices=Actions.choices)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "application", "date", "action"],
+                name="unique_stats_user_application_date_action",
+            ),
+        ]
@@ -1,19 +1,18 @@
 import copy
 import logging
-from functools import partial
 
 from django import forms
 from django.contrib import admin
 from django.contrib.auth import admin as auth_admin, forms as auth_forms, password_validation
 from django.core.exceptions import ValidationError
-from django.db import transaction
 from django.db.models import F, Prefetch
 from django.forms.formsets import DELETION_FIELD_NAME
 from django.utils.html import format_html
 
-from inclusion_connect.logging import log_data
+from inclusion_connect.logging import log_data, log_event
 
-from .models import EmailAddress, User, UserApplicationLink
+from .models import EmailAddress, User, UserApplicationLink, VerificationEmailLedger
+from .sessions import delete_user_sessions
 
 
 logger = logging.getLogger("inclusion_connect.auth")
@@ -189,7 +188,7 @@ class UserChangeForm(auth_forms.UserChangeForm):
                 log["groups"]["removed"] = {}
                 for group in current_groups - new_groups:
                     log["groups"]["removed"][group.pk] = group.name
-        transaction.on_commit(partial(logger.info, log))
+        log_event(request, logger, log)
 
 
 @admin.register(User)
@@ -209,6 +208,7 @@ class UserAdmin(auth_admin.UserAdmin):
     inlines = [EmailAddressInline, UserApplicationLinkInline]
     change_password_form = AdminPasswordChangeForm
     search_fields = auth_admin.UserAdmin.search_fields + ("email_addresses__email",)
+    actions = ["logout_everywhere"]
     list_display = (
         "username",
         "email",
@@ -227,6 +227,18 @@ class UserAdmin(auth_admin.UserAdmin):
         else:
             return None
 
+    @admin.action(description="Déconnecter de toutes leurs sessions", permissions=["change"])
+    def logout_everywhere(self, request, queryset):
+        users = list(queryset)
+        delete_user_sessions(users)
+        for user in users:
+            log = log_data(request)
+            log["event"] = "admin_logout"
+            log["acting_user"] = request.user.pk
+            log["user"] = user.pk
+            log_event(request, logger, log)
+        self.message_user(request, f"{len(users)} utilisateur(s) déconnecté(s) de toutes leurs sessions.")
+
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
         if change:
@@ -236,7 +248,7 @@ class UserAdmin(auth_admin.UserAdmin):
             log["event"] = "admin_add"
             log["acting_user"] = request.user.pk
             log["user"] = form.instance.pk
-            transaction.on_commit(partial(logger.info, log))
+            log_event(request, logger, log)
 
     def construct_change_message(self, request, form, formsets, add=False):
         """
@@ -248,7 +260,7 @@ class UserAdmin(auth_admin.UserAdmin):
             log["event"] = "admin_change_password"
             log["acting_user"] = request.user.pk
             log["user"] = form.user.pk
-            transaction.on_commit(partial(logger.info, log))
+            log_event(request, logger, log)
         return change_message
 
     def get_fieldsets(self, request, obj=None):
@@ -306,3 +318,16 @@ class UserAdmin(auth_admin.UserAdmin):
         if getattr(obj, "is_superuser", False) and not request.user.is_superuser:
             return False
         return super().has_change_permission(request, obj)
+
+
+@admin.register(VerificationEmailLedger)
+class VerificationEmailLedgerAdmin(admin.ModelAdmin):
+    list_display = ("email", "last_sent_at", "sent", "collapsed", "rate_limited")
+    ordering = ["-last_sent_at"]
+    search_fields = ("email",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
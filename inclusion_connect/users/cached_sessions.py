@@ -0,0 +1,238 @@
+import copy
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.base import UpdateError
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.utils import timezone
+
+from inclusion_connect.users import sessions
+from inclusion_connect.utils.metrics import process_metrics
+
+
+logger = logging.getLogger("inclusion_connect.users.cached_sessions")
+
+NOTIFY_CHANNEL = "users_usersession"
+LISTEN_RETRY_DELAY_SECS = 5
+# The listen connection is checked after this delay without notifications.
+LISTEN_HEARTBEAT_SECS = 10
+# Detect a dead listen connection, e.g. dropped by a NAT, on which notifications would silently stop.
+LISTEN_CONNECTION_PARAMS = {
+    "keepalives": 1,
+    "keepalives_idle": 10,
+    "keepalives_interval": 5,
+    "keepalives_count": 3,
+    "tcp_user_timeout": 30_000,
+}
+
+
+class CachedSession(NamedTuple):
+    version: int
+    expire_date: datetime.datetime
+    # Never mutated, the stores work on copies.
+    data: dict
+
+
+class SessionCache:
+    """
+    Per-process LRU of the decoded database sessions, with their version.
+
+    The cache is only read while listening to the changes made by other processes: the users_usersession trigger
+    notifies each update and delete, with the new version. See :meth:`listen`. Sessions cached for more than
+    SESSION_CACHE_MAX_AGE_SECS are read again from the database, in case a notification was lost.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        # Prevents storing a session read or written before a concurrent eviction.
+        self.generation = 0
+        self._listening = False
+        self._listener = None
+        self._listen_connection = None
+        self._stopped = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        # Database rows, the anonymous sessions are signed cookies.
+        self.rows_created = 0
+
+    def get(self, session_key):
+        if not self._listening:
+            return None
+        with self._lock:
+            try:
+                cached_at, cached = self._sessions[session_key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if (
+                cached.expire_date <= timezone.now()
+                or time.monotonic() - cached_at > settings.SESSION_CACHE_MAX_AGE_SECS
+            ):
+                del self._sessions[session_key]
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_key)
+            self.hits += 1
+            return cached
+
+    def set(self, session_key, cached, generation):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._sessions[session_key] = (time.monotonic(), cached)
+            self._sessions.move_to_end(session_key)
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+
+    def evict(self, session_key, version=None):
+        """Drop session_key, unless the cached version is at least version."""
+        with self._lock:
+            self.generation += 1
+            _cached_at, cached = self._sessions.get(session_key, (None, None))
+            if cached is not None and (version is None or cached.version < version):
+                del self._sessions[session_key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._sessions = OrderedDict()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._sessions),
+            "rows_created": self.rows_created,
+        }
+
+    def listen(self):
+        """
+        Evict the sessions changed by other processes.
+
+        Must be called in each worker process, after the fork.
+        """
+        self._stopped.clear()
+        self._listener = threading.Thread(target=self._listen, name="session-cache", daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._listening = False
+        if self._listen_connection is not None:
+            # Interrupts the blocking wait for notifications.
+            self._listen_connection.close()
+        if self._listener is not None:
+            self._listener.join()
+            self._listener = None
+
+    def _listen(self):
+        db = connections[DEFAULT_DB_ALIAS]
+        while not self._stopped.is_set():
+            try:
+                self._listen_connection = db.get_new_connection(db.get_connection_params() | LISTEN_CONNECTION_PARAMS)
+                with self._listen_connection as conn:
+                    conn.autocommit = True
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    # Notifications are lost while disconnected.
+                    self.clear()
+                    self._listening = True
+                    while not self._stopped.is_set():
+                        for notify in conn.notifies(timeout=LISTEN_HEARTBEAT_SECS):
+                            session_key, _, version = notify.payload.partition(":")
+                            self.evict(session_key, int(version) if version else None)
+                        # Raises when the connection is dead, instead of waiting forever for notifications.
+                        conn.execute("SELECT 1")
+            except Exception:
+                self._listening = False
+                if self._stopped.is_set():
+                    break
+                logger.exception("Session cache listener disconnected.")
+                self._stopped.wait(LISTEN_RETRY_DELAY_SECS)
+        self._listen_connection = None
+
+
+session_cache = SessionCache(maxsize=5_000)
+process_metrics.register("sessions", session_cache.stats)
+
+
+class SessionStore(sessions.SessionStore):
+    """
+    Database session engine with a per-process cache of the decoded sessions, see :class:`SessionCache`.
+
+    Updates are written through to the database and increment the session version. An update is skipped when the
+    data is unchanged and the expiry moves by less than SESSION_EXPIRY_WRITE_TOLERANCE_SECS.
+    """
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # The session as loaded or last saved.
+        self._stored = None
+
+    def load(self):
+        if sessions.is_signed(self.session_key):
+            return super().load()
+        cached = session_cache.get(self.session_key)
+        if cached is None:
+            generation = session_cache.generation
+            obj = self._get_session_from_db()
+            if obj is None:
+                return {}
+            cached = CachedSession(obj.version, obj.expire_date, self.decode(obj.session_data))
+            session_cache.set(obj.session_key, cached, generation)
+        self._stored = cached
+        return copy.deepcopy(cached.data)
+
+    def _save_database(self, must_create):
+        generation = session_cache.generation
+        if must_create:
+            super()._save_database(must_create)
+            session_cache.rows_created += 1
+            self._stored = CachedSession(1, self.get_expiry_date(), copy.deepcopy(self._session))
+            session_cache.set(self.session_key, self._stored, generation)
+            return
+        data = self._get_session()
+        expire_date = self.get_expiry_date()
+        stored = self._stored
+        tolerance = datetime.timedelta(seconds=settings.SESSION_EXPIRY_WRITE_TOLERANCE_SECS)
+        if stored is not None and data == stored.data and expire_date - stored.expire_date < tolerance:
+            return
+        version = self._update(data, expire_date)
+        self._stored = CachedSession(version, expire_date, copy.deepcopy(data))
+        if stored is not None and version == stored.version + 1:
+            session_cache.set(self.session_key, self._stored, generation)
+        else:
+            # Updated concurrently by another process, whose changes are overwritten.
+            session_cache.evict(self.session_key)
+
+    def _update(self, data, expire_date):
+        """Write the session through, return its new version."""
+        model = self.model
+        with connections[router.db_for_write(model)].cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {model._meta.db_table}
+                SET session_data = %s, expire_date = %s, user_id = %s, version = version + 1
+                WHERE session_key = %s
+                RETURNING version
+                """,
+                [self.encode(data), expire_date, data.get(SESSION_KEY), self.session_key],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise UpdateError
+        return row[0]
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            session_key = self.session_key
+        super().delete(session_key)
+        if session_key is not None:
+            session_cache.evict(session_key)
@@ -0,0 +1,118 @@
+import atexit
+import datetime
+import logging
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from inclusion_connect.users.models import UserApplicationLink
+
+
+logger = logging.getLogger("inclusion_connect.users.last_logins")
+
+
+def upsert_last_logins(last_logins):
+    """
+    Create the links of the users to the applications, or update their last login, in a single query.
+
+    Last logins updated less than USER_APPLICATION_LINK_COALESCE_SECS before are left untouched, skipping the write.
+    Last logins of users or applications deleted meanwhile are skipped.
+
+    :param last_logins: iterable of (user_id, application_id, last_login).
+    """
+    last_logins = list(last_logins)
+    if not last_logins:
+        return
+    opts = UserApplicationLink._meta
+    user_field = opts.get_field("user")
+    application_field = opts.get_field("application")
+    user_column = user_field.column
+    application_column = application_field.column
+    last_login_column = opts.get_field("last_login").column
+    user_opts = user_field.related_model._meta
+    application_opts = application_field.related_model._meta
+    values = ", ".join(["(%s, %s, %s)"] * len(last_logins))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {opts.db_table} ({user_column}, {application_column}, {last_login_column})
+            SELECT last_logins.user_id, last_logins.application_id, last_logins.last_login
+            FROM (VALUES {values}) AS last_logins (user_id, application_id, last_login)
+            JOIN {user_opts.db_table} ON {user_opts.db_table}.{user_opts.pk.column} = last_logins.user_id
+            JOIN {application_opts.db_table}
+                ON {application_opts.db_table}.{application_opts.pk.column} = last_logins.application_id
+            ON CONFLICT ({user_column}, {application_column}) DO UPDATE
+            SET {last_login_column} = EXCLUDED.{last_login_column}
+            WHERE {opts.db_table}.{last_login_column} < EXCLUDED.{last_login_column} - %s
+            """,
+            [param for last_login in last_logins for param in last_login]
+            + [datetime.timedelta(seconds=settings.USER_APPLICATION_LINK_COALESCE_SECS)],
+        )
+
+
+class LastLoginBuffer:
+    """
+    Last logins of the users to the applications, written in bulk every USER_APPLICATION_LINK_FLUSH_SECS.
+
+    Must be started in each worker process, after the fork. Last logins are written directly until then.
+    """
+
+    def __init__(self):
+        self._last_logins = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stopped = threading.Event()
+
+    def add(self, user_id, application_id, last_login):
+        if self._flusher is None:
+            upsert_last_logins([(user_id, application_id, last_login)])
+            return
+        # Not recorded when the transaction is rolled back.
+        transaction.on_commit(partial(self._add, (user_id, application_id), last_login))
+
+    def _add(self, key, last_login):
+        with self._lock:
+            self._last_logins[key] = max(last_login, self._last_logins.get(key, last_login))
+
+    def flush(self):
+        with self._lock:
+            last_logins, self._last_logins = self._last_logins, {}
+        upsert_last_logins(
+            (user_id, application_id, last_login) for (user_id, application_id), last_login in last_logins.items()
+        )
+
+    def start(self):
+        self._stopped.clear()
+        self._flusher = threading.Thread(target=self._flush_periodically, name="last-login-buffer", daemon=True)
+        self._flusher.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._flusher is not None:
+            self._stopped.set()
+            self._flusher.join()
+            self._flusher = None
+
+    def _flush_periodically(self):
+        while True:
+            stopping = self._stopped.wait(settings.USER_APPLICATION_LINK_FLUSH_SECS)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not write the last logins.")
+            finally:
+                # The thread has its own database connection.
+                close_old_connections()
+            if stopping:
+                connection.close()
+                return
+
+
+last_logins = LastLoginBuffer()
+
+
+def record_last_login(user, application):
+    last_logins.add(user.pk, application.pk, timezone.now())
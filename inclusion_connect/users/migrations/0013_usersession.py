@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.base import SessionBase
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def copy_ongoing_sessions(apps, schema_editor):
+    Session = apps.get_model("sessions", "Session")
+    User = apps.get_model("users", "User")
+    UserSession = apps.get_model("users", "UserSession")
+    decoder = SessionBase()
+    existing_users = {str(pk) for pk in User.objects.values_list("pk", flat=True)}
+    user_sessions = []
+    for session in Session.objects.filter(expire_date__gte=timezone.now()).iterator():
+        user_id = decoder.decode(session.session_data).get(SESSION_KEY)
+        user_sessions.append(
+            UserSession(
+                session_key=session.session_key,
+                session_data=session.session_data,
+                expire_date=session.expire_date,
+                user_id=user_id if user_id in existing_users else None,
+            )
+        )
+    UserSession.objects.bulk_create(user_sessions, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sessions", "0001_initial"),
+        ("users", "0012_user_federation_id_token_hint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserSession",
+            fields=[
+                (
+                    "session_key",
+                    models.CharField(max_length=40, primary_key=True, serialize=False, verbose_name="session key"),
+                ),
+                ("session_data", models.TextField(verbose_name="session data")),
+                ("expire_date", models.DateTimeField(db_index=True, verbose_name="expire date")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sessions",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="utilisateur",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "session",
+                "verbose_name_plural": "sessions",
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(copy_ongoing_sessions, migrations.RunPython.noop, elidable=True),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:36
+
+from django.db import migrations, models
+
+
+# Broadcast the updated and deleted sessions to the processes caching them, with the new version.
+CREATE_NOTIFY_TRIGGER = """
+CREATE FUNCTION users_usersession_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('users_usersession', OLD.session_key);
+    ELSE
+        PERFORM pg_notify('users_usersession', NEW.session_key || ':' || NEW.version);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_usersession_notify
+AFTER UPDATE OR DELETE ON users_usersession
+FOR EACH ROW EXECUTE FUNCTION users_usersession_notify();
+"""
+
+DROP_NOTIFY_TRIGGER = """
+DROP TRIGGER users_usersession_notify ON users_usersession;
+DROP FUNCTION users_usersession_notify();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0013_usersession"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usersession",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunSQL(CREATE_NOTIFY_TRIGGER, DROP_NOTIFY_TRIGGER),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:25
+
+import django.contrib.postgres.fields.citext
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0014_usersession_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VerificationEmailLedger",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "email",
+                    django.contrib.postgres.fields.citext.CIEmailField(
+                        max_length=254, unique=True, verbose_name="adresse e-mail"
+                    ),
+                ),
+                ("registration", models.BooleanField(default=True, verbose_name="inscription")),
+                ("last_sent_at", models.DateTimeField(verbose_name="dernier envoi")),
+                ("window_start", models.DateTimeField(verbose_name="début de la période d’envoi")),
+                ("sent", models.PositiveIntegerField(default=0, verbose_name="envois sur la période")),
+                (
+                    "collapsed",
+                    models.PositiveIntegerField(default=0, verbose_name="envois fusionnés avec le précédent"),
+                ),
+                ("rate_limited", models.PositiveIntegerField(default=0, verbose_name="envois refusés")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="utilisateur",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "envois d’e-mails de vérification",
+                "verbose_name_plural": "envois d’e-mails de vérification",
+            },
+        ),
+    ]
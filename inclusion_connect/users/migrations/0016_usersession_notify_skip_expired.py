@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+# Expired sessions are never read from the cache: deleting them, e.g. with purgeexpired, notifies nobody.
+CREATE_NOTIFY_TRIGGER = """
+DROP TRIGGER users_usersession_notify ON users_usersession;
+CREATE TRIGGER users_usersession_notify
+AFTER UPDATE OR DELETE ON users_usersession
+FOR EACH ROW WHEN (OLD.expire_date > now()) EXECUTE FUNCTION users_usersession_notify();
+"""
+
+DROP_NOTIFY_TRIGGER = """
+DROP TRIGGER users_usersession_notify ON users_usersession;
+CREATE TRIGGER users_usersession_notify
+AFTER UPDATE OR DELETE ON users_usersession
+FOR EACH ROW EXECUTE FUNCTION users_usersession_notify();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0015_verificationemailledger"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_NOTIFY_TRIGGER, DROP_NOTIFY_TRIGGER),
+    ]
@@ -4,6 +4,7 @@ import uuid
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.postgres.fields import CIEmailField
+from django.contrib.sessions.base_session import AbstractBaseSession
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
@@ -141,6 +142,37 @@ class EmailAddress(models.Model):
         self.save()
 
 
+class VerificationEmailLedger(models.Model):
+    """
+    Verification emails sent to an address, see :func:`inclusion_connect.accounts.emails.send_verification_email`.
+
+    Not tied to an EmailAddress, the address may not be saved yet and the limits must survive its deletion.
+    """
+
+    email = CIEmailField("adresse e-mail", unique=True)
+    # Recipient of the last email, a new email is sent when it changes.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name="utilisateur",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    registration = models.BooleanField("inscription", default=True)
+    last_sent_at = models.DateTimeField("dernier envoi")
+    window_start = models.DateTimeField("début de la période d’envoi")
+    sent = models.PositiveIntegerField("envois sur la période", default=0)
+    collapsed = models.PositiveIntegerField("envois fusionnés avec le précédent", default=0)
+    rate_limited = models.PositiveIntegerField("envois refusés", default=0)
+
+    class Meta:
+        verbose_name = "envois d’e-mails de vérification"
+        verbose_name_plural = "envois d’e-mails de vérification"
+
+    def __str__(self):
+        return f"{self.email}: {self.sent} sent since {self.window_start}"
+
+
 class UserApplicationLink(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -163,3 +195,33 @@ class UserApplicationLink(models.Model):
 
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.application}"
+
+
+class UserSession(AbstractBaseSession):
+    """
+    Database session aware of the authenticated user.
+
+    Maintained by :class:`inclusion_connect.users.sessions.SessionStore`, it allows to find all the sessions of a
+    user with an indexed query instead of decoding every session.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name="utilisateur",
+        related_name="sessions",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    # Incremented by each update, see inclusion_connect.users.cached_sessions.
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta(AbstractBaseSession.Meta):
+        verbose_name = "session"
+        verbose_name_plural = "sessions"
+
+    @classmethod
+    def get_session_store_class(cls):
+        from inclusion_connect.users.sessions import SessionStore
+
+        return SessionStore
@@ -0,0 +1,94 @@
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends import db
+from django.core import signing
+
+from inclusion_connect.users.models import UserSession
+
+
+SIGNED_SESSION_SALT = "inclusion_connect.users.sessions"
+# Browsers drop cookies larger than 4 kB, with their name and attributes.
+MAX_SIGNED_SESSION_SIZE = 3_500
+
+
+def is_signed(session_key):
+    # Database keys are alphanumeric, signed sessions contain the separator of the signature.
+    return session_key is not None and ":" in session_key
+
+
+class SessionStore(db.SessionStore):
+    """
+    Database session engine keeping track of the user owning the session.
+
+    The user is updated each time the session is saved, which covers login, logout (the session is flushed) and
+    session key cycling. Expired sessions are still purged with ``clearsessions``.
+
+    Anonymous sessions (e.g. the OIDC parameters and the CSRF secret of a login page) are signed and stored in the
+    session cookie, like the signed_cookies engine. They are promoted to a database row on authentication, or when
+    they are too large for a cookie.
+    """
+
+    @classmethod
+    def get_model_class(cls):
+        return UserSession
+
+    def create_model_instance(self, data):
+        obj = super().create_model_instance(data)
+        obj.user_id = data.get(SESSION_KEY)
+        return obj
+
+    def load(self):
+        if not is_signed(self.session_key):
+            return super().load()
+        try:
+            return signing.loads(
+                self.session_key,
+                salt=SIGNED_SESSION_SALT,
+                serializer=self.serializer,
+                max_age=self.get_session_cookie_age(),
+            )
+        except signing.BadSignature:
+            self._session_key = None
+            return {}
+
+    def create(self):
+        # The key is allocated when the session is saved, in the database for authenticated sessions only.
+        self._session_key = None
+        self.modified = True
+
+    def save(self, must_create=False):
+        data = self._get_session(no_load=must_create)
+        if SESSION_KEY not in data:
+            signed_session = signing.dumps(data, salt=SIGNED_SESSION_SALT, serializer=self.serializer, compress=True)
+            if len(signed_session) <= MAX_SIGNED_SESSION_SIZE:
+                # The user was removed from a database session without flushing it.
+                self.delete()
+                self._session_key = signed_session
+                return
+        if self._session_key is None or is_signed(self._session_key):
+            # Allocate a database key, create() saves again with must_create.
+            return super().create()
+        self._save_database(must_create)
+
+    def _save_database(self, must_create):
+        super().save(must_create)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            session_key = self.session_key
+        if is_signed(session_key):
+            # Stored in the cookie.
+            return
+        super().delete(session_key)
+
+
+def delete_user_sessions(users):
+    """Log the users out of all their sessions, evicting them from the session cache of the process."""
+    # Circular import.
+    from inclusion_connect.users.cached_sessions import session_cache
+
+    sessions = UserSession.objects.filter(user__in=users)
+    session_keys = list(sessions.values_list("session_key", flat=True))
+    deleted = sessions.delete()
+    for session_key in session_keys:
+        session_cache.evict(session_key)
+    return deleted
@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.urls import Resolver404, resolve
+from django.views.decorators.csrf import csrf_exempt
+
+from inclusion_connect.utils.request_cache import request_cached
+
+
+def lightweight(view_func):
+    """
+    Mark a read-only view, served without the ATOMIC_REQUESTS transaction, the CSRF check and the account
+    middlewares, which load the session and the user.
+
+    The view must not use request.session nor request.user. Decorate class-based views with
+    method_decorator(lightweight, name="dispatch").
+    """
+    view_func = csrf_exempt(transaction.non_atomic_requests(view_func))
+    view_func.lightweight = True
+    return view_func
+
+
+@request_cached
+def is_lightweight(request):
+    """Whether the view serving the request is marked lightweight, known before the middlewares call it."""
+    try:
+        match = resolve(request.path_info, getattr(request, "urlconf", None))
+    except Resolver404:
+        return False
+    return getattr(match.func, "lightweight", False)
@@ -0,0 +1,50 @@
+import logging
+import threading
+
+from django.core.signals import request_finished
+
+
+logger = logging.getLogger("inclusion_connect.metrics")
+
+METRICS_REQUESTS = 1_000
+
+
+class ProcessMetrics:
+    """
+    Statistics of the per-process caches and clients, logged every METRICS_REQUESTS requests.
+
+    Each cache registers a callable returning its statistics, the counters keep growing for the life of the process.
+    """
+
+    def __init__(self):
+        self._sources = {}
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def register(self, name, stats):
+        self._sources[name] = stats
+
+    def request(self):
+        with self._lock:
+            self._requests += 1
+            if self._requests < METRICS_REQUESTS:
+                return
+            self._requests = 0
+        logger.info({"event": "process_metrics", **self.stats()})
+
+    def stats(self):
+        return {name: stats() for name, stats in self._sources.items()}
+
+    def clear(self):
+        with self._lock:
+            self._requests = 0
+
+
+process_metrics = ProcessMetrics()
+
+
+def count_request(sender, **kwargs):
+    process_metrics.request()
+
+
+request_finished.connect(count_request, dispatch_uid="inclusion_connect.utils.metrics")
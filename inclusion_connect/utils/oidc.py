@@ -1,25 +1,29 @@
-from functools import lru_cache
+import functools
 
 from django.urls import reverse
 
 from inclusion_connect.accounts.middleware import required_action_url
+from inclusion_connect.utils.request_cache import request_cached
 from inclusion_connect.utils.urls import get_url_params
 
 
 OIDC_SESSION_KEY = "oidc_params"
 
 
+@functools.cache
+def oidc_paths():
+    """Paths of the views receiving the OIDC parameters, reversed once per process."""
+    return (
+        reverse("oauth2_provider:authorize"),
+        reverse("oauth2_provider:register"),
+        reverse("oauth2_provider:activate"),
+    )
+
+
 def oidc_params(request, next_url=None):
     session_params = request.session.get(OIDC_SESSION_KEY, {})
     if not session_params and next_url:
-        if any(
-            next_url.startswith(path)
-            for path in [
-                reverse("oauth2_provider:authorize"),
-                reverse("oauth2_provider:register"),
-                reverse("oauth2_provider:activate"),
-            ]
-        ):
+        if next_url.startswith(oidc_paths()):
             return get_url_params(next_url)
     return session_params
 
@@ -34,7 +38,7 @@ def initial_from_login_hint(request):
     return {}
 
 
-@lru_cache
+@request_cached
 def get_next_url(request):
     if not request.user.is_authenticated:
         return None
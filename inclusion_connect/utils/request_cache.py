@@ -0,0 +1,32 @@
+import functools
+
+
+REQUEST_CACHE_ATTR = "_request_cache"
+
+
+def request_cached(func):
+    """
+    Memoize func, taking the request as first argument, for the duration of the request.
+
+    Values are stored on the request itself and released with it, unlike a process-wide cache keyed by request.
+    """
+
+    @functools.wraps(func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            cache = getattr(request, REQUEST_CACHE_ATTR)
+        except AttributeError:
+            cache = {}
+            setattr(request, REQUEST_CACHE_ATTR, cache)
+        key = (func, args, tuple(sorted(kwargs.items())))
+        try:
+            return cache[key]
+        except KeyError:
+            value = cache[key] = func(request, *args, **kwargs)
+            return value
+
+    return wrapper
+
+
+def clear_request_cache(request):
+    request.__dict__.pop(REQUEST_CACHE_ATTR, None)
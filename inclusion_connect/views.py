@@ -1,6 +1,7 @@
 from django.shortcuts import render
 from django.urls import reverse
 
+from inclusion_connect.utils.lightweight import lightweight
 from inclusion_connect.utils.urls import add_url_params
 
 
@@ -13,5 +14,6 @@ def csrf_failure(request, template_name="403_csrf.html", **kwargs):
     return render(request, template_name, context=context, status=403)
 
 
+@lightweight
 def home(request, template_name="homepage.html", **kwargs):
     return render(request, template_name)
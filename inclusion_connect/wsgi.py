@@ -15,3 +15,23 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "inclusion_connect.settings.base")
 
 application = get_wsgi_application()
+
+try:
+    import uwsgidecorators
+except ImportError:
+    # Not running under uWSGI.
+    pass
+else:
+
+    @uwsgidecorators.postfork
+    def start_worker_threads():
+        from django.conf import settings
+
+        from inclusion_connect.oidc_overrides.registry import applications
+        from inclusion_connect.users.cached_sessions import session_cache
+        from inclusion_connect.users.last_logins import last_logins
+
+        applications.listen()
+        session_cache.listen()
+        if settings.USER_APPLICATION_LINK_BUFFERED:
+            last_logins.start()
@@ -26,7 +26,7 @@ from pytest_django.asserts import (
 from inclusion_connect.accounts.tokens import email_verification_token
 from inclusion_connect.accounts.views import EMAIL_CONFIRM_KEY, PasswordResetView
 from inclusion_connect.oidc_federation.enums import Federation
-from inclusion_connect.users.models import EmailAddress, User
+from inclusion_connect.users.models import EmailAddress, User, VerificationEmailLedger
 from inclusion_connect.utils.oidc import OIDC_SESSION_KEY
 from inclusion_connect.utils.urls import add_url_params
 from tests.asserts import assertMessages, assertRecords
@@ -223,6 +223,28 @@ class TestLoginView:
             ],
         )
 
+    def test_email_not_verified_rate_limited(self, client, mailoutbox):
+        user_email = "me@mailinator.com"
+        user = UserFactory(email="")
+        EmailAddress.objects.create(user=user, email=user_email)
+        VerificationEmailLedger.objects.create(
+            email=user_email,
+            user=user,
+            last_sent_at=timezone.now() - datetime.timedelta(seconds=settings.VERIFICATION_EMAIL_COLLAPSE_SECS),
+            window_start=timezone.now(),
+            sent=settings.VERIFICATION_EMAIL_MAX_SENDS,
+        )
+
+        response = client.post(reverse("accounts:login"), data={"email": user_email, "password": DEFAULT_PASSWORD})
+        assert response.status_code == 200
+        assertContains(
+            response,
+            "Un compte inactif avec cette adresse e-mail existe déjà, trop d’e-mails de vérification ont été "
+            "envoyés, réessayez plus tard.",
+            count=1,
+        )
+        assert mailoutbox == []
+
     def test_login_hint(self, caplog, client):
         redirect_url = reverse("oauth2_provider:rp-initiated-logout")
         url = add_url_params(reverse("accounts:login"), {"next": redirect_url})
@@ -519,6 +541,37 @@ class TestRegisterView:
             ],
         )
 
+    def test_error_email_not_verified_rate_limited(self, client, mailoutbox):
+        user = UserFactory(email="")
+        user_email = "me@mailinator.com"
+        EmailAddress.objects.create(user=user, email=user_email)
+        VerificationEmailLedger.objects.create(
+            email=user_email,
+            user=user,
+            last_sent_at=timezone.now() - datetime.timedelta(seconds=settings.VERIFICATION_EMAIL_COLLAPSE_SECS),
+            window_start=timezone.now(),
+            sent=settings.VERIFICATION_EMAIL_MAX_SENDS,
+        )
+
+        response = client.post(
+            reverse("accounts:register"),
+            data={
+                "email": user_email,
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "password1": DEFAULT_PASSWORD,
+                "password2": DEFAULT_PASSWORD,
+                "terms_accepted": "on",
+            },
+        )
+        assertContains(
+            response,
+            "Un compte inactif avec cette adresse e-mail existe déjà, trop d’e-mails de vérification ont été "
+            "envoyés, réessayez plus tard.",
+            count=1,
+        )
+        assert mailoutbox == []
+
     def test_error_email_not_verified(self, caplog, client, mailoutbox):
         redirect_url = reverse("oauth2_provider:rp-initiated-logout")
         url = add_url_params(reverse("accounts:register"), {"next": redirect_url})
@@ -1824,6 +1877,85 @@ class TestConfirmEmailView:
         assert email.to == [user_email]
         assert email.subject == "Vérification de l’adresse e-mail"
 
+    @override_settings(
+        VERIFICATION_EMAIL_COLLAPSE_SECS=60,
+        VERIFICATION_EMAIL_MAX_SENDS=2,
+        VERIFICATION_EMAIL_COOLDOWN_SECS=600,
+    )
+    def test_post_repeatedly(self, caplog, client, mailoutbox):
+        user = UserFactory(email="")
+        user_email = "me@mailinator.com"
+        EmailAddress.objects.create(email=user_email, user=user)
+        session = client.session
+        session["email_to_confirm"] = user_email
+        session.save()
+        email_confirmation_url = reverse("accounts:confirm-email")
+        with freeze_time("2023-05-05 10:00:00") as frozen_time:
+            client.post(email_confirmation_url, follow=True)
+            assert len(mailoutbox) == 1
+            caplog.clear()
+
+            # The email that was just sent is reused.
+            response = client.post(email_confirmation_url, follow=True)
+            assertMessages(response, [(messages.SUCCESS, "E-mail de vérification envoyé.")])
+            assert len(mailoutbox) == 1
+            assertRecords(
+                caplog,
+                [
+                    (
+                        "inclusion_connect.auth",
+                        logging.INFO,
+                        {"event": "send_verification_email_collapsed", "user": user.pk},
+                    ),
+                    ("inclusion_connect.auth", logging.INFO, {"event": "send_verification_email", "user": user.pk}),
+                ],
+            )
+
+            frozen_time.tick(datetime.timedelta(seconds=60))
+            client.post(email_confirmation_url, follow=True)
+            assert len(mailoutbox) == 2
+
+            frozen_time.tick(datetime.timedelta(seconds=60))
+            caplog.clear()
+            response = client.post(email_confirmation_url, follow=True)
+            assertMessages(
+                response,
+                [(messages.ERROR, "Trop d’e-mails de vérification ont été envoyés, réessayez plus tard.")],
+            )
+            assert len(mailoutbox) == 2
+            assertRecords(
+                caplog,
+                [
+                    (
+                        "inclusion_connect.auth",
+                        logging.INFO,
+                        {"event": "send_verification_email_rate_limited", "user": user.pk},
+                    ),
+                    ("inclusion_connect.auth", logging.INFO, {"event": "send_verification_email", "user": user.pk}),
+                ],
+            )
+
+            # Once the cooldown elapsed.
+            frozen_time.move_to("2023-05-05 10:10:00")
+            client.post(email_confirmation_url, follow=True)
+            assert len(mailoutbox) == 3
+
+        ledger = VerificationEmailLedger.objects.get(email=user_email)
+        assert (ledger.sent, ledger.collapsed, ledger.rate_limited) == (1, 1, 1)
+
+    def test_post_for_another_user(self, client, mailoutbox):
+        user_email = "me@mailinator.com"
+        email_address = EmailAddress.objects.create(email=user_email, user=UserFactory(email=""))
+        session = client.session
+        session["email_to_confirm"] = user_email
+        session.save()
+        client.post(reverse("accounts:confirm-email"))
+        # The address was freed and registered by another user.
+        email_address.delete()
+        EmailAddress.objects.create(email=user_email, user=UserFactory(email=""))
+        client.post(reverse("accounts:confirm-email"))
+        assert len(mailoutbox) == 2
+
 
 class TestConfirmEmailTokenView:
     @staticmethod
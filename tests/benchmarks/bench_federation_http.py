@@ -0,0 +1,72 @@
+import datetime
+import ipaddress
+import ssl
+import time
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from inclusion_connect.oidc_federation.http import FederationHTTPClient
+from tests.oidc_federation.fake_peama import FakePeama
+
+
+REQUESTS = 200
+
+
+def self_signed_certificate(tmp_path):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.UTC)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False
+        )
+        .sign(key, hashes.SHA256())
+    )
+    cert_file = tmp_path / "cert.pem"
+    key_file = tmp_path / "key.pem"
+    cert_file.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_file.write_bytes(
+        key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    )
+    return cert_file, key_file
+
+
+def measure(server, get):
+    """Requests per second and TLS connections opened."""
+    server.client_ports.clear()
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        assert get().status_code == 204
+    elapsed = time.perf_counter() - start
+    return REQUESTS / elapsed, len(set(server.client_ports))
+
+
+def test_federation_http_connection_reuse(tmp_path):
+    cert_file, key_file = self_signed_certificate(tmp_path)
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_file, key_file)
+    with FakePeama() as server:
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        url = f"https://127.0.0.1:{server.server_address[1]}/logout"
+
+        fresh, fresh_connections = measure(server, lambda: requests.get(url, verify=cert_file, timeout=5))
+        client = FederationHTTPClient()
+        pooled, pooled_connections = measure(server, lambda: client.get("logout", url, verify=cert_file))
+
+    print()
+    print(f"requests.get: {fresh:.0f} requests/s, {fresh_connections} TLS connections")
+    print(f"FederationHTTPClient: {pooled:.0f} requests/s, {pooled_connections} TLS connections")
+    print(f"Latency: {client.stats()['logout']['buckets']}")
+    assert pooled_connections == 1
+    assert fresh_connections == REQUESTS
@@ -0,0 +1,88 @@
+import datetime
+import logging
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+
+from inclusion_connect import views
+from inclusion_connect.oidc_overrides import views as oidc_views
+from inclusion_connect.urls import urlpatterns as inclusion_connect_urlpatterns
+from tests.oidc_overrides.factories import ApplicationFactory
+from tests.users.factories import UserFactory
+
+
+REQUESTS = 50
+
+
+def unmarked(view_class):
+    """The view without the lightweight marker of its dispatch method."""
+
+    class View(view_class):
+        def dispatch(self, request, *args, **kwargs):
+            return super().dispatch(request, *args, **kwargs)
+
+    return View.as_view()
+
+
+def home(request):
+    return views.home(request)
+
+
+ENDPOINTS = {
+    "homepage": "",
+    "discovery": "auth/.well-known/openid-configuration/",
+    "jwks": "auth/.well-known/jwks.json",
+    "userinfo": "auth/userinfo/",
+}
+
+urlpatterns = [
+    path("unmarked/", home),
+    path(f"unmarked/{ENDPOINTS['discovery']}", unmarked(oidc_views.ConnectDiscoveryInfoView)),
+    path(f"unmarked/{ENDPOINTS['jwks']}", unmarked(oidc_views.JwksInfoView)),
+    path(f"unmarked/{ENDPOINTS['userinfo']}", unmarked(oidc_views.UserInfoView)),
+    *inclusion_connect_urlpatterns,
+]
+
+
+def measure(client, url, headers):
+    """Database round trips per request and requests per second."""
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            response = client.get(url, headers=headers)
+            assert response.status_code == 200
+        elapsed = time.perf_counter() - start
+    return len(ctx.captured_queries) / REQUESTS, REQUESTS / elapsed
+
+
+@pytest.mark.urls(__name__)
+def test_lightweight_endpoints(client):
+    user = UserFactory()
+    access_token = ApplicationFactory().accesstoken_set.create(
+        user=user,
+        token="access",
+        expires=timezone.now() + datetime.timedelta(minutes=30),
+        scope="openid profile email",
+    )
+    # A logged in browser, whose session cookie is sent with every request.
+    client.force_login(user)
+    headers = {"Authorization": f"Bearer {access_token.token}"}
+
+    logging.disable(logging.INFO)
+    try:
+        print()
+        for name, endpoint in ENDPOINTS.items():
+            unmarked_queries, unmarked_throughput = measure(client, f"/unmarked/{endpoint}", headers)
+            queries, throughput = measure(client, f"/{endpoint}", headers)
+            print(
+                f"{name}: {unmarked_queries:.0f} → {queries:.0f} round trips per request, "
+                f"{unmarked_throughput:.0f} → {throughput:.0f} req/s"
+            )
+            # The transaction (savepoints in tests), the session and the user.
+            assert unmarked_queries - queries >= 3
+    finally:
+        logging.disable(logging.NOTSET)
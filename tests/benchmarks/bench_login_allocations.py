@@ -0,0 +1,126 @@
+import functools
+import io
+import logging
+import time
+import tracemalloc
+
+from django.urls import reverse
+
+from inclusion_connect.logging import AuditEvents, log_data
+from inclusion_connect.utils.urls import add_url_params, get_url_params
+from tests.users.factories import DEFAULT_PASSWORD, UserFactory
+
+
+def reference_log_data(request, next_url=None):
+    """log_data, reversing the OIDC paths on every call."""
+    log_data = {"ip_address": request.META["REMOTE_ADDR"]}
+    params = request.session.get("oidc_params", {})
+    if not params and next_url:
+        if any(
+            next_url.startswith(path)
+            for path in [
+                reverse("oauth2_provider:authorize"),
+                reverse("oauth2_provider:register"),
+                reverse("oauth2_provider:activate"),
+            ]
+        ):
+            params = get_url_params(next_url)
+    try:
+        log_data["application"] = params["client_id"]
+    except KeyError:
+        pass
+    return log_data
+
+
+def allocations(func, number=1_000):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        for _ in range(number):
+            func()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def test_log_data(rf):
+    request = rf.get("/")
+    request.session = {}
+    next_url = add_url_params(reverse("oauth2_provider:authorize"), {"client_id": "my_application"})
+    assert log_data(request, next_url) == reference_log_data(request, next_url)
+
+    reference = allocations(lambda: reference_log_data(request, next_url))
+    cached = allocations(lambda: log_data(request, next_url))
+    print(f"\nlog_data peak allocations: reference {reference}B, cached paths {cached}B")
+    assert cached < reference
+
+
+def per_event_flush(audit_events):
+    """AuditEvents.flush without the batch hand-off: one Logger.handle per event."""
+    records, audit_events.committed = audit_events.committed, []
+    for record in records:
+        logging.getLogger(record.name).handle(record)
+
+
+def test_audit_events_emission(monkeypatch):
+    [handler] = logging.getLogger("inclusion_connect").handlers
+    logger = logging.getLogger("inclusion_connect.auth")
+    # The events of a password reset.
+    records = [
+        logger.makeRecord(
+            logger.name,
+            logging.INFO,
+            __file__,
+            0,
+            {"ip_address": "127.0.0.1", "event": event, "user": "user"},
+            None,
+            None,
+        )
+        for event in ["reset_password", "edit_user_info", "login"]
+    ]
+
+    def emit(flush):
+        audit_events = AuditEvents()
+        audit_events.committed = list(records)
+        flush(audit_events)
+
+    results = {}
+    for name, flush in [("per event", per_event_flush), ("batch", AuditEvents.flush)]:
+        monkeypatch.setattr(handler, "stream", io.StringIO())
+        start = time.perf_counter()
+        for _ in range(1_000):
+            emit(flush)
+        elapsed = time.perf_counter() - start
+        monkeypatch.setattr(handler, "stream", io.StringIO())
+        results[name] = elapsed, allocations(functools.partial(emit, flush), number=1)
+    print()
+    for name, (elapsed, peak) in results.items():
+        print(f"Audit events emission, {name}: {elapsed * 1000:.1f} µs per request, {peak}B peak allocations")
+    assert results["batch"][0] < results["per event"][0]
+
+
+def test_login(client, monkeypatch):
+    user = UserFactory()
+    url = add_url_params(reverse("accounts:login"), {"next": reverse("accounts:edit_user_info")})
+    client.get(url)
+    flushes = []
+    flush = AuditEvents.flush
+
+    def counted_flush(audit_events):
+        if audit_events.committed:
+            flushes.append(len(audit_events.committed))
+        flush(audit_events)
+
+    def login():
+        # The test client runs the on_commit callbacks.
+        response = client.post(url, data={"email": user.email, "password": DEFAULT_PASSWORD})
+        assert response.status_code == 302
+
+    monkeypatch.setattr(AuditEvents, "flush", counted_flush)
+    batched = allocations(login, number=1)
+    # The audit events of the request are handed over in a single batch.
+    assert len(flushes) == 1
+    monkeypatch.setattr(AuditEvents, "flush", per_event_flush)
+    per_event = allocations(login, number=1)
+    print(f"\nLogin peak allocations: per event {per_event}B, batch {batched}B")
@@ -0,0 +1,38 @@
+import timeit
+
+import pytest
+
+from inclusion_connect.oidc_overrides.models import RedirectURIMatcher
+from tests.oidc_overrides.tests import reference_uri_allowed
+
+
+REGISTERED_URIS = " ".join(
+    [f"https://rp{i}.example.com/oidc/callback" for i in range(200)]
+    + [f"https://tenant{i}.example.com/*" for i in range(200)]
+)
+CHECKED_URIS = [
+    # First registered URI.
+    "https://rp0.example.com/oidc/callback",
+    # Last exact URI.
+    "https://rp199.example.com/oidc/callback",
+    # Last wildcard.
+    "https://tenant199.example.com/oidc/callback?next=/",
+    # Not allowed.
+    "https://evil.example.com/oidc/callback",
+]
+
+
+@pytest.mark.no_django_db
+@pytest.mark.parametrize("uri", CHECKED_URIS)
+def test_redirect_uri_allowed(uri):
+    matcher = RedirectURIMatcher(REGISTERED_URIS.split())
+    assert matcher.allowed(uri) is reference_uri_allowed(REGISTERED_URIS, uri)
+
+    number = 200
+    reference = min(timeit.repeat(lambda: reference_uri_allowed(REGISTERED_URIS, uri), number=number, repeat=5))
+    compiled = min(timeit.repeat(lambda: matcher.allowed(uri), number=number, repeat=5))
+    print(
+        f"\n{uri}: reference {reference / number * 1e6:.1f}µs, compiled {compiled / number * 1e6:.1f}µs "
+        f"({reference / compiled:.0f}x)"
+    )
+    assert compiled < reference
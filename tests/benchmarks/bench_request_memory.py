@@ -0,0 +1,53 @@
+import gc
+import logging
+import resource
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection
+from django.urls import reverse
+
+from tests.users.factories import UserFactory
+
+
+WARMUP_REQUESTS = 1_000
+REQUESTS = 10_000
+# ru_maxrss is in kilobytes on Linux.
+# The test client keeps a few hundred bytes per request (signals).
+MAX_RSS_GROWTH_KB = 10 * 1024
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def live_requests():
+    gc.collect()
+    # isinstance() would evaluate the lazy objects.
+    return sum(type(obj) is WSGIRequest for obj in gc.get_objects())
+
+
+def post(client, url, count):
+    for _ in range(count):
+        response = client.post(url)
+        assert response.status_code == 302
+        # The test transaction is never committed, executed callbacks pile up.
+        connection.run_on_commit.clear()
+
+
+def test_rss_stays_flat(client):
+    client.force_login(UserFactory())
+    url = reverse("accounts:accept_terms")
+    # Captured log records are kept until the end of the test.
+    logging.disable(logging.INFO)
+    try:
+        post(client, url, WARMUP_REQUESTS)
+        rss_before = max_rss_kb()
+        # Calls get_next_url(), which used to be cached by request for the process lifetime.
+        post(client, url, REQUESTS)
+        rss_after = max_rss_kb()
+    finally:
+        logging.disable(logging.NOTSET)
+
+    print(f"\nMax RSS: {rss_before} KiB before, {rss_after} KiB after {REQUESTS} requests")
+    assert rss_after - rss_before < MAX_RSS_GROWTH_KB
+    assert live_requests() == 0
@@ -0,0 +1,74 @@
+import datetime
+import time
+
+from django.db import connection
+from oauth2_provider.models import Grant
+
+from inclusion_connect.oidc_overrides import partitions
+from tests.oidc_overrides.factories import ApplicationFactory
+from tests.users.factories import UserFactory
+
+
+ROWS = 10_000_000
+DAYS = 10
+# The tokens of the oldest days are purged.
+PURGED_DAYS = 7
+START = datetime.datetime(2023, 5, 1, tzinfo=datetime.UTC)
+TABLE = Grant._meta.db_table
+
+
+def measure(cursor, operation):
+    """Duration and WAL bytes written by operation."""
+    cursor.execute("SELECT pg_current_wal_insert_lsn()")
+    [lsn] = cursor.fetchone()
+    start = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - start
+    cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), %s)", [lsn])
+    [wal] = cursor.fetchone()
+    return elapsed, wal
+
+
+INSERT_SQL = f"""
+    INSERT INTO {TABLE} (
+        code, expires, redirect_uri, scope, application_id, user_id, created, updated,
+        code_challenge, code_challenge_method, nonce, claims
+    )
+    SELECT md5(i::text), created + interval '1 minute', 'http://localhost/', 'openid', %s, %s, created, created,
+        '', '', '', ''
+    FROM generate_series(0, %s - 1) AS i, LATERAL (SELECT %s + i * %s AS created) AS t
+"""
+
+
+def insert(cursor, application, user):
+    params = [application.pk, user.pk, ROWS, START, datetime.timedelta(days=DAYS) / ROWS]
+    return measure(cursor, lambda: cursor.execute(INSERT_SQL, params))
+
+
+def report(name, elapsed, wal):
+    print(f"{name}: {elapsed:.1f} s, {wal / 2**20:.0f} MiB WAL")
+
+
+def test_token_partitions():
+    application = ApplicationFactory()
+    user = UserFactory()
+    purge_before = START + datetime.timedelta(days=PURGED_DAYS)
+    print()
+    with connection.cursor() as cursor:
+        # Check the foreign keys on insert, like the autocommit requests.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        report(f"Insert {ROWS:,} tokens", *insert(cursor, application, user))
+        report(
+            f"DELETE {PURGED_DAYS} days",
+            *measure(cursor, lambda: cursor.execute(f"DELETE FROM {TABLE} WHERE created < %s", [purge_before])),
+        )
+        cursor.execute(f"TRUNCATE {TABLE}")
+
+        partitions.convert(START, datetime.timedelta(days=DAYS))
+        report(f"Insert {ROWS:,} tokens, partitioned", *insert(cursor, application, user))
+        report(
+            f"DROP {PURGED_DAYS} daily partitions",
+            *measure(cursor, lambda: partitions.drop_expired_partitions(TABLE, purge_before + partitions.retention())),
+        )
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLE}")
+        assert cursor.fetchone() == (ROWS * (DAYS - PURGED_DAYS) // DAYS,)
@@ -1,7 +1,18 @@
 import pytest
 from bs4 import BeautifulSoup
+from django.conf import settings
 from django.test import TestCase, client as django_client
 
+from inclusion_connect.oidc_federation.base import jwks_cache
+from inclusion_connect.oidc_federation.http import http_clients
+from inclusion_connect.oidc_overrides.client_secrets import verified_client_secrets
+from inclusion_connect.oidc_overrides.keys import key_ring
+from inclusion_connect.oidc_overrides.registry import applications
+from inclusion_connect.oidc_overrides.well_known import well_known_documents
+from inclusion_connect.stats.helpers import recorded_actions
+from inclusion_connect.users.cached_sessions import session_cache
+from inclusion_connect.utils.metrics import process_metrics
+
 
 pytest.register_assert_rewrite("tests.asserts", "tests.helpers")
 
@@ -15,10 +26,24 @@ def pytest_collection_modifyitems(config, items):
             item.add_marker(pytest.mark.django_db)
 
 
+@pytest.fixture(autouse=True)
+def clear_process_caches():
+    # The per-process caches outlive the test transaction.
+    applications.clear()
+    verified_client_secrets.clear()
+    key_ring.clear()
+    well_known_documents.clear()
+    recorded_actions.clear()
+    session_cache.clear()
+    jwks_cache.clear()
+    http_clients.clear()
+    process_metrics.clear()
+
+
 class NoInlineClient(django_client.Client):
     def request(self, **request):
         response = super().request(**request)
-        content_type = response["Content-Type"].split(";")[0]
+        content_type = response.get("Content-Type", "").split(";")[0]
         if content_type == "text/html" and response.content:
             content = response.content.decode(response.charset)
             assert " onclick=" not in content
@@ -45,7 +70,22 @@ class ExecuteOnCommitCallbacksClient(django_client.Client):
             return super().request(**request)
 
 
-class Client(ExecuteOnCommitCallbacksClient, NoInlineClient):
+class SignedSessionClient(django_client.Client):
+    @property
+    def session(self):
+        session = super().session
+        save = session.save
+
+        def save_to_cookie(must_create=False):
+            save(must_create)
+            # Anonymous sessions are signed in the cookie, their key changes with their data.
+            self.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        session.save = save_to_cookie
+        return session
+
+
+class Client(ExecuteOnCommitCallbacksClient, NoInlineClient, SignedSessionClient):
     pass
 
 
@@ -1,17 +1,18 @@
 import base64
 import hashlib
 import logging
+import time
 import uuid
 
 import jwt
 from bs4 import BeautifulSoup
 from django.contrib.auth import get_user
-from django.contrib.sessions.models import Session
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from oauth2_provider.models import get_access_token_model, get_id_token_model, get_refresh_token_model
 
+from inclusion_connect.users.models import UserSession
 from inclusion_connect.utils.urls import add_url_params, get_url_params
 from tests.asserts import assertRecords
 from tests.oidc_overrides.factories import DEFAULT_CLIENT_SECRET, ApplicationFactory, default_client_secret
@@ -157,12 +158,7 @@ def oidc_complete_flow(
 
 
 def has_ongoing_sessions(user):
-    ongoing_sessions = [
-        s
-        for s in Session.objects.filter(expire_date__gte=timezone.now())
-        if s.get_decoded().get("_auth_user_id") == str(user.pk)
-    ]
-    return bool(ongoing_sessions)
+    return UserSession.objects.filter(user=user, expire_date__gte=timezone.now()).exists()
 
 
 def token_are_revoked(user):
@@ -198,3 +194,10 @@ def call_logout(client, method, params):
     elif method == "post":
         return client.post(url, data=params)
     raise ValueError
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
@@ -0,0 +1,59 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePeama(ThreadingHTTPServer):
+    """
+    PEAMA stand-in listening on localhost.
+
+    Each request is answered with the next response of ``responses``, a ``(status_code, body, delay)`` tuple,
+    then with a 204.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakePeamaHandler)
+        self.responses = []
+        self.requests = []
+        # Ports of the clients, a reused connection keeps its port.
+        self.client_ports = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # The client gave up on a delayed response.
+        pass
+
+
+class FakePeamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append(f"{self.command} {self.path}")
+        self.server.client_ports.append(self.client_address[1])
+        status_code, body, delay = self.server.responses.pop(0) if self.server.responses else (204, b"", 0)
+        time.sleep(delay)
+        self.send_response(status_code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
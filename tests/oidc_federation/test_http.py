@@ -0,0 +1,75 @@
+import pytest
+import requests
+
+from inclusion_connect.oidc_federation.enums import Federation
+from inclusion_connect.oidc_federation.http import FederationHTTPClient, http_clients
+from tests.oidc_federation.fake_peama import FakePeama
+
+
+@pytest.fixture
+def server(settings):
+    settings.FEDERATION_HTTP_RETRY_BACKOFF = 0
+    with FakePeama() as server:
+        yield server
+
+
+def test_keep_alive(server):
+    client = FederationHTTPClient()
+    for _ in range(3):
+        assert client.get("logout", f"{server.url}/logout").status_code == 204
+    assert len(server.requests) == 3
+    assert len(set(server.client_ports)) == 1
+
+
+def test_latencies(server):
+    client = FederationHTTPClient()
+    server.responses = [(200, b"{}", 0), (500, b"", 0)]
+    client.post("token", f"{server.url}/token", data={"code": "123"})
+    client.get("userinfo", f"{server.url}/userinfo")
+    stats = client.stats()
+    assert stats.keys() == {"token", "userinfo"}
+    assert stats["token"]["count"] == 1
+    assert stats["token"]["errors"] == 0
+    assert sum(stats["token"]["buckets"].values()) == 1
+    assert stats["userinfo"]["count"] == 1
+    assert stats["userinfo"]["errors"] == 1
+
+
+def test_retries_idempotent_requests(server):
+    client = FederationHTTPClient()
+    server.responses = [(503, b"", 0), (200, b"{}", 0)]
+    assert client.get("jwks", f"{server.url}/jwks").status_code == 200
+    assert server.requests == ["GET /jwks", "GET /jwks"]
+    # One call to the client.
+    assert client.stats()["jwks"]["count"] == 1
+
+    # The code would be exchanged twice.
+    server.responses = [(503, b"", 0), (200, b"{}", 0)]
+    assert client.post("token", f"{server.url}/token").status_code == 503
+    assert server.requests[2:] == ["POST /token"]
+
+
+def test_read_timeout_not_retried(server, settings):
+    settings.FEDERATION_READ_TIMEOUT = 0.1
+    client = FederationHTTPClient()
+    server.responses = [(204, b"", 1)]
+    with pytest.raises(requests.ReadTimeout):
+        client.get("logout", f"{server.url}/logout")
+    assert server.requests == ["GET /logout"]
+    assert client.stats()["logout"]["errors"] == 1
+
+
+def test_connection_error(settings):
+    settings.FEDERATION_HTTP_RETRY_BACKOFF = 0
+    client = FederationHTTPClient()
+    with FakePeama() as server:
+        url = f"{server.url}/logout"
+    with pytest.raises(requests.ConnectionError):
+        client.get("logout", url)
+
+
+def test_one_client_per_federation():
+    client = http_clients.get(Federation.PEAMA)
+    assert http_clients.get(Federation.PEAMA) is client
+    http_clients.clear()
+    assert http_clients.get(Federation.PEAMA) is not client
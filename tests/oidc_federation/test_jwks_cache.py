@@ -0,0 +1,138 @@
+import datetime
+
+import jwt
+import pytest
+import requests
+from django.core.exceptions import SuspiciousOperation
+from freezegun import freeze_time
+
+from inclusion_connect.oidc_federation import peama
+from inclusion_connect.oidc_federation.base import JWKSCache
+
+
+ENDPOINT = "https://peama/jwks"
+KEY_1 = {"kid": "key1", "kty": "RSA"}
+KEY_2 = {"kid": "key2", "kty": "RSA"}
+
+
+class FakeJWKS:
+    def __init__(self, *keys):
+        self.keys = list(keys)
+        self.calls = 0
+        self.unreachable = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.unreachable:
+            raise requests.ConnectionError("unreachable")
+        return {"keys": self.keys}
+
+
+@pytest.fixture(autouse=True)
+def jwks_settings(settings):
+    settings.FEDERATION_JWKS_CACHE_SECS = 3600
+    settings.FEDERATION_JWKS_REFRESH_INTERVAL_SECS = 60
+
+
+@freeze_time("2023-05-05 12:00:00")
+def test_hit():
+    cache = JWKSCache()
+    fetch = FakeJWKS(KEY_1)
+    assert cache.get_keys(ENDPOINT, "key1", fetch) == [KEY_1]
+    assert cache.get_keys(ENDPOINT, "key1", fetch) == [KEY_1]
+    assert fetch.calls == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "refreshes": 0, "stale": 0, "size": 1}
+
+
+def test_expired():
+    cache = JWKSCache()
+    fetch = FakeJWKS(KEY_1)
+    with freeze_time("2023-05-05 12:00:00") as frozen_time:
+        cache.get_keys(ENDPOINT, "key1", fetch)
+        frozen_time.tick(datetime.timedelta(hours=1))
+        fetch.keys = [KEY_2]
+        assert cache.get_keys(ENDPOINT, "key2", fetch) == [KEY_2]
+    assert fetch.calls == 2
+    assert cache.stats() == {"hits": 0, "misses": 1, "refreshes": 1, "stale": 0, "size": 1}
+
+
+def test_unknown_kid_rate_limited():
+    cache = JWKSCache()
+    fetch = FakeJWKS(KEY_1)
+    with freeze_time("2023-05-05 12:00:00") as frozen_time:
+        cache.get_keys(ENDPOINT, "key1", fetch)
+        # The identity provider rotated its keys.
+        fetch.keys = [KEY_1, KEY_2]
+        frozen_time.tick(datetime.timedelta(seconds=60))
+        assert cache.get_keys(ENDPOINT, "key2", fetch) == [KEY_1, KEY_2]
+        assert fetch.calls == 2
+
+        # Tokens signed with an unknown key do not hammer the identity provider.
+        for _ in range(3):
+            assert cache.get_keys(ENDPOINT, "unknown", fetch) == [KEY_1, KEY_2]
+        assert fetch.calls == 2
+        frozen_time.tick(datetime.timedelta(seconds=60))
+        assert cache.get_keys(ENDPOINT, "unknown", fetch) == [KEY_1, KEY_2]
+        assert fetch.calls == 3
+        assert cache.get_keys(ENDPOINT, "key1", fetch) == [KEY_1, KEY_2]
+    assert cache.stats() == {"hits": 1, "misses": 4, "refreshes": 2, "stale": 0, "size": 1}
+
+
+def test_stale_when_unreachable(caplog):
+    cache = JWKSCache()
+    fetch = FakeJWKS(KEY_1)
+    with freeze_time("2023-05-05 12:00:00") as frozen_time:
+        cache.get_keys(ENDPOINT, "key1", fetch)
+        fetch.unreachable = True
+        frozen_time.tick(datetime.timedelta(hours=1))
+        assert cache.get_keys(ENDPOINT, "key1", fetch) == [KEY_1]
+        assert caplog.messages == [f"Could not refresh the JWKS of {ENDPOINT}, using the cached keys"]
+        # Not fetched again before the refresh interval.
+        assert cache.get_keys(ENDPOINT, "key1", fetch) == [KEY_1]
+        assert fetch.calls == 2
+
+        fetch.unreachable = False
+        frozen_time.tick(datetime.timedelta(seconds=60))
+        assert cache.get_keys(ENDPOINT, "key1", fetch) == [KEY_1]
+        assert cache.get_keys(ENDPOINT, "key1", fetch) == [KEY_1]
+    assert fetch.calls == 3
+    assert cache.stats() == {"hits": 1, "misses": 1, "refreshes": 2, "stale": 2, "size": 1}
+
+
+def test_unreachable_without_cache():
+    cache = JWKSCache()
+    fetch = FakeJWKS(KEY_1)
+    fetch.unreachable = True
+    with pytest.raises(requests.ConnectionError):
+        cache.get_keys(ENDPOINT, "key1", fetch)
+    assert cache.stats() == {"hits": 0, "misses": 1, "refreshes": 0, "stale": 0, "size": 0}
+
+
+@pytest.mark.parametrize(
+    "keys,kid,expected",
+    [
+        ([KEY_1, KEY_2], "key2", KEY_2),
+        ([KEY_1, KEY_2], "key3", None),
+        ([KEY_1, KEY_2], None, None),
+        # Without a key id on either side, the single key.
+        ([KEY_1], None, KEY_1),
+        ([{"kty": "RSA"}], "key1", {"kty": "RSA"}),
+        ([{"kty": "RSA", "alg": "RS256"}], None, None),
+    ],
+)
+def test_retrieve_matching_jwk(mocker, keys, kid, expected):
+    backend = peama.OIDCAuthenticationBackend()
+    mocker.patch.object(backend, "fetch_jwks", return_value={"keys": keys})
+    token = jwt.encode({}, "secret", algorithm="HS256", headers={"kid": kid} if kid else None)
+    if expected is None:
+        with pytest.raises(SuspiciousOperation):
+            backend.retrieve_matching_jwk(token)
+    else:
+        assert backend.retrieve_matching_jwk(token) == expected
+
+
+def test_retrieve_matching_jwk_without_verifying_kid(mocker, settings):
+    settings.OIDC_VERIFY_KID = False
+    backend = peama.OIDCAuthenticationBackend()
+    mocker.patch.object(backend, "fetch_jwks", return_value={"keys": [KEY_1, KEY_2]})
+    assert backend.retrieve_matching_jwk(jwt.encode({}, "secret", algorithm="HS256", headers={"kid": "key3"})) == KEY_2
@@ -5,16 +5,22 @@ import jwt
 import pytest
 from django.conf import settings
 from django.contrib.auth import get_user
+from django.core.management import call_command
 from django.test import override_settings
 from django.urls import reverse
+from freezegun import freeze_time
 from jwcrypto import jwk
 from pytest_django.asserts import assertContains, assertRedirects
 
+from inclusion_connect.oidc_federation import peama, worker
 from inclusion_connect.oidc_federation.enums import Federation
+from inclusion_connect.oidc_federation.http import http_clients
+from inclusion_connect.oidc_federation.models import PendingLogout
 from inclusion_connect.oidc_federation.peama import logout
 from inclusion_connect.users.models import User
 from inclusion_connect.utils.urls import get_url_params
 from tests.asserts import assertRecords
+from tests.oidc_federation.fake_peama import FakePeama
 from tests.users.factories import DEFAULT_PASSWORD, UserFactory
 
 
@@ -25,6 +31,13 @@ PEAMA_ADDITIONAL_DATA = {
 }
 
 
+@pytest.fixture
+def fake_peama(settings):
+    with FakePeama() as server:
+        settings.PEAMA_LOGOUT_ENDPOINT = f"{server.url}/logout?realm=/agent"
+        yield server
+
+
 def generate_peama_data(nonce):
     key_kid = "random_kid"
 
@@ -111,6 +124,8 @@ class TestFederation:
         }
         assert user.email_addresses.get().email == peama_data.user_info["email"]
         assertRedirects(response, reverse("accounts:accept_terms"))
+        # Every call went through the HTTP client of PEAMA.
+        assert http_clients.stats()[Federation.PEAMA].keys() == {"token", "jwks", "userinfo"}
         assertRecords(
             caplog,
             [
@@ -299,16 +314,18 @@ class TestFederation:
             ],
         )
 
-    @pytest.mark.django_db(transaction=True)
-    def test_logout(self, client, requests_mock, caplog):
-        logout_endpoint = requests_mock.get(settings.PEAMA_LOGOUT_ENDPOINT, status_code=204)
+    def test_logout(self, client, fake_peama, caplog):
         id_token = "MyToken"
         user = UserFactory(federation_id_token_hint=id_token)
         client.force_login(user)
         response = client.get(reverse("accounts:edit_user_info"))
         logout(response.wsgi_request, user, None)
-        assert logout_endpoint.call_count == 1
-        # check logs ?
+        # Queued for the worker.
+        assert fake_peama.requests == []
+        assert caplog.record_tuples == []
+
+        assert worker.send_pending_logouts() == 1
+        assert fake_peama.requests == [f"GET /logout?realm=%2Fagent&id_token_hint={id_token}"]
         assertRecords(
             caplog,
             [
@@ -324,17 +341,18 @@ class TestFederation:
                 ),
             ],
         )
+        assert PendingLogout.objects.exists() is False
 
-    @pytest.mark.django_db(transaction=True)
-    def test_logout_fails(self, client, requests_mock, caplog):
-        logout_endpoint = requests_mock.get(settings.PEAMA_LOGOUT_ENDPOINT, status_code=400, content=b"bad token")
+    def test_logout_fails(self, client, fake_peama, caplog):
+        fake_peama.responses = [(400, b"bad token", 0)]
         id_token = "MyToken"
         user = UserFactory(federation_id_token_hint=id_token)
         client.force_login(user)
         response = client.get(reverse("accounts:edit_user_info"))
         logout(response.wsgi_request, user, None)
-        assert logout_endpoint.call_count == 1
-        # check logs ?
+        assert worker.send_pending_logouts() == 1
+        assert len(fake_peama.requests) == 1
+        # Not retried, PEAMA refused the logout.
         assertRecords(
             caplog,
             [
@@ -351,6 +369,60 @@ class TestFederation:
                 ),
             ],
         )
+        assert PendingLogout.objects.exists() is False
+
+    def test_logout_timeout(self, client, fake_peama, caplog, settings):
+        settings.FEDERATION_READ_TIMEOUT = 0.1
+        fake_peama.responses = [(204, b"", 1)] * worker.MAX_ATTEMPTS
+        user = UserFactory(federation_id_token_hint="MyToken")
+        client.force_login(user)
+        response = client.get(reverse("accounts:edit_user_info"))
+        with freeze_time("2023-05-05 12:00:00") as frozen_time:
+            logout(response.wsgi_request, user, None)
+            assert worker.send_pending_logouts() == 1
+            pending_logout = PendingLogout.objects.get()
+            assert pending_logout.attempts == 1
+            assert "ReadTimeout" in pending_logout.last_error
+            [record] = caplog.records
+            assert record.levelno == logging.WARNING
+            caplog.clear()
+            # Retried later.
+            assert worker.send_pending_logouts() == 0
+            for _ in range(worker.MAX_ATTEMPTS - 1):
+                frozen_time.move_to(PendingLogout.objects.get().next_attempt_at)
+                assert worker.send_pending_logouts() == 1
+        assert len(fake_peama.requests) == worker.MAX_ATTEMPTS
+        assert PendingLogout.objects.exists() is False
+        *_warnings, record = caplog.records
+        assert record.levelno == logging.INFO
+        assert record.msg["event"] == "logout_peama_error"
+        assert "ReadTimeout" in record.msg["error"]["msg"]
+
+    def test_logout_reuses_connection(self, client, fake_peama):
+        for id_token in ["token1", "token2"]:
+            user = UserFactory(federation_id_token_hint=id_token)
+            client.force_login(user)
+            response = client.get(reverse("accounts:edit_user_info"))
+            logout(response.wsgi_request, user, None)
+        call_command("federationlogouts", "--once")
+        assert len(fake_peama.requests) == 2
+        assert len(set(fake_peama.client_ports)) == 1
+
+
+@pytest.mark.parametrize("basic_auth", [True, False])
+def test_get_token(mocker, requests_mock, basic_auth):
+    mocker.patch.dict(peama.CONFIG, {"OIDC_TOKEN_USE_BASIC_AUTH": basic_auth})
+    requests_mock.post(settings.PEAMA_TOKEN_ENDPOINT, json={"access_token": "token"})
+    backend = peama.OIDCAuthenticationBackend()
+    payload = {"client_id": "client", "client_secret": "secret", "grant_type": "authorization_code", "code": "123"}
+    assert backend.get_token(payload) == {"access_token": "token"}
+    [request] = requests_mock.request_history
+    if basic_auth:
+        assert request.headers["Authorization"] == "Basic Y2xpZW50OnNlY3JldA=="
+        assert request.text == "client_id=client&grant_type=authorization_code&code=123"
+    else:
+        assert "Authorization" not in request.headers
+        assert request.text == "client_id=client&client_secret=secret&grant_type=authorization_code&code=123"
 
 
 @override_settings(PEAMA_ENABLED=None, PEAMA_CLIENT_ID=None, PEAMA_JWKS_ENDPOINT=None)
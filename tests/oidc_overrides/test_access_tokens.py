@@ -0,0 +1,272 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from freezegun import freeze_time
+from jwcrypto import jwk, jwt
+from oauth2_provider.models import get_refresh_token_model
+from oauth2_provider.settings import oauth2_settings
+
+from inclusion_connect.oidc_overrides.models import JWTRevocation
+from inclusion_connect.oidc_overrides.registry import applications
+from inclusion_connect.stats.models import Stats
+from inclusion_connect.users.models import User
+from inclusion_connect.utils.urls import add_url_params, get_url_params
+from tests.conftest import Client
+from tests.helpers import call_logout
+from tests.oidc_overrides.factories import DEFAULT_CLIENT_SECRET, ApplicationFactory
+from tests.users.factories import UserFactory
+
+
+@pytest.fixture
+def application(oidc_params):
+    return ApplicationFactory(client_id=oidc_params["client_id"], jwt_access_tokens=True)
+
+
+def get_tokens(client, oidc_params, token_url_name="oauth2_provider:token"):
+    response = client.get(add_url_params(reverse("oauth2_provider:authorize"), oidc_params))
+    response = client.post(
+        reverse(token_url_name),
+        data={
+            "client_id": oidc_params["client_id"],
+            "client_secret": DEFAULT_CLIENT_SECRET,
+            "code": get_url_params(response.url)["code"],
+            "grant_type": "authorization_code",
+            "redirect_uri": oidc_params["redirect_uri"],
+        },
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def userinfo(client, access_token):
+    return client.get(reverse("oauth2_provider:user-info"), headers={"Authorization": f"Bearer {access_token}"})
+
+
+def test_jwt_access_token(client, oidc_params, application):
+    user = UserFactory()
+    client.force_login(user)
+    tokens = get_tokens(client, oidc_params)
+
+    # Verifiable by the application with the published keys.
+    public_key = jwk.JWK.from_pem(oauth2_settings.OIDC_RSA_PRIVATE_KEY.encode()).public()
+    access_token = jwt.JWT(key=public_key, jwt=tokens["access_token"])
+    assert json.loads(access_token.header)["typ"] == "at+jwt"
+    claims = json.loads(access_token.claims)
+    assert claims["sub"] == str(user.pk)
+    assert claims["aud"] == claims["client_id"] == application.client_id
+    assert claims["scope"] == "openid profile email"
+    assert claims["email"] == user.email
+    assert claims["exp"] - claims["iat"] == pytest.approx(oauth2_settings.ACCESS_TOKEN_EXPIRE_SECONDS, abs=1)
+
+    # Only the jti is stored.
+    refresh_token = get_refresh_token_model().objects.get()
+    assert refresh_token.token == tokens["refresh_token"]
+    assert refresh_token.access_token.token == claims["jti"]
+    # The token signal is still sent.
+    assert Stats.objects.filter(user=user, application=application, action="login").exists()
+
+
+def test_keycloak_compat_token(client, oidc_params, application):
+    client.force_login(UserFactory())
+    tokens = get_tokens(client, oidc_params, token_url_name="keycloak_compat_local:token")
+    assert userinfo(client, tokens["access_token"]).status_code == 200
+
+
+def test_userinfo(client, django_assert_num_queries, oidc_params, application):
+    user = UserFactory(federation_data={"site_pe": "Site"})
+    client.force_login(user)
+    tokens = get_tokens(client, oidc_params)
+    client.logout()
+
+    # The deny-list only, the claims come from the token.
+    applications.get(application.client_id)
+    with django_assert_num_queries(1):
+        response = userinfo(client, tokens["access_token"])
+    assert response.json() == {
+        "sub": str(user.pk),
+        "given_name": user.first_name,
+        "family_name": user.last_name,
+        "email": user.email,
+        "site_pe": "Site",
+    }
+
+
+def test_expired(client, oidc_params, application):
+    client.force_login(UserFactory())
+    with freeze_time("2023-05-05 14:29:20"):
+        tokens = get_tokens(client, oidc_params)
+    with freeze_time("2023-05-05 14:59:19"):
+        assert userinfo(client, tokens["access_token"]).status_code == 200
+    with freeze_time("2023-05-05 14:59:20"):
+        assert userinfo(client, tokens["access_token"]).status_code == 401
+
+
+def test_tampered(client, oidc_params, application):
+    client.force_login(UserFactory())
+    tokens = get_tokens(client, oidc_params)
+    header, claims, signature = tokens["access_token"].split(".")
+    assert userinfo(client, f"{header}.{claims}.{signature[::-1]}").status_code == 401
+
+
+def test_refresh(client, oidc_params, application):
+    client.force_login(UserFactory())
+    tokens = get_tokens(client, oidc_params)
+    response = client.post(
+        reverse("oauth2_provider:token"),
+        data={
+            "client_id": application.client_id,
+            "client_secret": DEFAULT_CLIENT_SECRET,
+            "grant_type": "refresh_token",
+            "refresh_token": tokens["refresh_token"],
+        },
+    )
+    new_tokens = response.json()
+    assert new_tokens["scope"] == "openid profile email"
+    assert userinfo(client, new_tokens["access_token"]).status_code == 200
+    # The previous access token is revoked, like opaque ones.
+    assert userinfo(client, tokens["access_token"]).status_code == 401
+    assert JWTRevocation.objects.count() == 1
+
+
+def test_introspect(client, oidc_params, application):
+    user = UserFactory()
+    client.force_login(user)
+    tokens = get_tokens(client, oidc_params)
+    introspection_token = ApplicationFactory().accesstoken_set.create(
+        token="introspection", scope="introspection", expires="2100-01-01T00:00Z"
+    )
+
+    response = client.post(
+        reverse("oauth2_provider:introspect"),
+        data={"token": tokens["access_token"]},
+        headers={"Authorization": f"Bearer {introspection_token.token}"},
+    )
+    assert response.json() == {
+        "active": True,
+        "scope": "openid profile email",
+        "exp": json.loads(jwt.JWT(jwt=tokens["access_token"]).token.objects["payload"])["exp"],
+        "client_id": application.client_id,
+        "username": str(user.pk),
+    }
+
+
+def test_expired_revocations_are_purged(client, oidc_params, application):
+    client.force_login(UserFactory())
+
+    def revoke(access_token):
+        client.post(
+            reverse("oauth2_provider:revoke-token"),
+            data={
+                "client_id": application.client_id,
+                "client_secret": DEFAULT_CLIENT_SECRET,
+                "token": access_token,
+            },
+        )
+
+    with freeze_time("2023-05-05 14:29:20"):
+        revoke(get_tokens(client, oidc_params)["access_token"])
+    with freeze_time("2023-05-05 14:45:00"):
+        tokens = get_tokens(client, oidc_params)
+        expired_tokens = get_tokens(client, oidc_params)
+    with freeze_time("2023-05-05 15:00:00"):
+        revoke(tokens["access_token"])
+        assert JWTRevocation.objects.count() == 2
+        call_command("purgeexpired", stdout=io.StringIO())
+    # The first token expired at 14:59:20.
+    [revocation] = JWTRevocation.objects.all()
+    assert revocation.jti == json.loads(jwt.JWT(jwt=tokens["access_token"]).token.objects["payload"])["jti"]
+
+    with freeze_time("2023-05-05 15:16:00"):
+        # Expired tokens are not added to the deny-list.
+        revoke(expired_tokens["access_token"])
+    assert JWTRevocation.objects.count() == 1
+
+
+def test_revoke(client, oidc_params, application):
+    client.force_login(UserFactory())
+    tokens = get_tokens(client, oidc_params)
+    other_tokens = get_tokens(client, oidc_params)
+
+    response = client.post(
+        reverse("oauth2_provider:revoke-token"),
+        data={
+            "client_id": application.client_id,
+            "client_secret": DEFAULT_CLIENT_SECRET,
+            "token": tokens["access_token"],
+        },
+    )
+    assert response.status_code == 200
+    assert userinfo(client, tokens["access_token"]).status_code == 401
+    assert userinfo(client, other_tokens["access_token"]).status_code == 200
+    assert JWTRevocation.objects.count() == 1
+
+
+def test_deleted_user(client, oidc_params, application):
+    user = UserFactory()
+    client.force_login(user)
+    tokens = get_tokens(client, oidc_params)
+    admin_client = Client()
+    admin_client.force_login(UserFactory(is_superuser=True, is_staff=True))
+
+    response = admin_client.post(reverse("admin:users_user_delete", args=(user.pk,)), {"post": "yes"})
+    assert response.status_code == 302
+    assert not User.objects.filter(pk=user.pk).exists()
+    # The cascade does not fill the deny-list.
+    assert not JWTRevocation.objects.exists()
+    assert userinfo(client, tokens["access_token"]).status_code == 401
+
+
+def test_inactive_user(client, oidc_params, application):
+    user = UserFactory()
+    client.force_login(user)
+    tokens = get_tokens(client, oidc_params)
+    User.objects.filter(pk=user.pk).update(is_active=False)
+    assert userinfo(client, tokens["access_token"]).status_code == 401
+
+
+def test_admin_delete_access_token(client, oidc_params, application):
+    client.force_login(UserFactory())
+    tokens = get_tokens(client, oidc_params)
+    other_tokens = get_tokens(client, oidc_params)
+    access_token = get_refresh_token_model().objects.get(token=tokens["refresh_token"]).access_token
+    admin_client = Client()
+    admin_client.force_login(UserFactory(is_superuser=True, is_staff=True))
+
+    response = admin_client.post(
+        reverse("admin:oauth2_provider_accesstoken_delete", args=(access_token.pk,)), {"post": "yes"}
+    )
+    assert response.status_code == 302
+    assert userinfo(client, tokens["access_token"]).status_code == 401
+
+    other_access_token = get_refresh_token_model().objects.get(token=other_tokens["refresh_token"]).access_token
+    response = admin_client.post(
+        reverse("admin:oauth2_provider_accesstoken_changelist"),
+        {"action": "delete_selected", "_selected_action": [other_access_token.pk], "post": "yes"},
+    )
+    assert response.status_code == 302
+    assert userinfo(client, other_tokens["access_token"]).status_code == 401
+    assert JWTRevocation.objects.count() == 2
+
+
+def test_logout(client, oidc_params, application):
+    user = UserFactory()
+    client.force_login(user)
+    tokens = get_tokens(client, oidc_params)
+    other_client = Client()
+    other_client.force_login(UserFactory())
+    other_user_tokens = get_tokens(other_client, oidc_params)
+
+    response = call_logout(
+        client, "get", {"id_token_hint": tokens["id_token"], "post_logout_redirect_uri": "http://callback/"}
+    )
+    assert response.status_code == 302
+    assert userinfo(client, tokens["access_token"]).status_code == 401
+    assert userinfo(client, other_user_tokens["access_token"]).status_code == 200
+    assert get_refresh_token_model().objects.get(token=tokens["refresh_token"]).revoked is not None
+
+    # Tokens issued after the logout are valid.
+    client.force_login(user)
+    assert userinfo(client, get_tokens(client, oidc_params)["access_token"]).status_code == 200
@@ -0,0 +1,117 @@
+import datetime
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from freezegun import freeze_time
+from jwcrypto import jwk
+from jwcrypto.common import base64url_decode
+from oauth2_provider.settings import oauth2_settings
+
+from inclusion_connect.oidc_overrides import keys
+from inclusion_connect.oidc_overrides.keys import RELOAD_SECS
+from inclusion_connect.oidc_overrides.models import Application, SigningKey
+from tests.helpers import call_logout
+from tests.oidc_overrides.factories import ApplicationFactory
+from tests.oidc_overrides.test_access_tokens import get_tokens, userinfo
+from tests.users.factories import UserFactory
+
+
+SETTINGS_KID = jwk.JWK.from_pem(oauth2_settings.OIDC_RSA_PRIVATE_KEY.encode()).thumbprint()
+
+
+@pytest.fixture
+def application(oidc_params):
+    return ApplicationFactory(
+        client_id=oidc_params["client_id"], algorithm=Application.RS256_ALGORITHM, jwt_access_tokens=True
+    )
+
+
+def kid(token):
+    return json.loads(base64url_decode(token.split(".")[0]))["kid"]
+
+
+def jwks_kids(client):
+    return [key["kid"] for key in client.get(reverse("oauth2_provider:jwks-info")).json()["keys"]]
+
+
+def rotate(*args):
+    call_command("rotatesigningkeys", *args, stdout=io.StringIO())
+
+
+def test_rotation(client, oidc_params, application):
+    client.force_login(UserFactory())
+    with freeze_time("2023-05-05 14:00:00") as frozen_time:
+        tokens = get_tokens(client, oidc_params)
+        assert kid(tokens["id_token"]) == kid(tokens["access_token"]) == SETTINGS_KID
+        assert jwks_kids(client) == [SETTINGS_KID]
+
+        rotate()
+        new_kid = SigningKey.objects.latest("activates_at").kid
+        # Published once the processes reloaded the keys.
+        assert jwks_kids(client) == [SETTINGS_KID]
+        frozen_time.tick(RELOAD_SECS)
+        assert jwks_kids(client) == [SETTINGS_KID, new_kid]
+
+        # Signing once the applications reloaded the JWKS.
+        frozen_time.tick(oauth2_settings.OIDC_JWKS_MAX_AGE_SECONDS - 1)
+        old_tokens = get_tokens(client, oidc_params)
+        assert kid(old_tokens["id_token"]) == kid(old_tokens["access_token"]) == SETTINGS_KID
+        frozen_time.tick()
+        tokens = get_tokens(client, oidc_params)
+        assert kid(tokens["id_token"]) == kid(tokens["access_token"]) == new_kid
+        assert userinfo(client, tokens["access_token"]).status_code == 200
+
+        # The tokens signed by the retiring key are still valid.
+        assert userinfo(client, old_tokens["access_token"]).status_code == 200
+        response = call_logout(
+            client, "get", {"id_token_hint": old_tokens["id_token"], "post_logout_redirect_uri": "http://callback/"}
+        )
+        assert response.status_code == 302
+        assert response["Location"] == "http://callback/"
+
+        # Until they expire.
+        frozen_time.tick(oauth2_settings.ID_TOKEN_EXPIRE_SECONDS)
+        assert jwks_kids(client) == [new_kid]
+
+
+def test_keys_parsed_once(client, oidc_params, application, mocker):
+    decrypt_private_key = mocker.spy(keys, "decrypt_private_key")
+    client.force_login(UserFactory())
+    with freeze_time("2023-05-05 14:00:00") as frozen_time:
+        rotate("--activation-delay=0")
+        for _ in range(2):
+            tokens = get_tokens(client, oidc_params)
+            assert userinfo(client, tokens["access_token"]).status_code == 200
+            frozen_time.tick(RELOAD_SECS)
+    # The imported settings key and the new key.
+    assert decrypt_private_key.call_count == 2
+
+
+def test_rotatesigningkeys():
+    with freeze_time("2023-05-05 14:00:00") as frozen_time:
+        stdout = io.StringIO()
+        call_command("rotatesigningkeys", stdout=stdout)
+        settings_key, new_key = SigningKey.objects.order_by("activates_at")
+        assert stdout.getvalue() == (
+            f"Clé {SETTINGS_KID} importée depuis OIDC_RSA_PRIVATE_KEY.\n"
+            f"Clé {new_key.kid} active à partir de 2023-05-05 15:01:00+0000, "
+            "1 clé(s) retirée(s) le 2023-05-06 01:01:00+0000, 0 clé(s) expirée(s) supprimée(s).\n"
+        )
+        assert settings_key.kid == SETTINGS_KID
+        assert settings_key.activates_at == datetime.datetime(2023, 5, 5, 14, tzinfo=datetime.UTC)
+        assert settings_key.expires_at == datetime.datetime(2023, 5, 6, 1, 1, tzinfo=datetime.UTC)
+        assert new_key.activates_at == datetime.datetime(2023, 5, 5, 15, 1, tzinfo=datetime.UTC)
+        assert new_key.expires_at is None
+        assert "ENCRYPTED PRIVATE KEY" in new_key.private_key
+        assert keys.decrypt_private_key(new_key.private_key).thumbprint() == new_key.kid
+
+        frozen_time.move_to("2023-05-06 01:01:00")
+        rotate()
+        # The settings key expired.
+        assert list(SigningKey.objects.order_by("activates_at").values_list("kid", "expires_at")) == [
+            (new_key.kid, datetime.datetime(2023, 5, 6, 12, 2, tzinfo=datetime.UTC)),
+            (SigningKey.objects.latest("activates_at").kid, None),
+        ]
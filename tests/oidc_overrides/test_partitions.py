@@ -0,0 +1,205 @@
+import datetime
+import io
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+from freezegun import freeze_time
+from oauth2_provider.models import AccessToken, Grant, IDToken, RefreshToken
+
+from inclusion_connect.oidc_overrides import partitions
+from tests.oidc_overrides.factories import DEFAULT_CLIENT_SECRET, ApplicationFactory
+from tests.oidc_overrides.test_access_tokens import get_tokens, userinfo
+from tests.users.factories import UserFactory
+
+
+TOKEN_MODELS = [Grant, IDToken, AccessToken, RefreshToken]
+
+
+@pytest.fixture
+def application(oidc_params):
+    return ApplicationFactory(client_id=oidc_params["client_id"])
+
+
+def partitiontokens(*args):
+    stdout = io.StringIO()
+    call_command("partitiontokens", *args, stdout=stdout)
+    return stdout.getvalue()
+
+
+def refresh(client, oidc_params, refresh_token):
+    response = client.post(
+        reverse("oauth2_provider:token"),
+        data={
+            "client_id": oidc_params["client_id"],
+            "client_secret": DEFAULT_CLIENT_SECRET,
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+        },
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_convert(client, oidc_params, application):
+    client.force_login(UserFactory())
+    with freeze_time("2023-05-04 23:50:00") as frozen_time:
+        old_tokens = get_tokens(client, oidc_params)
+        old_access_token = AccessToken.objects.get()
+
+        frozen_time.move_to("2023-05-05 00:10:00")
+        assert partitiontokens("--convert", "--ahead=1") == (
+            "oauth2_provider_grant partitionnée.\n"
+            "oauth2_provider_idtoken partitionnée.\n"
+            "oauth2_provider_accesstoken partitionnée.\n"
+            "oauth2_provider_refreshtoken partitionnée.\n"
+            "oauth2_provider_grant : 0 partition(s) créée(s), 0 supprimée(s).\n"
+            "oauth2_provider_idtoken : 0 partition(s) créée(s), 0 supprimée(s).\n"
+            "oauth2_provider_accesstoken : 0 partition(s) créée(s), 0 supprimée(s).\n"
+            "oauth2_provider_refreshtoken : 0 partition(s) créée(s), 0 supprimée(s).\n"
+        )
+        for model in TOKEN_MODELS:
+            assert partitions.is_partitioned(model)
+        # From the oldest token, the grant was deleted once exchanged.
+        assert list(partitions.partitions("oauth2_provider_grant")) == [
+            "oauth2_provider_grant_p20230505",
+            "oauth2_provider_grant_p20230506",
+        ]
+        assert list(partitions.partitions("oauth2_provider_accesstoken")) == [
+            "oauth2_provider_accesstoken_p20230504",
+            "oauth2_provider_accesstoken_p20230505",
+            "oauth2_provider_accesstoken_p20230506",
+        ]
+
+        # The existing tokens were copied.
+        assert AccessToken.objects.get() == old_access_token
+        assert userinfo(client, old_tokens["access_token"]).status_code == 200
+        tokens = refresh(client, oidc_params, old_tokens["refresh_token"])
+        assert userinfo(client, tokens["access_token"]).status_code == 200
+        new_access_token = AccessToken.objects.get(token=tokens["access_token"])
+        assert new_access_token.pk > old_access_token.pk
+        assert new_access_token.source_refresh_token.token == old_tokens["refresh_token"]
+        assert RefreshToken.objects.get(token=tokens["refresh_token"]).access_token == new_access_token
+
+
+def test_convert_serial_ids(client, oidc_params, application):
+    client.force_login(UserFactory())
+    tables = partitions.token_tables()
+    with connection.cursor() as cursor:
+        # The tables created by the initial migrations of django-oauth-toolkit, before Django 4.1.
+        for table in tables:
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id DROP IDENTITY")
+            cursor.execute(f"CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id")
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+    with freeze_time("2023-05-05 00:10:00"):
+        tokens = get_tokens(client, oidc_params)
+        old_access_token = AccessToken.objects.get()
+        partitiontokens("--convert", "--ahead=1")
+        tokens = refresh(client, oidc_params, tokens["refresh_token"])
+        assert AccessToken.objects.get(token=tokens["access_token"]).pk > old_access_token.pk
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+            assert cursor.fetchone() == (f"public.{table}_id_seq",)
+
+
+def test_maintenance(client, oidc_params, application):
+    client.force_login(UserFactory())
+    with freeze_time("2023-05-04 12:00:00") as frozen_time:
+        partitiontokens("--convert", "--ahead=0")
+        get_tokens(client, oidc_params)
+
+        frozen_time.move_to("2023-05-05 00:00:00")
+        assert partitiontokens("--ahead=1").splitlines()[0] == (
+            "oauth2_provider_grant : 2 partition(s) créée(s), 0 supprimée(s)."
+        )
+        get_tokens(client, oidc_params)
+        # Once all the tokens of the first day expired.
+        frozen_time.move_to("2023-05-05 00:00:00")
+        frozen_time.tick(partitions.retention())
+        assert partitiontokens("--ahead=1").splitlines()[0] == (
+            "oauth2_provider_grant : 0 partition(s) créée(s), 1 supprimée(s)."
+        )
+        for model in TOKEN_MODELS:
+            assert list(partitions.partitions(model._meta.db_table)) == [
+                f"{model._meta.db_table}_p20230505",
+                f"{model._meta.db_table}_p20230506",
+            ]
+        assert AccessToken.objects.count() == IDToken.objects.count() == RefreshToken.objects.count() == 1
+        # The row by row purge skips the partitioned tables.
+        stdout = io.StringIO()
+        call_command("purgeexpired", stdout=stdout)
+        assert "access tokens : table partitionnée, purgée par partitiontokens.\n" in stdout.getvalue()
+
+
+def partition_of(model, pk):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT tableoid::regclass::text FROM {model._meta.db_table} WHERE id = %s", [pk])
+        return cursor.fetchone()[0]
+
+
+def test_default_partition(client, oidc_params, application):
+    client.force_login(UserFactory())
+    with freeze_time("2023-05-04 12:00:00") as frozen_time:
+        partitiontokens("--convert", "--ahead=0")
+
+        # partitiontokens stopped running.
+        frozen_time.move_to("2023-05-06 12:00:00")
+        get_tokens(client, oidc_params)
+        old_access_token = AccessToken.objects.get()
+        frozen_time.move_to("2023-05-08 12:00:00")
+        tokens = get_tokens(client, oidc_params)
+        access_token = AccessToken.objects.get(token=tokens["access_token"])
+        assert partition_of(AccessToken, access_token.pk) == "oauth2_provider_accesstoken_default"
+
+        output = partitiontokens("--ahead=1").splitlines()
+        assert "oauth2_provider_accesstoken : 2 partition(s) créée(s), 1 supprimée(s)." in output
+        assert "oauth2_provider_accesstoken_default : 1 jeton(s) expiré(s) supprimé(s)." in output
+        # Moved to the new partition.
+        assert partition_of(AccessToken, access_token.pk) == "oauth2_provider_accesstoken_p20230508"
+        assert not AccessToken.objects.filter(pk=old_access_token.pk).exists()
+        assert userinfo(client, tokens["access_token"]).status_code == 200
+        for model in TOKEN_MODELS:
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) FROM {partitions.default_partition(model._meta.db_table)}")
+                assert cursor.fetchone() == (0,)
+
+
+def test_not_partitioned():
+    assert partitiontokens().splitlines()[0] == "oauth2_provider_grant n’est pas partitionnée, voir --convert."
+
+
+def test_dropped_partition_references(client, oidc_params, application):
+    user = UserFactory()
+    client.force_login(user)
+    with freeze_time("2023-05-04 23:59:59") as frozen_time:
+        partitiontokens("--convert", "--ahead=1")
+        access_token = AccessToken.objects.create(
+            user=user, application=application, token="access", expires=datetime.datetime.now(datetime.UTC)
+        )
+        frozen_time.tick()
+        # Created by the same request, across midnight.
+        RefreshToken.objects.create(user=user, application=application, token="refresh", access_token=access_token)
+        tokens = get_tokens(client, oidc_params)
+
+        frozen_time.move_to("2023-05-05 00:00:00")
+        frozen_time.tick(partitions.retention())
+        partitiontokens("--ahead=1")
+        assert not AccessToken.objects.filter(pk=access_token.pk).exists()
+        refresh_token = RefreshToken.objects.get(token="refresh")
+        assert refresh_token.access_token_id is None
+        assert refresh_token.revoked == datetime.datetime(2023, 5, 5, tzinfo=datetime.UTC)
+        response = client.post(
+            reverse("oauth2_provider:token"),
+            data={
+                "client_id": oidc_params["client_id"],
+                "client_secret": DEFAULT_CLIENT_SECRET,
+                "grant_type": "refresh_token",
+                "refresh_token": "refresh",
+            },
+        )
+        assert response.status_code == 400
+        assert response.json() == {"error": "invalid_grant"}
+        # The tokens of the following day are untouched.
+        assert RefreshToken.objects.get(token=tokens["refresh_token"]).access_token.token == tokens["access_token"]
@@ -0,0 +1,76 @@
+import datetime
+import io
+
+from django.core.management import call_command
+from django.utils import timezone
+from freezegun import freeze_time
+from oauth2_provider.models import AccessToken, Grant, IDToken, RefreshToken
+
+from inclusion_connect.oidc_overrides.models import JWTRevocation
+from inclusion_connect.users.models import UserSession
+from tests.conftest import Client
+from tests.oidc_overrides.factories import ApplicationFactory
+from tests.users.factories import UserFactory
+
+
+def create_tokens(name, application, user, lifetime):
+    expires = timezone.now() + lifetime
+    id_token = IDToken.objects.create(application=application, user=user, expires=expires)
+    access_token = AccessToken.objects.create(
+        application=application, user=user, token=f"access_{name}", id_token=id_token, expires=expires
+    )
+    RefreshToken.objects.create(application=application, user=user, token=f"refresh_{name}", access_token=access_token)
+    Grant.objects.create(
+        application=application, user=user, code=f"code_{name}", redirect_uri="http://localhost/", expires=expires
+    )
+    JWTRevocation.objects.create(jti=f"jti_{name}", expires=expires)
+
+
+def purge(*args):
+    stdout = io.StringIO()
+    call_command("purgeexpired", *args, stdout=stdout)
+    return stdout.getvalue()
+
+
+def test_purgeexpired(mocker):
+    sleep = mocker.patch("time.sleep")
+    application = ApplicationFactory()
+    user = UserFactory()
+    with freeze_time("2023-05-05 14:00:00") as frozen_time:
+        Client().force_login(user)
+        create_tokens("expired", application, user, datetime.timedelta(minutes=30))
+        frozen_time.move_to("2023-05-05 14:45:00")
+        Client().force_login(user)
+        create_tokens("valid", application, user, datetime.timedelta(minutes=30))
+
+        frozen_time.move_to("2023-05-05 15:01:00")
+        assert purge("--batch-size=1", "--sleep=0.5") == (
+            "sessions : 1 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+            "revoked refresh tokens : 0 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+            "expired refresh tokens : 1 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+            "access tokens : 1 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+            "ID tokens : 1 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+            "grants : 1 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+            "JWT revocations : 1 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+            "Total : 6 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+        )
+    # Between full batches.
+    assert sleep.call_args_list == [mocker.call(0.5)] * 6
+    assert UserSession.objects.get().expire_date == datetime.datetime(2023, 5, 5, 15, 15, tzinfo=datetime.UTC)
+    assert list(AccessToken.objects.values_list("token", flat=True)) == ["access_valid"]
+    assert list(RefreshToken.objects.values_list("token", flat=True)) == ["refresh_valid"]
+    assert IDToken.objects.count() == 1
+    assert list(Grant.objects.values_list("code", flat=True)) == ["code_valid"]
+    assert list(JWTRevocation.objects.values_list("jti", flat=True)) == ["jti_valid"]
+
+
+def test_purgeexpired_max_runtime():
+    with freeze_time("2023-05-05 14:00:00") as frozen_time:
+        Client().force_login(UserFactory())
+        frozen_time.move_to("2023-05-05 15:00:00")
+        assert purge("--max-runtime=0") == (
+            "sessions : 0 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+            "Durée maximale de 0 s atteinte.\n"
+            "Total : 0 ligne(s) supprimée(s) en 0.0 s (0 lignes/s).\n"
+        )
+    assert UserSession.objects.exists()
@@ -0,0 +1,139 @@
+import pytest
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+
+from inclusion_connect.oidc_overrides.models import Application
+from inclusion_connect.oidc_overrides.registry import NOTIFY_CHANNEL, ApplicationRegistry, applications
+from tests.helpers import oidc_complete_flow, wait_for
+from tests.oidc_overrides.factories import ApplicationFactory
+from tests.users.factories import UserFactory
+
+
+class TestApplicationRegistry:
+    def test_read_through(self, django_assert_num_queries):
+        application = ApplicationFactory()
+        registry = ApplicationRegistry()
+        with django_assert_num_queries(1):
+            assert registry.get(application.client_id) == application
+            assert registry.get(application.client_id) == application
+            assert registry.get_by_pk(application.pk) == application
+        assert registry.stats() == {"hits": 2, "misses": 1, "size": 1}
+
+    def test_unknown_application(self):
+        registry = ApplicationRegistry()
+        with pytest.raises(Application.DoesNotExist):
+            registry.get("unknown")
+        with pytest.raises(Application.DoesNotExist):
+            registry.get("unknown")
+        assert registry.stats() == {"hits": 0, "misses": 2, "size": 0}
+
+    def test_save_invalidates(self):
+        application = ApplicationFactory(name="Old name")
+        assert applications.get(application.client_id).name == "Old name"
+        application.name = "New name"
+        application.save()
+        assert applications.get(application.client_id).name == "New name"
+
+    def test_delete_invalidates(self):
+        application = ApplicationFactory()
+        applications.get(application.client_id)
+        application.delete()
+        with pytest.raises(Application.DoesNotExist):
+            applications.get(application.client_id)
+
+    def test_listen(self):
+        application = ApplicationFactory(name="Old name")
+        registry = ApplicationRegistry()
+        registry.listen()
+        try:
+            # The registry is cleared once listening.
+            wait_for(lambda: registry._generation > 0)
+            assert registry.get(application.client_id).name == "Old name"
+            # Simulate a change from another process.
+            Application.objects.filter(pk=application.pk).update(name="New name")
+            with connection.get_new_connection(connection.get_connection_params()) as other_process_connection:
+                other_process_connection.autocommit = True
+                other_process_connection.execute("SELECT pg_notify(%s, '')", [NOTIFY_CHANNEL])
+            wait_for(lambda: registry.get(application.client_id).name == "New name")
+        finally:
+            registry.stop()
+
+
+class TestFindByPostLogoutRedirectURI:
+    def reference(self, uri):
+        """Linear scan, used before the index."""
+        application = None
+        for app in Application.objects.order_by("pk"):
+            if app.post_logout_redirect_uri_allowed(uri):
+                application = app
+        return application
+
+    @pytest.mark.parametrize(
+        "uri",
+        [
+            "http://callback/",
+            "http://callback/other",
+            "https://rp.com/logout",
+            "https://rp.com/logout?state=1",
+            "https://rp.com/other",
+            "https://tenant.rp.com/anything",
+            "https://tenant.rp.com.evil.com/anything",
+            "http://127.0.0.1:8080/logout",
+            "custom://evil.com/logout",
+            "custom:logout",
+            "https://unknown.com/",
+        ],
+    )
+    def test_same_semantics_as_linear_scan(self, uri):
+        ApplicationFactory(post_logout_redirect_uris="http://callback/")
+        ApplicationFactory(post_logout_redirect_uris="https://rp.com/logout http://127.0.0.1/logout")
+        ApplicationFactory(post_logout_redirect_uris="https://tenant.rp.com/* http://callback/")
+        ApplicationFactory(post_logout_redirect_uris="custom:*")
+        ApplicationFactory(post_logout_redirect_uris="https://rp.com/logout?state=1")
+        assert applications.find_by_post_logout_redirect_uri(uri) == self.reference(uri)
+
+    def test_several_applications_match(self):
+        ApplicationFactory(post_logout_redirect_uris="http://callback/")
+        last = ApplicationFactory(post_logout_redirect_uris="http://callback/*")
+        ApplicationFactory(post_logout_redirect_uris="http://other/")
+        assert applications.find_by_post_logout_redirect_uri("http://callback/") == last
+
+    def test_allow_all_redirect_uris(self):
+        ApplicationFactory(post_logout_redirect_uris="http://callback/")
+        last = ApplicationFactory(post_logout_redirect_uris="http://other/")
+        with override_settings(ALLOW_ALL_REDIRECT_URIS=True):
+            assert applications.find_by_post_logout_redirect_uri("http://anything/") == last
+
+    def test_index_built_once(self, django_assert_num_queries):
+        application = ApplicationFactory(post_logout_redirect_uris="http://callback/")
+        ApplicationFactory.create_batch(10, post_logout_redirect_uris="http://other/")
+        with django_assert_num_queries(1):
+            assert applications.find_by_post_logout_redirect_uri("http://callback/") == application
+            assert applications.find_by_post_logout_redirect_uri("http://callback/") == application
+            assert applications.find_by_post_logout_redirect_uri("http://unknown/") is None
+            # Applications are cached as well.
+            assert applications.get(application.client_id) == application
+
+    def test_save_invalidates(self):
+        application = ApplicationFactory(post_logout_redirect_uris="http://callback/")
+        assert applications.find_by_post_logout_redirect_uri("http://callback/") == application
+        application.post_logout_redirect_uris = "http://other/"
+        application.save()
+        assert applications.find_by_post_logout_redirect_uri("http://callback/") is None
+        assert applications.find_by_post_logout_redirect_uri("http://other/") == application
+
+
+def test_authorization_flow_uses_registry(caplog, client, oidc_params):
+    application = ApplicationFactory(client_id=oidc_params["client_id"])
+    hits = applications.hits
+    oidc_complete_flow(client, UserFactory(), oidc_params, caplog, application=application)
+    assert applications.hits > hits
+
+
+def test_my_account_without_referrer_does_not_query_applications(client):
+    client.force_login(UserFactory())
+    stats = applications.stats()
+    response = client.get(reverse("accounts:edit_user_info"))
+    assert response.status_code == 200
+    assert applications.stats() == stats
@@ -1,16 +1,24 @@
+import base64
 import datetime
+import io
 import logging
+from urllib.parse import urlparse
 
 import pytest
 from django.contrib.auth import get_user
-from django.contrib.sessions.models import Session
+from django.core.management import call_command
 from django.test import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from freezegun import freeze_time
+from oauth2_provider import oauth2_validators, views as oauth2_views
+from oauth2_provider.models import redirect_to_uri_allowed
 from pytest_django.asserts import assertContains, assertRedirects
 
-from inclusion_connect.users.models import UserApplicationLink
+from inclusion_connect.oidc_overrides.keys import RELOAD_SECS, key_ring
+from inclusion_connect.oidc_overrides.models import RedirectURIMatcher, SigningKey, compile_uris
+from inclusion_connect.oidc_overrides.views import has_live_tokens
+from inclusion_connect.users.models import UserApplicationLink, UserSession
 from inclusion_connect.utils.oidc import OIDC_SESSION_KEY
 from inclusion_connect.utils.urls import add_url_params, get_url_params
 from tests.asserts import assertRecords
@@ -58,6 +66,80 @@ class TestPostLogoutRedirectUris:
         assert not application.post_logout_redirect_uri_allowed("http://localhost/callback")
 
 
+def reference_uri_allowed(allowed_uris, uri):
+    """Implementation before the URIs were compiled."""
+    if redirect_to_uri_allowed(uri, allowed_uris.split()):
+        return True
+    for allowed_uri in allowed_uris.split():
+        if allowed_uri == "*":
+            continue
+        allowed_path = urlparse(allowed_uri).path
+        if allowed_path and allowed_path[-1] == "*" and uri.startswith(allowed_uri[:-1]):
+            return True
+    return False
+
+
+class TestRedirectURIMatcher:
+    @pytest.mark.parametrize(
+        "allowed_uris",
+        [
+            "",
+            "*",
+            "http://localhost/callback",
+            "http://localhost/*",
+            "http://localhost*",
+            "http://localhost/a*b",
+            "https://localhost/callback?param=1",
+            "https://localhost/callback/* https://other/callback?param=1 https://other/*?q=*",
+            "http://127.0.0.1/callback http://[::1]/callback http://127.0.0.1:8000/port",
+            "myapp://callback custom:*",
+        ],
+    )
+    @pytest.mark.parametrize(
+        "uri",
+        [
+            "",
+            "*",
+            "http://localhost/callback",
+            "http://localhost/callback?state=1",
+            "http://localhost/",
+            "http://localhost",
+            "http://localhost.evil.com/",
+            "http://localhost/a",
+            "http://localhost/abc",
+            "https://localhost/callback",
+            "https://localhost/callback?param=1",
+            "https://localhost/callback?param=2&param=1",
+            "https://localhost/callback/",
+            "https://localhost/callback/nested?param=1",
+            "https://other/callback?param=1&state=2",
+            "https://other/callback?q=1",
+            "https://other/anything?q=1",
+            "http://127.0.0.1:1234/callback",
+            "http://[::1]:1234/callback",
+            "http://127.0.0.1:1234/port",
+            "http://127.0.0.1:8000/port",
+            "myapp://callback",
+            "custom:path",
+        ],
+    )
+    def test_same_semantics_as_reference(self, allowed_uris, uri):
+        matcher = RedirectURIMatcher(allowed_uris.split())
+        assert matcher.allowed(uri) is reference_uri_allowed(allowed_uris, uri)
+
+    def test_compiled_once_per_uris(self):
+        application = ApplicationFactory(redirect_uris="http://localhost/callback")
+        matcher = compile_uris(application.redirect_uris)
+        assert application.redirect_uri_allowed("http://localhost/callback")
+        assert compile_uris(application.redirect_uris) is matcher
+
+        application.redirect_uris = "http://localhost/other"
+        application.save()
+        application.refresh_from_db()
+        assert application.redirect_uri_allowed("http://localhost/callback") is False
+        assert application.redirect_uri_allowed("http://localhost/other") is True
+
+
 class TestLogoutView:
     def test_id_token_hint(self, caplog, client, oidc_params):
         """This test simulates a call on logout endpoint with id_hint params"""
@@ -93,6 +175,26 @@ class TestLogoutView:
             ],
         )
 
+    def test_logout_ends_all_user_sessions(self, caplog, client, oidc_params):
+        user = UserFactory()
+        other_browser = Client()
+        other_browser.force_login(user)
+        other_user_browser = Client()
+        other_user_browser.force_login(UserFactory())
+        id_token = oidc_complete_flow(client, user, oidc_params, caplog)
+
+        response = call_logout(
+            client,
+            "get",
+            {"id_token_hint": id_token, "post_logout_redirect_uri": "http://callback/"},
+        )
+        assertRedirects(response, "http://callback/", fetch_redirect_response=False)
+        assert get_user(client).is_authenticated is False
+        assert get_user(other_browser).is_authenticated is False
+        assert get_user(other_user_browser).is_authenticated is True
+        assert has_ongoing_sessions(user) is False
+        caplog.clear()
+
     def test_expired_token_and_session(self, caplog, client, oidc_params):
         """This test simulates a call on logout endpoint with expired token and sessions"""
         user = UserFactory()
@@ -136,6 +238,14 @@ class TestLogoutView:
                 ],
             )
 
+    def test_has_live_tokens_single_query(self, caplog, client, django_assert_num_queries, oidc_params):
+        user = UserFactory()
+        with django_assert_num_queries(1):
+            assert has_live_tokens(user) is False
+        oidc_complete_flow(client, user, oidc_params, caplog)
+        with django_assert_num_queries(1):
+            assert has_live_tokens(user) is True
+
     def test_bad_id_token_hint_with_logged_in_user_fails(self, caplog, client, oidc_params):
         """This test simulates a call on logout endpoint with an unknown id_token_hint"""
         user = UserFactory()
@@ -577,6 +687,14 @@ def test_user_application_link(client, oidc_params):
     ]
 
     with freeze_time("2023-04-27 14:08"):
+        client.get(auth_url_1)
+
+    assert get_user_application_link_values_list() == [
+        (application_2.pk, user.pk, dt_2),
+        (application_1.pk, user.pk, dt_1),  # last_login is recent enough
+    ]
+
+    with freeze_time("2023-04-27 14:12"):
         dt_3 = timezone.now()
         client.get(auth_url_1)
 
@@ -612,7 +730,7 @@ def test_session_duration(client, oidc_params):
         client.get(response.url)
         assert OIDC_SESSION_KEY not in client.session
 
-    session = Session.objects.get()
+    session = UserSession.objects.get()
     assert session.expire_date == now + datetime.timedelta(minutes=30)
 
     # 1O minutes later
@@ -624,7 +742,7 @@ def test_session_duration(client, oidc_params):
         assert response.url.startswith(oidc_params["redirect_uri"])
 
     # No change in expire_date
-    session = Session.objects.get()
+    session = UserSession.objects.get()
     assert session.expire_date == now + datetime.timedelta(minutes=30)
 
 
@@ -665,6 +783,110 @@ def test_access_token_lifespan(client, oidc_params):
         assert response.status_code == 401
 
 
+class TestClientAuthentication:
+    @staticmethod
+    def token(client, application, client_secret=DEFAULT_CLIENT_SECRET, basic_auth=False):
+        data = {"code": "unknown", "grant_type": "authorization_code", "redirect_uri": "http://localhost/callback"}
+        headers = {}
+        if basic_auth:
+            credentials = base64.b64encode(f"{application.client_id}:{client_secret}".encode()).decode()
+            headers["Authorization"] = f"Basic {credentials}"
+        else:
+            data |= {"client_id": application.client_id, "client_secret": client_secret}
+        return client.post(reverse("oauth2_provider:token"), data=data, headers=headers)
+
+    @pytest.mark.parametrize("basic_auth", [True, False])
+    def test_verified_secret_is_cached(self, client, mocker, basic_auth):
+        application = ApplicationFactory()
+        check_password = mocker.spy(oauth2_validators, "check_password")
+
+        for _ in range(3):
+            response = self.token(client, application, basic_auth=basic_auth)
+            # The client is authenticated, the code is not.
+            assert response.json() == {"error": "invalid_grant"}
+        assert check_password.call_count == 1
+
+    def test_wrong_secret(self, client, mocker):
+        application = ApplicationFactory()
+        self.token(client, application)
+        check_password = mocker.spy(oauth2_validators, "check_password")
+
+        for _ in range(2):
+            response = self.token(client, application, client_secret="wrong")
+            assert response.status_code == 401
+            assert response.json() == {"error": "invalid_client"}
+        # Failed verifications are not cached.
+        assert check_password.call_count == 2
+
+    def test_secret_changed(self, client):
+        application = ApplicationFactory()
+        assert self.token(client, application).json() == {"error": "invalid_grant"}
+
+        application.client_secret = "new secret"
+        application.save()
+        assert self.token(client, application).json() == {"error": "invalid_client"}
+        assert self.token(client, application, client_secret="new secret").json() == {"error": "invalid_grant"}
+
+    def test_expiration(self, client, mocker, settings):
+        settings.OIDC_CLIENT_SECRET_CACHE_SECS = 0
+        application = ApplicationFactory()
+        check_password = mocker.spy(oauth2_validators, "check_password")
+
+        for _ in range(2):
+            assert self.token(client, application).json() == {"error": "invalid_grant"}
+        assert check_password.call_count == 2
+
+
 def test_discovery_view(client):
     response = client.get(reverse("oauth2_provider:oidc-connect-discovery-info"))
     assert response.status_code == 200
+
+
+class TestWellKnownDocuments:
+    @pytest.mark.parametrize("url_name", ["oauth2_provider:oidc-connect-discovery-info", "oauth2_provider:jwks-info"])
+    def test_conditional_get(self, client, django_assert_num_queries, url_name):
+        url = reverse(url_name)
+        # The signing keys are reloaded every RELOAD_SECS.
+        key_ring.keys()
+        # No transaction.
+        with django_assert_num_queries(0):
+            response = client.get(url)
+        assert response.status_code == 200
+        assert response["Cache-Control"] == "public, max-age=3600"
+        assert response["Access-Control-Allow-Origin"] == "*"
+        etag = response["ETag"]
+
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+
+        response = client.get(url, headers={"If-None-Match": '"other"'})
+        assert response.status_code == 200
+
+    def test_built_once(self, client, mocker):
+        get = mocker.spy(oauth2_views.ConnectDiscoveryInfoView, "get")
+        url = reverse("oauth2_provider:oidc-connect-discovery-info")
+        first = client.get(url)
+        second = client.get(url)
+        assert second.content == first.content
+        assert get.call_count == 1
+
+    def test_by_url(self, client):
+        auth = client.get(reverse("oauth2_provider:oidc-connect-discovery-info")).json()
+        realm = client.get("/realms/local/.well-known/openid-configuration/").json()
+        other_host = client.get(
+            reverse("oauth2_provider:oidc-connect-discovery-info"), headers={"Host": "localhost:8080"}
+        ).json()
+        assert auth["issuer"] == realm["issuer"] == "http://testserver/auth"
+        assert other_host["issuer"] == "http://localhost:8080/auth"
+
+    def test_signing_keys_change(self, client):
+        url = reverse("oauth2_provider:jwks-info")
+        with freeze_time("2023-05-05 14:00:00") as frozen_time:
+            [key] = client.get(url).json()["keys"]
+            call_command("rotatesigningkeys", stdout=io.StringIO())
+            frozen_time.tick(RELOAD_SECS)
+            assert [jwks_key["kid"] for jwks_key in client.get(url).json()["keys"]] == [
+                key["kid"],
+                SigningKey.objects.latest("activates_at").kid,
+            ]
@@ -0,0 +1,143 @@
+import datetime
+import logging
+
+import pytest
+from django.core import mail
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from freezegun import freeze_time
+
+from inclusion_connect.outbox import worker
+from inclusion_connect.outbox.models import OutgoingEmail
+from tests.users.factories import DEFAULT_PASSWORD
+
+
+MAILJET_SEND_URL = "https://mailjet.test/v3.1/send"
+
+
+@pytest.fixture(autouse=True)
+def outbox_settings(settings):
+    settings.EMAIL_BACKEND = "inclusion_connect.outbox.backends.EmailBackend"
+    settings.OUTBOX_EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+
+
+@pytest.fixture
+def mailjet(settings):
+    settings.OUTBOX_EMAIL_BACKEND = "anymail.backends.mailjet.EmailBackend"
+    settings.ANYMAIL = settings.ANYMAIL | {
+        "MAILJET_API_URL": "https://mailjet.test/v3.1/",
+        "MAILJET_API_KEY": "key",
+        "MAILJET_SECRET_KEY": "secret",
+    }
+
+
+def send_email(to):
+    mail.send_mail("Subject", "Body", None, [to], html_message="<p>Body</p>")
+
+
+def mailjet_result(to, success=True):
+    if success:
+        return {"Status": "success", "To": [{"Email": to, "MessageUUID": "uuid", "MessageID": 1, "MessageHref": ""}]}
+    return {"Status": "error", "Errors": [{"ErrorMessage": f"Invalid email {to}"}]}
+
+
+def test_register_stores_email(client):
+    response = client.post(
+        reverse("accounts:register"),
+        data={
+            "email": "user@mailinator.com",
+            "first_name": "Jack",
+            "last_name": "Jackson",
+            "password1": DEFAULT_PASSWORD,
+            "password2": DEFAULT_PASSWORD,
+            "terms_accepted": "on",
+        },
+    )
+    assert response.status_code == 302
+    # Not sent by the request.
+    assert mail.outbox == []
+    [outgoing_email] = OutgoingEmail.objects.all()
+    assert outgoing_email.to == ["user@mailinator.com"]
+
+    call_command("sendemails", "--once")
+    [email] = mail.outbox
+    assert email.to == ["user@mailinator.com"]
+    assert email.subject == "Vérification de l’adresse e-mail"
+    assert email.body == outgoing_email.body
+    assert email.alternatives == [(outgoing_email.html_body, "text/html")]
+    assert OutgoingEmail.objects.exists() is False
+
+
+@freeze_time("2023-05-05 14:00:00")
+def test_mailjet_batch(caplog, mailjet, requests_mock):
+    send_email("ok@mailinator.com")
+    send_email("ko@mailinator.com")
+    requests_mock.post(
+        MAILJET_SEND_URL,
+        status_code=400,
+        json={"Messages": [mailjet_result("ok@mailinator.com"), mailjet_result("ko@mailinator.com", success=False)]},
+    )
+    call_command("sendemails", "--once")
+
+    # A single request for the batch.
+    [request] = requests_mock.request_history
+    assert request.headers["Authorization"] == "Basic a2V5OnNlY3JldA=="
+    messages = request.json()["Messages"]
+    assert [message["To"] for message in messages] == [
+        [{"Email": "ok@mailinator.com"}],
+        [{"Email": "ko@mailinator.com"}],
+    ]
+    assert messages[0]["Subject"] == "Subject"
+    assert messages[0]["TextPart"] == "Body"
+    assert messages[0]["HTMLPart"] == "<p>Body</p>"
+    [failed] = OutgoingEmail.objects.all()
+    assert failed.to == ["ko@mailinator.com"]
+    assert failed.attempts == 1
+    assert failed.last_error == "Invalid email ko@mailinator.com"
+    assert failed.next_attempt_at == datetime.datetime(2023, 5, 5, 14, 0, 30, tzinfo=datetime.UTC)
+    assert caplog.record_tuples == [
+        (
+            "inclusion_connect.outbox",
+            logging.WARNING,
+            f"Email {failed.pk} not sent, attempt 1: Invalid email ko@mailinator.com",
+        )
+    ]
+
+
+def test_retries_with_exponential_backoff(caplog, mailjet, requests_mock):
+    requests_mock.post(MAILJET_SEND_URL, status_code=503)
+    with freeze_time("2023-05-05 14:00:00") as frozen_time:
+        send_email("user@mailinator.com")
+        retries = []
+        for _ in range(worker.MAX_ATTEMPTS):
+            call_command("sendemails", "--once")
+            outgoing_email = OutgoingEmail.objects.get()
+            if outgoing_email.next_attempt_at is None:
+                break
+            # Not retried before the delay.
+            call_command("sendemails", "--once")
+            retries.append(outgoing_email.next_attempt_at - timezone.now())
+            frozen_time.move_to(outgoing_email.next_attempt_at)
+    assert retries == [datetime.timedelta(seconds=30 * 2**attempt) for attempt in range(worker.MAX_ATTEMPTS - 1)]
+    assert len(requests_mock.request_history) == worker.MAX_ATTEMPTS
+    assert outgoing_email.attempts == worker.MAX_ATTEMPTS
+    assert "503 Server Error" in outgoing_email.last_error
+    assert caplog.record_tuples[-1][:2] == ("inclusion_connect.outbox", logging.ERROR)
+
+    # Given up.
+    call_command("sendemails", "--once")
+    assert len(requests_mock.request_history) == worker.MAX_ATTEMPTS
+
+
+def test_mailjet_rejected_request(mailjet, requests_mock):
+    send_email("user@mailinator.com")
+    requests_mock.post(
+        MAILJET_SEND_URL,
+        status_code=400,
+        json={"ErrorCode": "mj-0002", "ErrorMessage": "Malformed JSON", "StatusCode": 400},
+    )
+    call_command("sendemails", "--once")
+    outgoing_email = OutgoingEmail.objects.get()
+    assert outgoing_email.attempts == 1
+    assert "Malformed JSON" in outgoing_email.last_error
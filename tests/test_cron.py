@@ -15,13 +15,25 @@ def normalize_cron_definition(definition):
     return CronDefinition(f"{minute} {hour} {day_of_month} {month} {day_of_week}", " ".join(cmd))
 
 
+def procfile_workers(root):
+    """The Procfile workers, run every minute by a cron on CleverCloud."""
+    workers = []
+    for line in (root / "Procfile").read_text().splitlines():
+        name, command = line.split(": ", 1)
+        if name != "web":
+            _launcher, *cmd = command.split()
+            workers.append(CronDefinition("* * * * *", " ".join([*cmd, "--once"])))
+    return workers
+
+
 def test_clevercloud_and_scalingo_definition_match():
     root = settings.BASE_DIR.parent
     clever_path = root / "clevercloud" / "cron.json"
     scalingo_path = root / "cron.json"
     clever_crons = json.loads(clever_path.read_bytes())
     scalingo_crons = json.loads(scalingo_path.read_bytes())
-    assert len(clever_crons) == len(scalingo_crons["jobs"])
     clever_cmds = sorted([normalize_cron_definition(entry) for entry in clever_crons])
-    scalingo_cmds = sorted([normalize_cron_definition(entry["command"]) for entry in scalingo_crons["jobs"]])
+    scalingo_cmds = sorted(
+        [normalize_cron_definition(entry["command"]) for entry in scalingo_crons["jobs"]] + procfile_workers(root)
+    )
     assert clever_cmds == scalingo_cmds
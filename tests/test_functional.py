@@ -8,6 +8,7 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user
 from django.core import mail
+from django.core.management import call_command
 from django.db.models import F
 from django.urls import reverse
 from freezegun import freeze_time
@@ -1754,6 +1755,9 @@ def test_use_peama(client, oidc_params, requests_mock, caplog):
         "get",
         {"id_token_hint": id_token, "post_logout_redirect_uri": "http://callback/"},
     )
+    # The logout from PEAMA is sent by the worker.
+    assert logout_endpoint.call_count == 0
+    call_command("federationlogouts", "--once")
     assert logout_endpoint.call_count == 1
     assertRedirects(response, "http://callback/", fetch_redirect_response=False)
     assert not get_user(client).is_authenticated
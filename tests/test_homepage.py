@@ -2,6 +2,7 @@ from django.test import override_settings
 from django.urls import reverse
 
 from tests.conftest import parse_response_to_soup
+from tests.users.factories import UserFactory
 
 
 def test_homepage(client, snapshot):
@@ -10,3 +11,13 @@ def test_homepage(client, snapshot):
 
         script_content = parse_response_to_soup(response)
         assert str(script_content) == snapshot
+
+
+def test_homepage_does_not_load_the_session(client, django_assert_num_queries, settings):
+    # The default storage only reads the session for the messages overflowing the cookie.
+    settings.MESSAGE_STORAGE = "django.contrib.messages.storage.session.SessionStorage"
+    client.force_login(UserFactory())
+    with django_assert_num_queries(0):
+        response = client.get(reverse("homepage"))
+    assert response.status_code == 200
+    assert not response.wsgi_request.session.accessed
@@ -1,9 +1,20 @@
+import gzip
+import http.server
+import inspect
+import json
 import logging
+import os
+import threading
+import time
 from unittest import mock
 
+import pytest
+from django.db import transaction
+from django.test import RequestFactory
 from freezegun import freeze_time
 
-from inclusion_connect.logging import ElasticSearchHandler
+from inclusion_connect.logging import ElasticSearchHandler, Spool, flush_audit_events, log_event
+from tests.helpers import wait_for
 
 
 @freeze_time("2023-05-05 11:11:11")
@@ -16,30 +27,415 @@ def test_log_formatting(snapshot):
     assert stream.read() == snapshot(name="log serialized as JSON with metadata")
 
 
-@mock.patch("inclusion_connect.logging.bulk")
+class TestLogEvent:
+    def test_logged_together_on_commit(self, caplog, django_capture_on_commit_callbacks):
+        request = RequestFactory().get("/")
+        auth_logger = logging.getLogger("inclusion_connect.auth")
+        oidc_logger = logging.getLogger("inclusion_connect.oidc")
+        with django_capture_on_commit_callbacks() as callbacks:
+            log_event(request, auth_logger, {"event": "login"})
+            log_event(request, oidc_logger, {"event": "token"})
+            log_event(request, auth_logger, {"event": "edit_user_info"})
+        assert caplog.record_tuples == []
+        *first_callbacks, last_callback = callbacks
+        for callback in first_callbacks:
+            callback()
+        # Handed over with the last event.
+        assert caplog.record_tuples == []
+        last_callback()
+        assert caplog.record_tuples == [
+            ("inclusion_connect.auth", logging.INFO, "{'event': 'login'}"),
+            ("inclusion_connect.oidc", logging.INFO, "{'event': 'token'}"),
+            ("inclusion_connect.auth", logging.INFO, "{'event': 'edit_user_info'}"),
+        ]
+
+    def test_not_logged_on_rollback(self, caplog, django_capture_on_commit_callbacks):
+        request = RequestFactory().get("/")
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    log_event(request, logging.getLogger("inclusion_connect.auth"), {"event": "login"})
+                    raise ValueError
+        assert caplog.record_tuples == []
+
+    def test_savepoint_rollback(self, caplog, django_capture_on_commit_callbacks):
+        request = RequestFactory().get("/")
+        logger = logging.getLogger("inclusion_connect.auth")
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                log_event(request, logger, {"event": "login"})
+                with pytest.raises(ValueError):
+                    with transaction.atomic():
+                        log_event(request, logger, {"event": "rolled_back"})
+                        raise ValueError
+                # Events recorded after the rollback are still logged.
+                log_event(request, logger, {"event": "edit_user_info"})
+                with transaction.atomic():
+                    log_event(request, logger, {"event": "token"})
+                log_event(request, logger, {"event": "logout"})
+        assert caplog.record_tuples == [
+            ("inclusion_connect.auth", logging.INFO, "{'event': 'login'}"),
+            ("inclusion_connect.auth", logging.INFO, "{'event': 'edit_user_info'}"),
+            ("inclusion_connect.auth", logging.INFO, "{'event': 'token'}"),
+            ("inclusion_connect.auth", logging.INFO, "{'event': 'logout'}"),
+        ]
+
+    def test_last_event_rolled_back(self, caplog, django_capture_on_commit_callbacks):
+        request = RequestFactory().get("/")
+        logger = logging.getLogger("inclusion_connect.auth")
+        with django_capture_on_commit_callbacks(execute=True):
+            log_event(request, logger, {"event": "login"})
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    log_event(request, logger, {"event": "rolled_back"})
+                    raise ValueError
+        assert caplog.record_tuples == []
+        # At the end of the request.
+        flush_audit_events(request)
+        assert caplog.record_tuples == [("inclusion_connect.auth", logging.INFO, "{'event': 'login'}")]
+
+    def test_caller_attributes(self, caplog, django_capture_on_commit_callbacks):
+        request = RequestFactory().get("/")
+        with django_capture_on_commit_callbacks(execute=True):
+            log_event(request, logging.getLogger("inclusion_connect.auth"), {"event": "login"})
+        [record] = caplog.records
+        assert record.pathname == __file__
+        assert record.funcName == "test_caller_attributes"
+        assert record.lineno == inspect.currentframe().f_lineno - 4
+
+    def test_handed_to_handlers_as_a_batch(self, django_capture_on_commit_callbacks):
+        request = RequestFactory().get("/")
+        [handler] = logging.getLogger("inclusion_connect").handlers
+        with mock.patch.object(handler, "handle_batch", wraps=handler.handle_batch) as handle_batch:
+            with django_capture_on_commit_callbacks(execute=True):
+                log_event(request, logging.getLogger("inclusion_connect.auth"), {"event": "login"})
+                log_event(request, logging.getLogger("inclusion_connect.oidc"), {"event": "token"})
+        [call] = handle_batch.call_args_list
+        assert [record.msg for record in call.args[0]] == [{"event": "login"}, {"event": "token"}]
+
+
+def make_record(msg="msg"):
+    return logging.LogRecord("test_logger", logging.INFO, "pathname", 1, msg, (), None)
+
+
+def bulk_stats(client, actions, **kwargs):
+    return len(list(actions)), 0
+
+
+@mock.patch("inclusion_connect.logging.bulk", side_effect=bulk_stats)
 class TestElasticSearchHandler:
-    def test_elastic_search_handler_sends_at_capacity(self, bulk_mock):
-        handler = ElasticSearchHandler(capacity=1, index_name="test", host="https://localhost:9200")
-        handler.handle(logging.LogRecord("test_logger", logging.INFO, "pathname", 1, "msg", (), None))
+    def test_sends_at_batch_size(self, bulk_mock):
+        handler = ElasticSearchHandler(batch_size=2, linger_secs=60, index_name="test", host="https://localhost:9200")
+        handler.handle(make_record("1"))
+        handler.handle(make_record("2"))
+        handler.handle(make_record("3"))
+        # The batch is sent without waiting for the linger time.
+        wait_for(lambda: bulk_mock.call_count == 1)
+        handler.close()
+        assert bulk_mock.call_count == 2
+        assert handler.stats() == {
+            "queued": 3,
+            "sent": 3,
+            "dropped": 0,
+            "retried": 0,
+            "spooled": 0,
+            "replayed": 0,
+            "errors": 0,
+            "pending": 0,
+        }
+
+    def test_sends_after_linger_time(self, bulk_mock):
+        handler = ElasticSearchHandler(batch_size=100, linger_secs=0, index_name="test", host="https://localhost:9200")
+        handler.handle(make_record())
+        wait_for(lambda: handler.stats()["sent"] == 1)
         bulk_mock.assert_called_once()
-        handler.timer.cancel()
+        handler.close()
 
-    def test_elastic_search_handler_after_some_time(self, bulk_mock):
+    def test_logs_stats(self, bulk_mock, caplog):
         handler = ElasticSearchHandler(
-            capacity=100,
-            index_name="test",
-            host="https://localhost:9200",
-            send_after_inactive_for_secs=0,
+            batch_size=100, linger_secs=0, stats_interval_secs=0, index_name="test", host="https://localhost:9200"
         )
-        handler.handle(logging.LogRecord("test_logger", logging.INFO, "pathname", 1, "msg", (), None))
+        handler.handle(make_record())
+        wait_for(lambda: any(record.name == "inclusion_connect.logging" for record in caplog.records))
+        handler.close()
+        record = next(record for record in caplog.records if record.name == "inclusion_connect.logging")
+        assert record.msg["event"] == "elasticsearch_handler_stats"
+        assert record.msg["queued"] == 1
 
-        # This might be a bit fragile: the timer thread may execute before the next assertion.
-        # That’s unlikely, considering the amount of work the timer thread has compared to the test thread,
-        # and thousands runs do not show flakiness.
-        # Keeping the assertion makes the test easier to follow and more robust.
+    def test_shipper_survives_errors(self, bulk_mock, caplog):
+        handler = ElasticSearchHandler(batch_size=1, linger_secs=0, index_name="test", host="https://localhost:9200")
+        with mock.patch.object(handler, "send_to_elastic", side_effect=RuntimeError("Boom")):
+            handler.handle(make_record("1"))
+            wait_for(lambda: handler.stats()["errors"] == 1)
+        # Later records are still shipped.
+        handler.handle(make_record("2"))
+        handler.close()
+        assert handler.stats()["sent"] == 1
+        assert any(record.exc_info for record in caplog.records if record.name == "inclusion_connect.logging")
+
+    def test_single_shipper_thread(self, bulk_mock):
+        handler = ElasticSearchHandler(batch_size=1, index_name="test", host="https://localhost:9200")
+        threads = threading.active_count()
+        for _ in range(50):
+            handler.handle(make_record())
+        assert threading.active_count() == threads + 1
+        handler.close()
+        assert threading.active_count() == threads
+        assert bulk_mock.call_count == 50
+
+    def test_drops_records_when_queue_is_full(self, bulk_mock):
+        sending = threading.Event()
+        unblock = threading.Event()
+
+        def blocking_bulk(client, actions, **kwargs):
+            sending.set()
+            unblock.wait()
+            return bulk_stats(client, actions)
+
+        bulk_mock.side_effect = blocking_bulk
+        handler = ElasticSearchHandler(batch_size=1, queue_size=1, index_name="test", host="https://localhost:9200")
+        handler.handle(make_record("sending"))
+        assert sending.wait(5) is True
+        handler.handle(make_record("queued"))
+        handler.handle(make_record("dropped"))
+        assert handler.stats() == {
+            "queued": 2,
+            "sent": 0,
+            "dropped": 1,
+            "retried": 0,
+            "spooled": 0,
+            "replayed": 0,
+            "errors": 0,
+            "pending": 1,
+        }
+        unblock.set()
+        handler.close()
+        assert handler.stats() == {
+            "queued": 2,
+            "sent": 2,
+            "dropped": 1,
+            "retried": 0,
+            "spooled": 0,
+            "replayed": 0,
+            "errors": 0,
+            "pending": 0,
+        }
+
+    def test_retries(self, bulk_mock):
+        bulk_mock.side_effect = iter([ConnectionError("Unavailable"), (1, 0)])
+        handler = ElasticSearchHandler(retry_delay_secs=0, index_name="test", host="https://localhost:9200")
+        handler.handle(make_record())
+        handler.close()
+        assert bulk_mock.call_count == 2
+        assert handler.stats() == {
+            "queued": 1,
+            "sent": 1,
+            "dropped": 0,
+            "retried": 1,
+            "spooled": 0,
+            "replayed": 0,
+            "errors": 0,
+            "pending": 0,
+        }
+
+    def test_drops_after_retries(self, bulk_mock):
+        bulk_mock.side_effect = ConnectionError("Unavailable")
+        handler = ElasticSearchHandler(
+            max_retries=2, retry_delay_secs=0, index_name="test", host="https://localhost:9200"
+        )
+        handler.handle(make_record())
+        handler.handle(make_record())
+        handler.close()
+        assert bulk_mock.call_count == 3
+        assert handler.stats() == {
+            "queued": 2,
+            "sent": 0,
+            "dropped": 2,
+            "retried": 4,
+            "spooled": 0,
+            "replayed": 0,
+            "errors": 0,
+            "pending": 0,
+        }
+
+    def test_close_drains_queue(self, bulk_mock):
+        handler = ElasticSearchHandler(batch_size=10, linger_secs=60, index_name="test", host="https://localhost:9200")
+        for _ in range(25):
+            handler.handle(make_record())
+        handler.close()
+        assert bulk_mock.call_count == 3
+        assert handler.stats()["sent"] == 25
+
+    def test_close_without_records(self, bulk_mock):
+        handler = ElasticSearchHandler(index_name="test", host="https://localhost:9200")
+        handler.close()
         bulk_mock.assert_not_called()
 
-        timer_internal_event = handler.timer.finished
-        # Wait for the timer thread to complete, and verify wait did not timeout.
-        assert timer_internal_event.wait(1) is True
-        bulk_mock.assert_called_once()
+
+class FakeElasticSearch(http.server.ThreadingHTTPServer):
+    """Bulk API of ElasticSearch, which can be made unavailable."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeElasticSearchRequestHandler)
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self.available = True
+        self.documents = []
+
+
+class FakeElasticSearchRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        if self.server.available:
+            # Lines alternate between the action and the document.
+            documents = body.decode().splitlines()[1::2]
+            self.server.documents.extend(documents)
+            status = 200
+            content = {"took": 1, "errors": False, "items": [{"index": {"status": 201}} for _ in documents]}
+        else:
+            status = 503
+            content = {"error": "unavailable", "status": 503}
+        response = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.end_headers()
+        self.wfile.write(response)
+
+    do_PUT = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(name="elasticsearch")
+def elasticsearch_fixture():
+    server = FakeElasticSearch()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def spooled_records(spool_dir):
+    records = []
+    for path in sorted(spool_dir.iterdir()):
+        records.extend(path.read_text().splitlines())
+    return records
+
+
+class TestElasticSearchSpool:
+    def test_spools_while_unavailable_and_replays(self, elasticsearch, tmp_path):
+        elasticsearch.available = False
+        handler = ElasticSearchHandler(
+            host=elasticsearch.url,
+            index_name="test",
+            linger_secs=0,
+            max_retries=0,
+            spool_dir=tmp_path,
+            replay_interval_secs=0.1,
+        )
+        handler.handle(make_record('{"n": 1}'))
+        wait_for(lambda: handler.stats()["spooled"] == 1)
+        handler.handle(make_record('{"n": 2}'))
+        wait_for(lambda: handler.stats()["spooled"] == 2)
+        assert spooled_records(tmp_path) == ['{"n": 1}', '{"n": 2}']
+
+        elasticsearch.available = True
+        wait_for(lambda: handler.stats()["replayed"] == 2)
+        assert elasticsearch.documents == ['{"n": 1}', '{"n": 2}']
+        assert list(tmp_path.iterdir()) == []
+
+        handler.handle(make_record('{"n": 3}'))
+        handler.close()
+        assert elasticsearch.documents == ['{"n": 1}', '{"n": 2}', '{"n": 3}']
+        assert handler.stats() == {
+            "queued": 3,
+            "sent": 1,
+            "dropped": 0,
+            "retried": 0,
+            "spooled": 2,
+            "replayed": 2,
+            "errors": 0,
+            "pending": 0,
+        }
+
+    def test_spools_without_trying_while_unavailable(self, elasticsearch, tmp_path):
+        elasticsearch.available = False
+        handler = ElasticSearchHandler(
+            host=elasticsearch.url,
+            index_name="test",
+            linger_secs=0,
+            max_retries=0,
+            spool_dir=tmp_path,
+            replay_interval_secs=60,
+        )
+        with mock.patch.object(handler, "_bulk", wraps=handler._bulk) as bulk_spy:
+            handler.handle(make_record('{"n": 1}'))
+            wait_for(lambda: handler.stats()["spooled"] == 1)
+            elasticsearch.available = True
+            handler.handle(make_record('{"n": 2}'))
+            handler.close()
+        # ElasticSearch is considered unavailable until the next replay.
+        assert bulk_spy.call_count == 1
+        assert elasticsearch.documents == []
+        assert spooled_records(tmp_path) == ['{"n": 1}', '{"n": 2}']
+
+    def test_evicts_oldest_records(self, tmp_path):
+        spool = Spool(tmp_path, max_bytes=30, segment_bytes=10)
+        spool.append(["record-1", "record-2"])
+        assert spool.evict() == 0
+        spool.append(["record-3"])
+        assert spool.evict() == 0
+        # The oldest segment makes room for the new records.
+        spool.append(["record-4"])
+        assert spool.evict() == 2
+        assert spooled_records(tmp_path) == ["record-3", "record-4"]
+
+    def test_does_not_evict_claimed_segments(self, tmp_path):
+        spool = Spool(tmp_path, max_bytes=30, segment_bytes=5)
+        spool.append(["record-1", "record-2"])
+        claimed_path = spool.claim()
+        spool.append(["record-3"])
+        spool.append(["record-4"])
+        # The segment being replayed is kept, the oldest unclaimed segment is evicted.
+        assert spool.evict() == 1
+        assert os.path.exists(claimed_path)
+        assert spooled_records(tmp_path) == ["record-1", "record-2", "record-4"]
+
+    def test_claims_other_process_segments_once_idle(self, tmp_path):
+        spool = Spool(tmp_path, max_bytes=1024, segment_bytes=1024)
+        other_process_segment = tmp_path / f"{time.time_ns():020d}-{os.getpid() + 1}.spool"
+        other_process_segment.write_text("record\n")
+        assert spool.claim() is None
+
+        idle = time.time() - Spool.IDLE_SECS - 1
+        os.utime(other_process_segment, (idle, idle))
+        claimed_path = spool.claim()
+        assert claimed_path == f"{other_process_segment}.replaying"
+        # Claimed segments are not claimed twice.
+        assert spool.claim() is None
+
+        spool.release(claimed_path)
+        assert other_process_segment.exists()
+
+    def test_claim_skips_vanished_segments(self, tmp_path):
+        spool = Spool(tmp_path, max_bytes=1024, segment_bytes=1024)
+        spool.append(["record"])
+        segments = spool._segments()
+        # Claimed by another process after listing the directory.
+        os.rename(segments[0].path, f"{segments[0].path}{Spool.CLAIMED_SUFFIX}")
+        with mock.patch.object(spool, "_segments", return_value=segments):
+            assert spool.claim() is None
+
+    def test_releases_segments_of_dead_replayers(self, tmp_path):
+        spool = Spool(tmp_path, max_bytes=1024, segment_bytes=1024)
+        spool.append(["record"])
+        claimed_path = spool.claim()
+        idle = time.time() - Spool.IDLE_SECS - 1
+        os.utime(claimed_path, (idle, idle))
+        assert spool.claim() is None
+        assert spool.claim() == claimed_path
@@ -1,9 +1,11 @@
 import datetime
 
+import pytest
+from django.db import IntegrityError
 from freezegun import freeze_time
 from pytest_django.asserts import assertQuerySetEqual
 
-from inclusion_connect.stats.helpers import account_action
+from inclusion_connect.stats.helpers import RecordedActions, account_action, record_action
 from inclusion_connect.stats.models import Actions, Stats
 from tests.oidc_overrides.factories import ApplicationFactory
 from tests.users.factories import UserFactory
@@ -37,3 +39,57 @@ def test_stats(mocker):
             (datetime.date(2023, 5, 1), user.pk, application_1.pk, "login"),
         ],
     )
+
+
+class TestRecordAction:
+    def test_unique(self):
+        user = UserFactory()
+        application = ApplicationFactory()
+        Stats.objects.create(user=user, application=application, date=datetime.date(2023, 4, 1), action="login")
+        with pytest.raises(IntegrityError):
+            Stats.objects.create(user=user, application=application, date=datetime.date(2023, 4, 1), action="login")
+
+    def test_ignores_recorded_action(self):
+        user = UserFactory()
+        application = ApplicationFactory()
+        # Recorded by another process.
+        Stats.objects.create(user=user, application=application, date=datetime.date(2023, 4, 1), action="login")
+        with freeze_time("2023-04-27 14:06"):
+            record_action(user.pk, application.pk, Actions.LOGIN)
+        assert Stats.objects.count() == 1
+
+    def test_skips_database_once_recorded(self, django_assert_num_queries, django_capture_on_commit_callbacks):
+        user = UserFactory()
+        application = ApplicationFactory()
+        with freeze_time("2023-04-27 14:06"):
+            with django_capture_on_commit_callbacks(execute=True):
+                with django_assert_num_queries(1):
+                    record_action(user.pk, application.pk, Actions.LOGIN)
+            with django_assert_num_queries(0):
+                record_action(user.pk, application.pk, Actions.LOGIN)
+            with django_assert_num_queries(1):
+                record_action(user.pk, application.pk, Actions.REGISTER)
+        with freeze_time("2023-05-01 00:08"):
+            with django_assert_num_queries(1):
+                record_action(user.pk, application.pk, Actions.LOGIN)
+
+    def test_not_remembered_before_commit(self, django_assert_num_queries):
+        user = UserFactory()
+        application = ApplicationFactory()
+        record_action(user.pk, application.pk, Actions.LOGIN)
+        # The transaction may still be rolled back.
+        with django_assert_num_queries(1):
+            record_action(user.pk, application.pk, Actions.LOGIN)
+
+
+@pytest.mark.no_django_db
+def test_recorded_actions_lru():
+    recorded = RecordedActions(maxsize=2)
+    recorded.add("a")
+    recorded.add("b")
+    assert "a" in recorded
+    recorded.add("c")
+    # "b" is the least recently used.
+    assert "b" not in recorded
+    assert "a" in recorded
+    assert "c" in recorded
@@ -8,8 +8,9 @@ from freezegun import freeze_time
 from pytest_django.asserts import assertContains, assertNotContains, assertQuerySetEqual, assertRedirects
 
 from inclusion_connect.oidc_federation.enums import Federation
-from inclusion_connect.users.models import EmailAddress, User
-from tests.helpers import assertRecords, parse_response_to_soup
+from inclusion_connect.users.models import EmailAddress, User, UserSession
+from tests.conftest import Client
+from tests.helpers import assertRecords, has_ongoing_sessions, parse_response_to_soup
 from tests.users.factories import UserFactory
 
 
@@ -203,6 +204,34 @@ class TestUserAdmin:
             ],
         )
 
+    def test_logout_everywhere(self, caplog, client):
+        admin_user = UserFactory(is_superuser=True, is_staff=True)
+        user = UserFactory()
+        other_user = UserFactory()
+        for _ in range(2):
+            Client().force_login(user)
+        Client().force_login(other_user)
+        client.force_login(admin_user)
+
+        response = client.post(
+            reverse("admin:users_user_changelist"),
+            {"action": "logout_everywhere", "_selected_action": [user.pk]},
+        )
+        assertRedirects(response, reverse("admin:users_user_changelist"))
+        assert has_ongoing_sessions(user) is False
+        assert has_ongoing_sessions(other_user) is True
+        assert UserSession.objects.filter(user=admin_user).exists()
+        assertRecords(
+            caplog,
+            [
+                (
+                    "inclusion_connect.auth",
+                    logging.INFO,
+                    {"event": "admin_logout", "acting_user": admin_user.pk, "user": user.pk},
+                )
+            ],
+        )
+
     @freeze_time("2023-05-12T14:42:03")
     def test_confirm_email(self, caplog, client):
         user = UserFactory(email="")
@@ -0,0 +1,207 @@
+import datetime
+
+import pytest
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from freezegun import freeze_time
+
+from inclusion_connect.users import cached_sessions
+from inclusion_connect.users.cached_sessions import (
+    NOTIFY_CHANNEL,
+    CachedSession,
+    SessionCache,
+    SessionStore,
+    session_cache,
+)
+from inclusion_connect.users.models import UserSession
+from inclusion_connect.users.sessions import delete_user_sessions
+from tests.helpers import wait_for
+from tests.users.factories import UserFactory
+
+
+@pytest.fixture
+def listening(monkeypatch):
+    # The cache is only read while listening to the other processes.
+    monkeypatch.setattr(session_cache, "_listening", True)
+
+
+@pytest.fixture
+def session_key():
+    session = SessionStore()
+    session["_auth_user_id"] = str(UserFactory().pk)
+    session.save()
+    return session.session_key
+
+
+def notify(payload):
+    """Simulate a change from another process."""
+    with connection.get_new_connection(connection.get_connection_params()) as other_process_connection:
+        other_process_connection.autocommit = True
+        other_process_connection.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, payload])
+
+
+def test_load_from_cache(listening, session_key, django_assert_num_queries):
+    with django_assert_num_queries(0):
+        session = SessionStore(session_key)
+        assert session["_auth_user_id"]
+    # The stores work on copies.
+    session["key"] = "value"
+    assert "key" not in SessionStore(session_key).load()
+
+
+def test_not_cached_when_not_listening(session_key, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        assert SessionStore(session_key)["_auth_user_id"]
+
+
+def test_update_increments_version(listening, session_key, django_assert_num_queries):
+    session = SessionStore(session_key)
+    session["key"] = "value"
+    with django_assert_num_queries(1):
+        session.save()
+    assert UserSession.objects.get().version == 2
+    with django_assert_num_queries(0):
+        assert SessionStore(session_key)["key"] == "value"
+
+
+def test_unchanged_session_write_skipped(listening, django_assert_num_queries):
+    with freeze_time("2023-05-05 14:00:00") as frozen_time:
+        session = SessionStore()
+        session["_auth_user_id"] = str(UserFactory().pk)
+        session.save()
+
+        frozen_time.tick(settings.SESSION_EXPIRY_WRITE_TOLERANCE_SECS - 1)
+        session = SessionStore(session.session_key)
+        session.modified = True
+        with django_assert_num_queries(0):
+            session.save()
+
+        frozen_time.tick()
+        session = SessionStore(session.session_key)
+        session.modified = True
+        with django_assert_num_queries(1):
+            session.save()
+        user_session = UserSession.objects.get()
+        assert user_session.version == 2
+        assert user_session.expire_date == datetime.datetime(2023, 5, 5, 14, 31, tzinfo=datetime.UTC)
+
+
+def test_concurrent_update_evicts(listening, session_key):
+    session = SessionStore(session_key)
+    assert session["_auth_user_id"]
+    # Updated by another process.
+    other_session = SessionStore(session_key)
+    other_session["other"] = "value"
+    other_session.save()
+    session["key"] = "value"
+    session.save()
+    assert UserSession.objects.get().version == 3
+    assert session_cache.get(session_key) is None
+    # The last write wins, like the database engine.
+    assert SessionStore(session_key).load().keys() == {"_auth_user_id", "key"}
+
+
+def test_delete_evicts(listening, session_key):
+    SessionStore(session_key).delete()
+    assert session_cache.get(session_key) is None
+    assert SessionStore(session_key).load() == {}
+
+
+def test_delete_user_sessions_evicts(listening, session_key):
+    delete_user_sessions([UserSession.objects.get().user])
+    assert session_cache.get(session_key) is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_expired_sessions_not_notified():
+    with freeze_time("2023-05-05 14:00:00"):
+        expired = SessionStore()
+        expired["_auth_user_id"] = str(UserFactory().pk)
+        expired.save()
+    session = SessionStore()
+    session["_auth_user_id"] = str(UserFactory().pk)
+    session.save()
+    with connection.get_new_connection(connection.get_connection_params()) as listen_connection:
+        listen_connection.autocommit = True
+        listen_connection.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        UserSession.objects.all().delete()
+        assert [notify.payload for notify in listen_connection.notifies(timeout=1)] == [session.session_key]
+
+
+def cached_session(version=1):
+    return CachedSession(version, timezone.now() + datetime.timedelta(minutes=1), {})
+
+
+def test_lru():
+    cache = SessionCache(maxsize=2)
+    cache._listening = True
+    for key in ["a", "b"]:
+        cache.set(key, cached_session(), cache.generation)
+    assert cache.get("a") is not None
+    cache.set("c", cached_session(), cache.generation)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_max_age(settings):
+    cache = SessionCache(maxsize=2)
+    cache._listening = True
+    with freeze_time("2023-05-05 14:00:00") as frozen_time:
+        cache.set("a", CachedSession(1, timezone.now() + datetime.timedelta(hours=1), {}), cache.generation)
+        frozen_time.tick(settings.SESSION_CACHE_MAX_AGE_SECS)
+        assert cache.get("a") is not None
+        # A lost notification is not served longer.
+        frozen_time.tick()
+        assert cache.get("a") is None
+
+
+def test_set_after_eviction_ignored():
+    cache = SessionCache(maxsize=2)
+    cache._listening = True
+    generation = cache.generation
+    # Notified while the session was read from the database.
+    cache.evict("a", 2)
+    cache.set("a", cached_session(), generation)
+    assert cache.get("a") is None
+
+
+def test_listen():
+    cache = SessionCache(maxsize=2)
+    cache.listen()
+    try:
+        wait_for(lambda: cache._listening)
+        cache.set("a", cached_session(version=2), cache.generation)
+        # The update was already cached by this process.
+        generation = cache.generation
+        notify("a:2")
+        wait_for(lambda: cache.generation > generation)
+        assert cache.get("a") is not None
+        notify("a:3")
+        wait_for(lambda: cache.get("a") is None)
+        # Deleted.
+        cache.set("a", cached_session(version=3), cache.generation)
+        notify("a")
+        wait_for(lambda: cache.get("a") is None)
+    finally:
+        cache.stop()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_listen_reconnects(monkeypatch):
+    monkeypatch.setattr(cached_sessions, "LISTEN_HEARTBEAT_SECS", 0.1)
+    monkeypatch.setattr(cached_sessions, "LISTEN_RETRY_DELAY_SECS", 0)
+    cache = SessionCache(maxsize=2)
+    cache.listen()
+    try:
+        wait_for(lambda: cache._listening)
+        listen_connection = cache._listen_connection
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [listen_connection.info.backend_pid])
+        wait_for(lambda: cache._listen_connection is not listen_connection and cache._listening)
+        cache.set("a", cached_session(version=1), cache.generation)
+        notify("a:2")
+        wait_for(lambda: cache.get("a") is None)
+    finally:
+        cache.stop()
@@ -0,0 +1,123 @@
+import datetime
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from freezegun import freeze_time
+
+from inclusion_connect.users.last_logins import LastLoginBuffer, upsert_last_logins
+from inclusion_connect.users.models import UserApplicationLink
+from tests.oidc_overrides.factories import ApplicationFactory
+from tests.users.factories import UserFactory
+
+
+def last_logins():
+    return list(
+        UserApplicationLink.objects.values_list("user_id", "application_id", "last_login").order_by(
+            "user_id", "application_id"
+        )
+    )
+
+
+def test_upsert_last_logins_coalesces_recent_logins(settings):
+    settings.USER_APPLICATION_LINK_COALESCE_SECS = 60
+    application = ApplicationFactory()
+    user = UserFactory()
+    dt_1 = datetime.datetime(2023, 4, 27, 14, 6, tzinfo=datetime.UTC)
+
+    upsert_last_logins([(user.pk, application.pk, dt_1)])
+    assert last_logins() == [(user.pk, application.pk, dt_1)]
+
+    upsert_last_logins([(user.pk, application.pk, dt_1 + datetime.timedelta(seconds=59))])
+    assert last_logins() == [(user.pk, application.pk, dt_1)]
+
+    dt_2 = dt_1 + datetime.timedelta(seconds=61)
+    upsert_last_logins([(user.pk, application.pk, dt_2)])
+    assert last_logins() == [(user.pk, application.pk, dt_2)]
+
+    # Older logins never overwrite recent ones.
+    upsert_last_logins([(user.pk, application.pk, dt_1)])
+    assert last_logins() == [(user.pk, application.pk, dt_2)]
+
+
+def test_upsert_last_logins_single_query():
+    application_1, application_2 = ApplicationFactory.create_batch(2)
+    user_1, user_2 = UserFactory.create_batch(2)
+    now = timezone.now()
+    UserApplicationLink.objects.create(user=user_1, application=application_1, last_login=now)
+
+    with CaptureQueriesContext(connection) as ctx:
+        upsert_last_logins(
+            [
+                (user_1.pk, application_1.pk, now),
+                (user_1.pk, application_2.pk, now),
+                (user_2.pk, application_1.pk, now),
+            ]
+        )
+    assert len(ctx.captured_queries) == 1
+    assert last_logins() == sorted(
+        [
+            (user_1.pk, application_1.pk, now),
+            (user_1.pk, application_2.pk, now),
+            (user_2.pk, application_1.pk, now),
+        ]
+    )
+
+
+def test_upsert_last_logins_skips_deleted_users_and_applications():
+    application_1, application_2 = ApplicationFactory.create_batch(2)
+    user_1, user_2 = UserFactory.create_batch(2)
+    now = timezone.now()
+    user_2_pk = user_2.pk
+    application_2_pk = application_2.pk
+    user_2.delete()
+    application_2.delete()
+
+    upsert_last_logins(
+        [
+            (user_1.pk, application_1.pk, now),
+            (user_2_pk, application_1.pk, now),
+            (user_1.pk, application_2_pk, now),
+        ]
+    )
+    assert last_logins() == [(user_1.pk, application_1.pk, now)]
+
+
+def test_buffer_writes_directly_until_started():
+    application = ApplicationFactory()
+    user = UserFactory()
+    buffer = LastLoginBuffer()
+    now = timezone.now()
+
+    buffer.add(user.pk, application.pk, now)
+    assert last_logins() == [(user.pk, application.pk, now)]
+
+
+@pytest.mark.parametrize("committed", [True, False])
+def test_buffer_flush(django_capture_on_commit_callbacks, settings, committed):
+    settings.USER_APPLICATION_LINK_FLUSH_SECS = 3600
+    application_1, application_2 = ApplicationFactory.create_batch(2)
+    user = UserFactory()
+    buffer = LastLoginBuffer()
+    buffer.start()
+    try:
+        with django_capture_on_commit_callbacks(execute=committed):
+            with freeze_time("2023-04-27 14:06"):
+                buffer.add(user.pk, application_1.pk, timezone.now())
+            with freeze_time("2023-04-27 14:08"):
+                dt = timezone.now()
+                buffer.add(user.pk, application_1.pk, dt)
+                buffer.add(user.pk, application_2.pk, dt)
+        assert last_logins() == []
+
+        with CaptureQueriesContext(connection) as ctx:
+            buffer.flush()
+    finally:
+        buffer.stop()
+    if committed:
+        assert len(ctx.captured_queries) == 1
+        assert last_logins() == [(user.pk, application_1.pk, dt), (user.pk, application_2.pk, dt)]
+    else:
+        assert len(ctx.captured_queries) == 0
+        assert last_logins() == []
@@ -0,0 +1,101 @@
+import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from freezegun import freeze_time
+from pytest_django.asserts import assertQuerySetEqual
+
+from inclusion_connect.users.cached_sessions import session_cache
+from inclusion_connect.users.models import UserSession
+from inclusion_connect.users.sessions import delete_user_sessions, is_signed
+from tests.conftest import Client
+from tests.users.factories import DEFAULT_PASSWORD, UserFactory
+
+
+def test_session_tracks_user(client):
+    user = UserFactory()
+    client.force_login(user)
+    session = UserSession.objects.get()
+    assert session.user == user
+    assert session.session_key == client.session.session_key
+
+    client.logout()
+    assert UserSession.objects.exists() is False
+
+
+def test_login_cycles_session_key(client):
+    user = UserFactory()
+    client.get(reverse("accounts:login"))
+    # The anonymous session, holding the CSRF secret, is signed in the cookie.
+    anonymous_session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+    assert is_signed(anonymous_session_key)
+    assert UserSession.objects.exists() is False
+
+    response = client.post(reverse("accounts:login"), data={"email": user.email, "password": DEFAULT_PASSWORD})
+    assert response.status_code == 302
+    assert get_user(client).is_authenticated is True
+    session = UserSession.objects.get()
+    assert session.session_key == client.cookies[settings.SESSION_COOKIE_NAME].value
+    assert session.user == user
+
+    client.logout()
+    assert UserSession.objects.exists() is False
+
+
+def test_clearsessions():
+    user = UserFactory()
+    with freeze_time("2023-05-05 14:29:20"):
+        Client().force_login(user)
+    with freeze_time("2023-05-05 14:59:19"):
+        Client().force_login(user)
+        call_command("clearsessions")
+        assert UserSession.objects.filter(user=user).count() == 2
+    with freeze_time("2023-05-05 14:59:21"):
+        call_command("clearsessions")
+        [session] = UserSession.objects.filter(user=user)
+        assert session.expire_date == datetime.datetime(2023, 5, 5, 15, 29, 19, tzinfo=datetime.timezone.utc)
+
+
+def test_delete_user_sessions(django_assert_num_queries):
+    user = UserFactory()
+    other_user = UserFactory()
+    for _ in range(3):
+        Client().force_login(user)
+    Client().force_login(other_user)
+
+    # The session keys, then the sessions.
+    with django_assert_num_queries(2):
+        delete_user_sessions([user])
+    assertQuerySetEqual(UserSession.objects.values_list("user", flat=True), [other_user.pk])
+
+
+def test_tampered_anonymous_session(client):
+    session = client.session
+    session["next_url"] = "/accounts/my-account/"
+    session.save()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key[::-1]
+    assert dict(client.session) == {}
+
+
+def test_large_anonymous_session_is_stored_in_database(client):
+    session = client.session
+    session["next_url"] = get_random_string(5_000)
+    session.save()
+    assert is_signed(session.session_key) is False
+    [anonymous_session] = UserSession.objects.all()
+    assert anonymous_session.user is None
+    assert client.session["next_url"] == session["next_url"]
+
+
+def test_session_rows_created(client):
+    rows_created = session_cache.stats()["rows_created"]
+    user = UserFactory()
+    client.get(reverse("accounts:login"))
+    # Anonymous sessions are signed cookies.
+    assert session_cache.stats()["rows_created"] == rows_created
+    client.post(reverse("accounts:login"), data={"email": user.email, "password": DEFAULT_PASSWORD})
+    client.get(reverse("accounts:edit_user_info"))
+    assert session_cache.stats()["rows_created"] == rows_created + 1
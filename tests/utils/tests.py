@@ -1,8 +1,21 @@
+import gc
+import logging
+import weakref
+
 import pytest
 from django.core.exceptions import ValidationError
+from django.test import RequestFactory
+from django.urls import reverse
 
+from inclusion_connect.oidc_overrides.keys import key_ring
+from inclusion_connect.oidc_overrides.registry import applications
+from inclusion_connect.utils import metrics
+from inclusion_connect.utils.lightweight import is_lightweight
 from inclusion_connect.utils.password_validation import CnilCompositionPasswordValidator
+from inclusion_connect.utils.request_cache import REQUEST_CACHE_ATTR, clear_request_cache, request_cached
 from inclusion_connect.utils.urls import add_url_params, get_url_params
+from tests.oidc_overrides.factories import ApplicationFactory
+from tests.users.factories import UserFactory
 
 
 def test_add_url_params():
@@ -67,3 +80,114 @@ class TestCnilCompositionPasswordValidator:
             with pytest.raises(ValidationError) as excinfo:
                 validator.validate(pw)
                 assert excinfo.args == [expected]
+
+
+class TestRequestCached:
+    def test_memoized_per_request(self):
+        calls = []
+
+        @request_cached
+        def derived(request, value=None):
+            calls.append(value)
+            return object()
+
+        request = RequestFactory().get("/")
+        assert derived(request) is derived(request)
+        assert derived(request, value="a") is derived(request, value="a")
+        assert derived(request, value="a") is not derived(request)
+        assert calls == [None, "a"]
+        other_request = RequestFactory().get("/")
+        assert derived(other_request) is not derived(request)
+        assert calls == [None, "a", None]
+        clear_request_cache(request)
+        derived(request)
+        assert calls == [None, "a", None, None]
+
+    def test_request_is_released(self):
+        @request_cached
+        def derived(request):
+            return request.path
+
+        request = RequestFactory().get("/")
+        ref = weakref.ref(request)
+        assert derived(request) == "/"
+        del request
+        gc.collect()
+        assert ref() is None
+
+    def test_cleared_at_response_time(self, client):
+        client.force_login(UserFactory())
+        response = client.post(reverse("accounts:accept_terms"))
+        assert response.status_code == 302
+        assert not hasattr(response.wsgi_request, REQUEST_CACHE_ATTR)
+
+
+class TestLightweight:
+    @pytest.mark.parametrize(
+        "path,expected",
+        [
+            ("/", True),
+            ("/auth/.well-known/openid-configuration/", True),
+            ("/auth/.well-known/jwks.json", True),
+            ("/auth/userinfo/", True),
+            ("/realms/local/.well-known/openid-configuration/", True),
+            ("/realms/local/protocol/openid-connect/userinfo", True),
+            ("/auth/authorize/", False),
+            ("/accounts/login/", False),
+            ("/unknown/", False),
+        ],
+    )
+    def test_is_lightweight(self, path, expected):
+        assert is_lightweight(RequestFactory().get(path)) is expected
+
+    def test_skips_session_and_account_middlewares(self, client, django_assert_num_queries):
+        client.force_login(UserFactory(is_staff=True, terms_accepted_at=None))
+        # No transaction, session nor user.
+        with django_assert_num_queries(0):
+            response = client.get(reverse("homepage"))
+        assert response.status_code == 200
+        assert "Cache-Control" not in response
+
+        response = client.get(reverse("accounts:edit_user_info"))
+        assert response.status_code == 403
+
+    def test_keycloak_compat_log(self, caplog, client, django_assert_num_queries):
+        client.force_login(UserFactory())
+        key_ring.keys()
+        with django_assert_num_queries(0):
+            response = client.get("/realms/local/.well-known/openid-configuration/?client_id=my_application")
+        assert response.status_code == 200
+        assert caplog.record_tuples == [
+            (
+                "keycloak_compat",
+                logging.WARNING,
+                str(
+                    {
+                        "ip_address": "127.0.0.1",
+                        "application": "my_application",
+                        "url": "/realms/local/.well-known/openid-configuration/",
+                    }
+                ),
+            )
+        ]
+
+
+def test_process_metrics(caplog, client, mocker):
+    mocker.patch.object(metrics, "METRICS_REQUESTS", 2)
+    application = ApplicationFactory()
+    # The counters are never reset.
+    misses = applications.stats()["misses"]
+    client.get(reverse("homepage"))
+    assert [record for record in caplog.records if record.name == "inclusion_connect.metrics"] == []
+    client.get(add_url_params(reverse("oauth2_provider:authorize"), {"client_id": application.client_id}))
+    [record] = [record for record in caplog.records if record.name == "inclusion_connect.metrics"]
+    assert record.msg["event"] == "process_metrics"
+    assert record.msg["applications"]["misses"] == misses + 1
+    assert record.msg["applications"]["size"] == 1
+    assert record.msg.keys() == {
+        "event",
+        "applications",
+        "sessions",
+        "federation_jwks",
+        "federation_http",
+    }